@@ -0,0 +1,133 @@
+"""Serialization for Warbler's JSON API (the /api/v1 routes in app.py).
+
+Responses are pages of messages or users:
+
+    {"next_cursor": "...", "next": "/api/v1/...?before=...", "data": [...]}
+
+`?before=` takes a page's `next_cursor`, `?limit=` sets the page size (up to
+API_MAX_LIMIT) and `?fields=id,text,user` picks which fields each item has.
+The body is streamed one item at a time rather than built as a whole
+document first.
+"""
+
+import json
+
+from flask import Response, request, stream_with_context, url_for
+
+from likes import liked_among
+from pagination import PAGE_SIZE
+
+API_MAX_LIMIT = 100
+
+
+class APIError(Exception):
+    """An API request we can't serve; becomes a JSON error response."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _author(msg, context):
+    user = msg.user
+    return {'id': user.id, 'username': user.username,
+            'image_url': user.image_url}
+
+
+MESSAGE_FIELDS = {
+    'id': lambda msg, context: msg.id,
+    'text': lambda msg, context: msg.text,
+    'timestamp': lambda msg, context: msg.timestamp.isoformat(),
+    'user_id': lambda msg, context: msg.user_id,
+    'likes_count': lambda msg, context: msg.likes_count,
+    'user': _author,
+    'liked': lambda msg, context: msg.id in context['liked'],
+}
+
+DEFAULT_MESSAGE_FIELDS = ['id', 'text', 'timestamp', 'user', 'likes_count',
+                          'liked']
+
+USER_FIELDS = {
+    'id': lambda user, context: user.id,
+    'username': lambda user, context: user.username,
+    'image_url': lambda user, context: user.image_url,
+    'header_image_url': lambda user, context: user.header_image_url,
+    'bio': lambda user, context: user.bio,
+    'location': lambda user, context: user.location,
+    'messages_count': lambda user, context: user.messages_count,
+    'followers_count': lambda user, context: user.followers_count,
+    'following_count': lambda user, context: user.following_count,
+    'likes_count': lambda user, context: user.likes_count,
+    'followed': lambda user, context: user.id in context['followed'],
+}
+
+DEFAULT_USER_FIELDS = ['id', 'username', 'image_url', 'bio',
+                       'followers_count', 'following_count', 'followed']
+
+
+def api_limit():
+    """Page size asked for with ?limit=, capped at API_MAX_LIMIT."""
+
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise APIError("limit must be a number")
+
+    return max(1, min(limit, API_MAX_LIMIT))
+
+
+def requested_fields(available, default):
+    """Fields asked for with ?fields=, or `default`."""
+
+    if 'fields' not in request.args:
+        return default
+
+    fields = [field for field in request.args['fields'].split(',') if field]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise APIError(f"unknown fields: {', '.join(unknown)}")
+
+    return fields
+
+
+def stream_messages(page, viewer):
+    """Stream a page of messages, with whether `viewer` liked each one."""
+
+    fields = requested_fields(MESSAGE_FIELDS, DEFAULT_MESSAGE_FIELDS)
+    context = {'liked': set()}
+    if 'liked' in fields:
+        context['liked'] = liked_among(viewer.id, [m.id for m in page.items])
+
+    return _stream(page, MESSAGE_FIELDS, fields, context)
+
+
+def stream_users(page, viewer):
+    """Stream a page of users, with whether `viewer` follows each one."""
+
+    fields = requested_fields(USER_FIELDS, DEFAULT_USER_FIELDS)
+    context = {'followed': viewer.following_among([u.id for u in page.items])}
+
+    return _stream(page, USER_FIELDS, fields, context)
+
+
+def _stream(page, serializers, fields, context):
+    next_url = None
+    if page.next_cursor:
+        # the view's own arguments win over query parameters of the same name
+        args = {**request.args.to_dict(), 'before': page.next_cursor,
+                **request.view_args}
+        next_url = url_for(request.endpoint, **args)
+
+    def generate():
+        yield (f'{{"next_cursor": {json.dumps(page.next_cursor)}, '
+               f'"next": {json.dumps(next_url)}, "data": [')
+
+        for i, item in enumerate(page.items):
+            row = {field: serializers[field](item, context) for field in fields}
+            yield (',' if i else '') + json.dumps(row)
+
+        yield ']}'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
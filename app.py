@@ -1,14 +1,41 @@
 import os
 
-from flask import Flask, render_template, request, flash, redirect, session, g
+import click
+from flask import (Flask, render_template, request, flash, redirect, session, g,
+                   jsonify, abort)
 # from flask_debugtoolbar import DebugToolbarExtension
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from forms import UserAddForm, LoginForm, MessageForm, ProfileUpdateForm
-from models import db, connect_db, User, Message, Likes
+from api import APIError, api_limit, stream_messages, stream_users
+from caching import init_caching, not_modified, message_author
+from database import REPLICA_BIND, replica_reads, route_timeouts
+from follow_graph import follow_graph, init_follow_graph
+from fragments import init_fragments, expire_user_cards, expire_message_card
+from hashing import init_hashing, hashing_pool, HashingPoolSaturated
+from profiling import init_profiling, recent_profiles
+from purge import soft_delete_user
+from identity import load_identity, invalidate
+from jobs import BATCH_SIZE, enqueue, work
+from likes import toggle_like, liked_among
+from message_search import search_args, search_messages, reindex_messages
+from models import db, connect_db, User, Message, Follows
+from counters import (adjust_user_counts, adjust_message_likes,
+                      release_message_counts, reconcile_counters)
+from recommendations import (REFRESH_BATCH_SIZE, drop_suggestion,
+                             suggestions_for, refresh_suggestions)
+from queries import (user_stats, user_messages, liked_messages,
+                     user_directory, user_followers, user_following,
+                     get_user, get_message)
+from timelines import home_timeline, rebuild_timelines, update_celebrity
+from trending import (init_trending, record_hashtags, record_like,
+                      trending_hashtags, trending_messages)
 
 CURR_USER_KEY = "curr_user"
 
+# suggestions in the homepage's "who to follow" box
+SUGGESTIONS_SHOWN = 3
+
 app = Flask(__name__)
 
 # Get DB_URI from environ variable (useful for production/testing) or,
@@ -20,9 +47,55 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+
+# connection pool, and how long (ms) a statement may run, overall and for
+# particular endpoints, e.g. "list_users=2000,homepage=2000" (see database.py)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(
+    os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+app.config['DB_ROUTE_TIMEOUTS_MS'] = route_timeouts(
+    os.environ.get('DB_ROUTE_TIMEOUTS_MS', ''))
+# optional read replica for the read-only pages, and how long after writing
+# a user's reads stay on the primary
+if os.environ.get('DATABASE_REPLICA_URL'):
+    app.config['SQLALCHEMY_BINDS'] = {
+        REPLICA_BIND: os.environ['DATABASE_REPLICA_URL']}
+app.config['REPLICA_LAG_SECONDS'] = int(
+    os.environ.get('REPLICA_LAG_SECONDS', 5))
+# run follow-up jobs inline instead of leaving them to `flask run-jobs`
+# (see jobs.py)
+app.config['JOBS_EAGER'] = os.environ.get('JOBS_EAGER', '0') == '1'
+# follow lists written by `flask snapshot-follow-graph`, loaded before the
+# first request (see follow_graph.py)
+app.config['FOLLOW_GRAPH_SNAPSHOT'] = os.environ.get('FOLLOW_GRAPH_SNAPSHOT')
+# authors with this many followers aren't fanned out to their followers'
+# timelines; their messages are merged in when timelines are read (see
+# timelines.py)
+app.config['CELEBRITY_FOLLOWERS'] = int(
+    os.environ.get('CELEBRITY_FOLLOWERS', 10000))
+
+# bcrypt cost, and how many hashes may run / wait at once (see hashing.py)
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['HASH_WORKERS'] = int(os.environ.get('HASH_WORKERS', 2))
+app.config['HASH_QUEUE_SIZE'] = int(os.environ.get('HASH_QUEUE_SIZE', 16))
+app.config['HASH_RETRY_AFTER'] = 5
+# share of requests whose profile is logged, and the time (ms) past which
+# every request is logged (see profiling.py)
+app.config['PROFILE_SAMPLE_RATE'] = float(
+    os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 500))
 # toolbar = DebugToolbarExtension(app)
 
 connect_db(app)
+init_hashing(app)
+init_profiling(app)
+init_caching(app)
+init_fragments(app)
+init_follow_graph(app)
+init_trending(app)
 
 
 ##############################################################################
@@ -31,15 +104,31 @@ connect_db(app)
 
 @app.before_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    This is a cached snapshot of the user (see identity.py), so it usually
+    costs no queries.
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = load_identity(session[CURR_USER_KEY])
 
     else:
         g.user = None
 
 
+def viewer_stamp():
+    """Version stamp of the logged-in user, for page ETags.
+
+    Their version goes up when they follow, like or post, and when they
+    edit their profile, which covers everything about them a page shows.
+    """
+
+    if not g.user:
+        return None
+    return (g.user.id, g.user.version)
+
+
 def do_login(user):
     """Log in user."""
 
@@ -100,6 +189,8 @@ def login():
                                  form.password.data)
 
         if user:
+            # authenticate may have upgraded the password hash
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -109,6 +200,43 @@ def login():
     return render_template('users/login.html', form=form)
 
 
+@app.errorhandler(HashingPoolSaturated)
+def hashing_saturated(error):
+    """Turn away logins/signups while the hashing pool is full."""
+
+    retry_after = app.config['HASH_RETRY_AFTER']
+    return ("Too many people are signing in right now. "
+            f"Please try again in {retry_after} seconds.",
+            503,
+            {"Retry-After": str(retry_after)})
+
+
+@app.route('/_metrics/hashing')
+def hashing_metrics():
+    """Queue depth and latency figures for the hashing pool.
+
+    Only available outside production.
+    """
+
+    if app.env == 'production':
+        abort(404)
+
+    return jsonify(hashing_pool.stats())
+
+
+@app.route('/_debug/profile')
+def debug_profile():
+    """Profiles of the most recent requests, newest first.
+
+    Only available outside production.
+    """
+
+    if app.env == 'production':
+        abort(404)
+
+    return jsonify(list(reversed(recent_profiles)))
+
+
 @app.route('/logout')
 def logout():
     """Handle logout of user."""
@@ -121,41 +249,55 @@ def logout():
 # General user routes:
 
 @app.route('/users')
+@replica_reads
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by that username, and a
+    'before' param with the cursor of the page to show.
     """
 
     search = request.args.get('q')
+    page = user_directory(search, before=request.args.get('before'))
 
-    if not search:
-        users = User.query.all()
-    else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+    # the listing itself is one cheap query; a 304 saves rendering it
+    cached = not_modified(viewer_stamp(),
+                          [(u.id, u.version) for u in page.items])
+    if cached:
+        return cached
 
-    return render_template('users/index.html', users=users)
+    # which of the listed users we follow, asked about all at once
+    followed = (g.user.following_among([u.id for u in page.items])
+                if g.user else set())
+
+    return render_template('users/index.html', users=page.items,
+                           next_cursor=page.next_cursor, followed=followed)
 
 
 @app.route('/users/<int:user_id>')
+@replica_reads
 def users_show(user_id):
     """Show user profile."""
-   
+
+    shown = load_identity(user_id)
+    if shown:
+        cached = not_modified(viewer_stamp(), shown.version)
+        if cached:
+            return cached
+
     user = User.query.get(user_id)
-    if user is None:
+    if user is None or user.deleted_at is not None:
         return redirect('/')
 
     # snagging messages in order from the database;
     # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
+    page = user_messages(user_id, before=request.args.get('before'))
 
-    likes = Likes.query.filter_by(user_id=user_id).all()
-    return render_template('users/show.html', user=user, messages=messages, likes=likes)
+    # which of these the viewer has liked, for the like buttons
+    likes = liked_among(g.user and g.user.id, [m.id for m in page.items])
+    return render_template('users/show.html', user=user, messages=page.items,
+                           next_cursor=page.next_cursor, likes=likes,
+                           stats=user_stats(user))
 
 
 @app.route('/users/<int:user_id>/following')
@@ -166,8 +308,15 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    user = get_user(user_id)
+    if user is None:
+        abort(404)
+
+    page = user_following(user.id, before=request.args.get('before'))
+    followed = g.user.following_among([u.id for u in page.items])
+    return render_template('users/following.html', user=user,
+                           users=page.items, next_cursor=page.next_cursor,
+                           followed=followed, stats=user_stats(user))
 
 
 @app.route('/users/<int:user_id>/followers')
@@ -178,8 +327,32 @@ def users_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    user = get_user(user_id)
+    if user is None:
+        abort(404)
+
+    page = user_followers(user.id, before=request.args.get('before'))
+    followed = g.user.following_among([u.id for u in page.items])
+    return render_template('users/followers.html', user=user,
+                           users=page.items, next_cursor=page.next_cursor,
+                           followed=followed, stats=user_stats(user))
+
+
+@app.route('/users/suggestions')
+@replica_reads
+def show_suggestions():
+    """Show people the logged-in user might follow (see recommendations.py)."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    suggestions = suggestions_for(g.user.id)
+    return render_template('users/suggestions.html', user=g.user.model,
+                           users=[user for user, _ in suggestions],
+                           mutuals=dict((user.id, count)
+                                        for user, count in suggestions),
+                           stats=user_stats(g.user))
 
 
 @app.route('/users/follow/<int:follow_id>', methods=['POST'])
@@ -191,8 +364,31 @@ def add_follow(follow_id):
         return redirect("/")
 
     followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    if followed_user.deleted_at is not None:
+        abort(404)
+
+    # a row of its own rather than through g.user.following, which would
+    # load every user they follow; a double-submitted form changes nothing
+    if Follows.query.get((followed_user.id, g.user.id)) is not None:
+        return redirect(f"/users/{g.user.id}/following")
+    try:
+        with db.session.begin_nested():
+            db.session.add(Follows(user_following_id=g.user.id,
+                                   user_being_followed_id=followed_user.id))
+    except IntegrityError:
+        # a concurrent submit of the same form got there first
+        return redirect(f"/users/{g.user.id}/following")
+
+    adjust_user_counts(g.user.id, following=1)
+    adjust_user_counts(followed_user.id, followers=1)
+    update_celebrity(followed_user.id)
+    drop_suggestion(g.user.id, followed_user.id)
+    enqueue('backfill_follow', follower_id=g.user.id,
+            followed_id=followed_user.id)
+    enqueue('refresh_suggestions', user_id=g.user.id)
     db.session.commit()
+    invalidate(g.user.id, followed_user.id)
+    follow_graph.add_follow(g.user.id, followed_user.id)
 
     return redirect(f"/users/{g.user.id}/following")
 
@@ -205,9 +401,23 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    removed = (Follows
+               .query
+               .filter(Follows.user_following_id == g.user.id,
+                       Follows.user_being_followed_id == follow_id)
+               .delete(synchronize_session=False))
+    if not removed:
+        return redirect(f"/users/{g.user.id}/following")
+
+    adjust_user_counts(g.user.id, following=-1)
+    adjust_user_counts(follow_id, followers=-1)
+    if update_celebrity(follow_id) is False:
+        enqueue('push_author', author_id=follow_id)
+    enqueue('prune_follow', follower_id=g.user.id, followed_id=follow_id)
+    enqueue('refresh_suggestions', user_id=g.user.id)
     db.session.commit()
+    invalidate(g.user.id, follow_id)
+    follow_graph.remove_follow(g.user.id, follow_id)
 
     return redirect(f"/users/{g.user.id}/following")
 
@@ -227,9 +437,12 @@ def profile(user_id):
         user.header_image_url = form.header_image_url.data
         user.image_url = form.image_url.data
         user.bio = form.bio.data
+        user.version = User.version + 1
 
         db.session.add(user)
         db.session.commit()
+        invalidate(user.id)
+        expire_user_cards(user.id)
         return redirect(f'/users/{user.id}')
 
     form.username.data = user.username
@@ -250,8 +463,12 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    # hidden from now on; the rows go in the background (see purge.py)
+    soft_delete_user(g.user.id)
+    enqueue('purge_user', user_id=g.user.id)
     db.session.commit()
+    invalidate(g.user.id, *g.user.following_ids)
+    expire_user_cards(g.user.id)
 
     return redirect("/signup")
 
@@ -275,21 +492,57 @@ def messages_add():
         time = datetime.now().astimezone()
         msg = Message(text=form.text.data, timestamp=time)
         g.user.messages.append(msg)
+        db.session.flush()
+        adjust_user_counts(g.user.id, messages=1)
+        enqueue('fan_out_message', message_id=msg.id)
         db.session.commit()
+        invalidate(g.user.id)
+        record_hashtags(form.text.data)
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
+@app.route('/messages/search')
+@replica_reads
+def messages_search():
+    """Search messages by text: ?q=, narrowed by ?user=, ?since=, ?until=."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    try:
+        kwargs = search_args(request.args)
+    except ValueError:
+        flash("Those search filters don't look right.", "danger")
+        kwargs = {}
+
+    page = search_messages(request.args.get('q'),
+                           before=request.args.get('before'), **kwargs)
+    likes = liked_among(g.user.id, [m.id for m in page.items])
+    return render_template('messages/search.html', messages=page.items,
+                           next_cursor=page.next_cursor, likes=likes)
+
+
 @app.route('/messages/<int:message_id>', methods=["GET"])
+@replica_reads
 def messages_show(message_id):
     """Show a message."""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msg = Message.query.get(message_id)
+    # deleting a message bumps its author's version
+    author_id = message_author(message_id)
+    author = author_id and load_identity(author_id)
+    if author:
+        cached = not_modified(viewer_stamp(), author.version)
+        if cached:
+            return cached
+
+    msg = get_message(message_id)
     if msg is None:
         return redirect('/')
     return render_template('messages/show.html', message=msg)
@@ -304,8 +557,12 @@ def messages_destroy(message_id):
         return redirect("/")
 
     msg = Message.query.get(message_id)
+    adjust_user_counts(msg.user_id, messages=-1)
+    release_message_counts(msg.id)
     db.session.delete(msg)
     db.session.commit()
+    invalidate(msg.user_id)
+    expire_message_card(msg.id, msg.user_id)
 
     return redirect(f"/users/{g.user.id}")
 
@@ -315,26 +572,27 @@ def messages_destroy(message_id):
 
 
 @app.route('/')
+@replica_reads
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: most recent messages of followed_users, a page at a time,
+      read from the user's precomputed timeline (see timelines.py), next to
+      suggestions and what's trending (see trending.py)
     """
 
     if g.user:
-        user = User.query.get_or_404(g.user.id)
-
-        followed = [u.id for u in user.following]
-        
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(followed))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        page = home_timeline(g.user.id, before=request.args.get('before'))
+        likes = liked_among(g.user.id, [m.id for m in page.items])
 
-        return render_template('home.html', messages=messages)
+        return render_template('home.html', messages=page.items,
+                               next_cursor=page.next_cursor, likes=likes,
+                               stats=user_stats(g.user),
+                               suggestions=suggestions_for(g.user.id,
+                                                           SUGGESTIONS_SHOWN),
+                               trending=trending_messages(),
+                               hashtags=trending_hashtags())
 
     else:
         return render_template('home-anon.html')
@@ -345,64 +603,201 @@ def homepage():
 
 @app.route('/users/add_like/<int:message_id>', methods=['POST'])
 def like_mssg(message_id):
-    """Add like to Likes table"""
+    """Like a message, or unlike it if it's already liked."""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    
-    like = Likes.query.filter_by(message_id=message_id, user_id=g.user.id).first()    
 
-    ##check if like is own post
-    mssg = Message.query.get_or_404(message_id)
-    if g.user.id == mssg.user.id:
-        flash('Sorry - you can\'t like your own post :(', "danger")
+    delta = toggle_like(g.user.id, message_id)
+
+    if delta == 0:
+        ##check if like is own post
+        mssg = Message.query.get_or_404(message_id)
+        if g.user.id == mssg.user_id:
+            flash('Sorry - you can\'t like your own post :(', "danger")
         return redirect(f'/users/{g.user.id}/likes')
 
-    if like is None:
-        like = Likes(user_id=g.user.id, message_id=message_id)
-        db.session.add(like)
-        db.session.commit()
-    else :
-        del_like = Likes.query.filter_by(message_id=like.message_id).first()
-        db.session.delete(del_like)
-        db.session.commit()
+    adjust_user_counts(g.user.id, likes=delta)
+    adjust_message_likes(message_id, delta)
+    db.session.commit()
+    invalidate(g.user.id)
+    if delta > 0:
+        record_like(message_id)
 
     return redirect(f'/users/{g.user.id}/likes')
 
 
 @app.route('/users/<int:user_id>/likes')
+@replica_reads
 def user_likes(user_id):
      if g.user:
         
-        user = User.query.get_or_404(user_id)
-        
-        likes = Likes.query.filter_by(user_id=user.id).all()
-        
-        likes = [u.message_id for u in likes]
-        
-        
-        messages = (Message
-                    .query
-                    .filter(Message.id.in_(likes))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        user = get_user(user_id)
+        if user is None:
+            abort(404)
+
+        page = liked_messages(user.id, before=request.args.get('before'))
+        likes = liked_among(g.user.id, [m.id for m in page.items])
+
+        return render_template('users/show.html', messages=page.items, user=user,
+                               next_cursor=page.next_cursor, likes=likes,
+                               stats=user_stats(user))
+
+##############################################################################
+# JSON API (see api.py for paging, fields and the response format)
+
+
+@app.errorhandler(APIError)
+def api_error(error):
+    """Report API errors as JSON."""
+
+    return jsonify(error=error.message), error.status
+
+
+@app.before_request
+def require_api_user():
+    """The API is only for logged-in users."""
+
+    if request.path.startswith('/api/') and not g.user:
+        raise APIError("login required", 401)
+
+
+def api_user(user_id):
+    """The user `user_id`, unless there's none or they deleted their account."""
+
+    user = get_user(user_id)
+    if user is None:
+        raise APIError("no such user", 404)
+
+    return user
+
+
+@app.route('/api/v1/timeline')
+def api_timeline():
+    """The logged-in user's home timeline, newest first."""
+
+    page = home_timeline(g.user.id, before=request.args.get('before'),
+                         per_page=api_limit())
+    return stream_messages(page, g.user)
+
+
+@app.route('/api/v1/users')
+def api_users():
+    """Everyone, newest first, or search results for ?q=."""
+
+    page = user_directory(request.args.get('q'),
+                          before=request.args.get('before'),
+                          per_page=api_limit())
+    return stream_users(page, g.user)
+
+
+@app.route('/api/v1/messages/search')
+def api_messages_search():
+    """Messages matching ?q=, best match first (see message_search.py)."""
+
+    try:
+        kwargs = search_args(request.args)
+    except ValueError as error:
+        raise APIError(str(error))
+
+    page = search_messages(request.args.get('q'),
+                           before=request.args.get('before'),
+                           per_page=api_limit(), **kwargs)
+    return stream_messages(page, g.user)
+
+
+@app.route('/api/v1/users/<int:user_id>/messages')
+def api_user_messages(user_id):
+    """A user's messages, newest first."""
+
+    api_user(user_id)
+    page = user_messages(user_id, before=request.args.get('before'),
+                         per_page=api_limit())
+    return stream_messages(page, g.user)
+
+
+@app.route('/api/v1/users/<int:user_id>/likes')
+def api_user_likes(user_id):
+    """The messages a user has liked, newest first."""
+
+    api_user(user_id)
+    page = liked_messages(user_id, before=request.args.get('before'),
+                          per_page=api_limit())
+    return stream_messages(page, g.user)
+
+
+@app.route('/api/v1/users/<int:user_id>/followers')
+def api_user_followers(user_id):
+    """The users following a user."""
+
+    api_user(user_id)
+    page = user_followers(user_id, before=request.args.get('before'),
+                          per_page=api_limit())
+    return stream_users(page, g.user)
+
+
+@app.route('/api/v1/users/<int:user_id>/following')
+def api_user_following(user_id):
+    """The users a user follows."""
+
+    api_user(user_id)
+    page = user_following(user_id, before=request.args.get('before'),
+                          per_page=api_limit())
+    return stream_users(page, g.user)
 
-        return render_template('users/show.html', messages=messages, user=user, likes=likes)
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
-
-@app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+# CLI commands
+
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines_command():
+    """Regenerate every home timeline from the messages/follows tables."""
+
+    count = rebuild_timelines()
+    print(f"Rebuilt {count} timelines.")
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recount the denormalized user/message counters and repair drift."""
+
+    users, messages = reconcile_counters()
+    print(f"Repaired counters on {users} users and {messages} messages.")
+
+
+@app.cli.command('reindex-messages')
+def reindex_messages_command():
+    """Recompute the full-text search vector of every message."""
+
+    count = reindex_messages()
+    print(f"Reindexed {count} messages.")
+
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help="Stop when no jobs are left.")
+@click.option('--batch-size', default=BATCH_SIZE, help="Jobs claimed at a time.")
+def run_jobs_command(once, batch_size):
+    """Run queued follow-up jobs (see jobs.py)."""
+
+    count = work(batch_size=batch_size, once=once)
+    print(f"Ran {count} jobs.")
+
+
+@app.cli.command('snapshot-follow-graph')
+@click.argument('path')
+def snapshot_follow_graph_command(path):
+    """Write every follower/following list to PATH (see follow_graph.py)."""
+
+    count = follow_graph.save_snapshot(path)
+    print(f"Wrote {count} follow lists to {path}.")
+
+
+@app.cli.command('refresh-suggestions')
+@click.option('--batch-size', default=REFRESH_BATCH_SIZE,
+              help="Users computed at a time.")
+def refresh_suggestions_command(batch_size):
+    """Recompute everyone's "who to follow" suggestions."""
+
+    count = refresh_suggestions(batch_size=batch_size)
+    print(f"Stored {count} suggestions.")
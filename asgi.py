@@ -0,0 +1,167 @@
+"""ASGI serving mode for Warbler.
+
+    uvicorn asgi:application
+
+Under a WSGI server every open connection holds a worker thread for its
+whole life, including the time spent waiting on slow clients and idle
+keep-alives. Here connections are owned by the event loop instead: a thread
+is only taken while a request is actually running, from a pool of
+ASGI_WORKERS threads sized to the database connection pool, and request
+bodies and responses are moved to and from the client without one.
+Streamed responses (the JSON API) are handed over chunk by chunk, with
+backpressure.
+
+Requests run the very same Flask views as the WSGI app, so both modes
+behave identically. The views still talk to the database synchronously:
+neither Flask 1.0 nor SQLAlchemy 1.2 can await a query.
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+
+# threads running views; the connection pool is DB_POOL_SIZE 5 +
+# DB_MAX_OVERFLOW 10
+ASGI_WORKERS = int(os.environ.get('ASGI_WORKERS', 15))
+
+# chunks of a streamed response buffered ahead of a slow client
+STREAM_BUFFER = 16
+
+
+class WSGIBridge:
+    """ASGI application running a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, workers=ASGI_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"unsupported ASGI scope {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        environ = build_environ(scope, b''.join(body))
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        worker = loop.run_in_executor(self.executor, self.run_wsgi,
+                                      environ, put)
+
+        kind = None
+        try:
+            while kind != 'end':
+                kind, value = await queue.get()
+                if kind == 'start':
+                    status, headers = value
+                    await send({'type': 'http.response.start',
+                                'status': int(status.split(' ', 1)[0]),
+                                'headers': [(name.lower().encode('latin-1'),
+                                             val.encode('latin-1'))
+                                            for name, val in headers]})
+                elif kind == 'body':
+                    await send({'type': 'http.response.body', 'body': value,
+                                'more_body': True})
+        finally:
+            # if the client went away, let the view run to the end anyway so
+            # its thread isn't left blocked on a full queue
+            while kind != 'end':
+                kind, value = await queue.get()
+
+        await worker
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def run_wsgi(self, environ, put):
+        """Run the WSGI app in a pool thread, passing its output to `put`."""
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['start'] = (status, headers)
+            return lambda chunk: put(('body', chunk))
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                put(('start', response['start']))
+                for chunk in result:
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            put(('end', None))
+
+
+def build_environ(scope, body):
+    """The WSGI environ for an ASGI http `scope` with request `body`."""
+
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+
+application = WSGIBridge(app)
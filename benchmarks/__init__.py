@@ -0,0 +1,5 @@
+"""Load and latency benchmarks for Warbler.
+
+Point DATABASE_URL at a scratch database before running these: seeding
+drops and recreates every table. See README.md for usage.
+"""
@@ -0,0 +1,267 @@
+"""Drive the Warbler app with concurrent virtual users and measure it.
+
+A `Scenario` is a named request: a method, a function building the path
+for a given user and, for POSTs, a function building the form data.
+`run_scenario` sends it from `concurrency` threads, each logged in as a
+different user, either through Flask's test client or over HTTP against a
+local WSGI server running the app, and returns latency percentiles,
+throughput and SQL statements per request.
+"""
+
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from threading import Thread
+
+from flask import g
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from app import app, CURR_USER_KEY
+
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'data'],
+                      defaults=[None])
+
+SQL_COUNT_HEADER = 'X-Benchmark-Queries'
+
+# (users, messages, follows) generated by `seed_scale`
+SCALES = {
+    'small': (1000, 20000, 20000),
+    'medium': (20000, 500000, 1000000),
+    'large': (100000, 1000000, 5000000),
+}
+
+# a route regresses if its p95 grows by more than this fraction of the
+# baseline, or if it runs more SQL statements per request than before
+LATENCY_TOLERANCE = 0.25
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+##############################################################################
+# Counting SQL per request
+
+
+def _add_count_header(resp):
+    # counted by the request profiler, see profiling.py
+    resp.headers[SQL_COUNT_HEADER] = str(g.profile.queries)
+    return resp
+
+
+def instrument_app():
+    """Report the SQL statements each request ran in a response header."""
+
+    app.after_request(_add_count_header)
+
+
+##############################################################################
+# Seeding
+
+
+def seed_scale(scale, seed=1):
+    """Replace the database contents with a generated dataset of `scale`."""
+
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit("Refusing to seed: set DATABASE_URL to a scratch database.")
+
+    users, messages, follows = SCALES[scale]
+    out = os.path.join('generator', 'scaled', scale)
+
+    subprocess.run([sys.executable, 'generator/create_scaled_csvs.py',
+                    '--users', str(users), '--messages', str(messages),
+                    '--follows', str(follows), '--out', out,
+                    '--seed', str(seed)], check=True)
+    subprocess.run([sys.executable, 'seed_bulk.py', out], check=True)
+
+
+##############################################################################
+# Virtual users
+
+
+class TestClientUser:
+    """A logged-in virtual user talking to the app through its test client."""
+
+    def __init__(self, user_id):
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def request(self, method, path, data=None):
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, int(resp.headers.get(SQL_COUNT_HEADER, 0))
+
+
+def session_cookie(user_id):
+    """Cookie header value logging in as `user_id`, as login would set it."""
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.session_cookie_name}={serializer.dumps({CURR_USER_KEY: user_id})}"
+
+
+class HTTPUser:
+    """A logged-in virtual user talking to a WSGI server over HTTP."""
+
+    def __init__(self, user_id, base_url):
+        self.base_url = base_url
+
+        jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(jar), _NoRedirect())
+        self.opener.addheaders = [('Cookie', session_cookie(user_id))]
+
+    def request(self, method, path, data=None):
+        body = None
+        if method == 'POST':
+            body = urllib.parse.urlencode(data or {}).encode()
+        req = urllib.request.Request(self.base_url + path, method=method,
+                                     data=body)
+        try:
+            with self.opener.open(req) as resp:
+                resp.read()
+                return resp.status, int(resp.headers.get(SQL_COUNT_HEADER, 0))
+        except urllib.error.HTTPError as error:
+            return error.code, int(error.headers.get(SQL_COUNT_HEADER, 0))
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # report the redirect itself, like the test client does
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+class WSGIServer:
+    """The app served by werkzeug on a random local port, in a thread."""
+
+    def __enter__(self):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True,
+                                  request_handler=_QuietHandler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+
+##############################################################################
+# Running and reporting
+
+
+def percentile(values, p):
+    """The `p` percentile (0 to 1) of sorted `values`, or None if empty."""
+
+    if not values:
+        return None
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def run_scenario(scenario, user_ids, concurrency=8, requests=200, url=None):
+    """Send `requests` of `scenario` from `concurrency` threads.
+
+    Each thread logs in as a user picked from `user_ids`. If `url` is given,
+    requests go over HTTP to it instead of through the test client.
+    """
+
+    per_thread = max(requests // concurrency, 1)
+    results = []
+    errors = []
+
+    def virtual_user():
+        user_id = random.choice(user_ids)
+        user = HTTPUser(user_id, url) if url else TestClientUser(user_id)
+        timings = []
+
+        for i in range(per_thread):
+            path = scenario.path(user_id)
+            data = scenario.data() if scenario.data else None
+            start = time.perf_counter()
+            status, queries = user.request(scenario.method, path, data)
+            timings.append((time.perf_counter() - start, queries))
+            if status >= 400:
+                errors.append((status, path))
+
+        results.extend(timings)
+
+    threads = [Thread(target=virtual_user) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, queries in results)
+    queries = [queries for latency, queries in results]
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        'requests': len(results),
+        'errors': len(errors),
+        'throughput': round(len(results) / elapsed, 1),
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'queries_per_request': round(sum(queries) / max(len(queries), 1), 2),
+    }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(results, baseline, tolerance=LATENCY_TOLERANCE):
+    """List (route, reason) for every route doing worse than `baseline`."""
+
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+
+        if (before['p95_ms'] and result['p95_ms'] >
+                before['p95_ms'] * (1 + tolerance)):
+            found.append((name, f"p95 {before['p95_ms']}ms -> "
+                                f"{result['p95_ms']}ms"))
+
+        if result['queries_per_request'] > before['queries_per_request']:
+            found.append((name, f"queries/request "
+                                f"{before['queries_per_request']} -> "
+                                f"{result['queries_per_request']}"))
+
+    return found
+
+
+def print_report(results, baseline):
+    print(f"{'route':<22}{'reqs':>6}{'err':>5}{'req/s':>9}{'p50':>9}"
+          f"{'p95':>9}{'p99':>9}{'sql':>7}{'p95 base':>10}")
+
+    for name, r in results.items():
+        base = baseline.get(name, {}).get('p95_ms')
+        print(f"{name:<22}{r['requests']:>6}{r['errors']:>5}"
+              f"{r['throughput']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['queries_per_request']:>7}"
+              f"{base if base is not None else '-':>10}")
@@ -0,0 +1,121 @@
+"""Time the batch "who to follow" computation on a synthetic follow graph.
+
+    python -m benchmarks.recommendations --users 1000000 --edges 100000000
+
+Builds a power-law graph in memory (a few users are followed by very many,
+everyone follows a similar number), then runs the same computation as
+`flask refresh-suggestions` over it -- without the database, so this times
+the graph work alone. With --sample-batches only that many batches are
+computed, spread across the id range, and the full run is extrapolated;
+use it when the whole graph takes too long on a small machine. Needs NumPy
+and SciPy; --python also times the pure-Python fallback on a few batches.
+"""
+
+import argparse
+import resource
+import sys
+import time
+
+from recommendations import (REFRESH_BATCH_SIZE, SUGGESTIONS_PER_USER,
+                             python_suggestions, sparse_suggestions)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def synthetic_graph(users, edges, seed=0):
+    """(followers, followed) arrays of about `edges` distinct follows among
+    ids 1..`users`, the followed ids drawn from a power law."""
+
+    rng = np.random.default_rng(seed)
+
+    followers = rng.integers(1, users + 1, size=edges, dtype=np.int64)
+    popularity = np.minimum(rng.pareto(1.1, size=edges) * users / 1000,
+                            users - 1).astype(np.int64)
+    # spread the popular users across the id range
+    followed = rng.permutation(users)[popularity] + 1
+
+    keys = np.unique(followers * (users + 1) + followed)
+    followers, followed = keys // (users + 1), keys % (users + 1)
+    distinct = followers != followed
+
+    return (followers[distinct].astype(np.int32),
+            followed[distinct].astype(np.int32))
+
+
+def time_batches(compute, followers, followed, users, batch_size, per_user,
+                 sample_batches):
+    """Run `compute` over every batch, or over `sample_batches` of them
+    spread across the id range.
+
+    Returns (batches run, users covered, suggestions made, seconds, whole
+    graph estimate). Whatever `compute` sets up before its first batch is
+    counted once in the estimate, not once per batch.
+    """
+
+    starts = range(0, users, batch_size)
+    if sample_batches:
+        every = max(len(starts) // sample_batches, 1)
+        starts = starts[::every][:sample_batches]
+
+    ran = covered = made = 0
+    first = None
+    started = time.perf_counter()
+    for start, stop, rows in compute(followers, followed, users, (),
+                                     batch_size, per_user, starts):
+        made += sum(1 for _ in rows)
+        ran += 1
+        covered += stop - start
+        if first is None:
+            first = (time.perf_counter() - started, covered)
+
+    elapsed = time.perf_counter() - started
+    if ran > 1:
+        rate = (covered - first[1]) / (elapsed - first[0])
+        estimate = first[0] + (users - first[1]) / rate
+    else:
+        estimate = elapsed * users / covered
+
+    return ran, covered, made, elapsed, estimate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--edges', type=int, default=100000000)
+    parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH_SIZE)
+    parser.add_argument('--per-user', type=int, default=SUGGESTIONS_PER_USER)
+    parser.add_argument('--sample-batches', type=int, default=0,
+                        help="time only this many batches and extrapolate")
+    parser.add_argument('--python', action='store_true',
+                        help="also time the pure-Python fallback")
+    args = parser.parse_args()
+
+    if np is None:
+        sys.exit("This benchmark needs NumPy and SciPy (pip install numpy scipy).")
+
+    started = time.perf_counter()
+    followers, followed = synthetic_graph(args.users, args.edges)
+    print(f"graph: {args.users} users, {len(followers)} follows, built in "
+          f"{time.perf_counter() - started:.1f}s")
+
+    users = args.users + 1
+    modes = [('sparse', sparse_suggestions, args.sample_batches)]
+    if args.python:
+        modes.append(('python', python_suggestions, 3))
+
+    for name, compute, sample in modes:
+        ran, covered, made, elapsed, estimate = time_batches(
+            compute, followers, followed, users, args.batch_size,
+            args.per_user, sample)
+        print(f"{name}: {ran} batches, {covered} users, {made} suggestions in "
+              f"{elapsed:.1f}s; whole graph ~{estimate:.0f}s")
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak memory: {peak:.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
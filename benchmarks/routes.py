@@ -0,0 +1,121 @@
+"""Benchmark every Warbler route.
+
+    DATABASE_URL=postgresql:///warbler_bench python -m benchmarks.routes \\
+        --seed small --save-baseline
+
+    DATABASE_URL=postgresql:///warbler_bench python -m benchmarks.routes
+
+The second run compares itself against the saved baseline and exits with
+status 1 if any route got slower or started running more SQL.
+"""
+
+import argparse
+import random
+import sys
+
+from sqlalchemy.sql import func
+
+from app import app
+from models import db, User, Message
+from benchmarks.harness import (Scenario, instrument_app, seed_scale,
+                                run_scenario, WSGIServer, load_baseline,
+                                save_baseline, regressions, print_report)
+
+# how many users / messages to pick request targets from
+SAMPLE_SIZE = 1000
+
+SEARCH_TERMS = ['the', 'love', 'music', 'water', 'work', 'zz']
+
+
+def sample_ids(model):
+    return [row[0] for row in
+            db.session.query(model.id).order_by(func.random())
+                                      .limit(SAMPLE_SIZE)]
+
+
+def scenarios(user_ids, message_ids):
+    """Every route worth timing, reads first since the writes change data."""
+
+    def any_user():
+        return random.choice(user_ids)
+
+    def any_message():
+        return random.choice(message_ids)
+
+    return [
+        Scenario('homepage', 'GET', lambda u: '/'),
+        Scenario('users_show', 'GET', lambda u: f"/users/{any_user()}"),
+        Scenario('list_users', 'GET', lambda u: '/users'),
+        Scenario('search_users', 'GET',
+                 lambda u: f"/users?q={random.choice(SEARCH_TERMS)}"),
+        Scenario('show_following', 'GET',
+                 lambda u: f"/users/{any_user()}/following"),
+        Scenario('users_followers', 'GET',
+                 lambda u: f"/users/{any_user()}/followers"),
+        Scenario('user_likes', 'GET', lambda u: f"/users/{any_user()}/likes"),
+        Scenario('messages_show', 'GET',
+                 lambda u: f"/messages/{any_message()}"),
+        Scenario('like_mssg', 'POST',
+                 lambda u: f"/users/add_like/{any_message()}"),
+        Scenario('messages_add', 'POST', lambda u: '/messages/new',
+                 lambda: {'text': 'Benchmarking warbles #warbler'}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', choices=['small', 'medium', 'large'],
+                        help="reseed the database at this scale first")
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help="virtual users per route")
+    parser.add_argument('--requests', type=int, default=200,
+                        help="requests per route")
+    parser.add_argument('--wsgi', action='store_true',
+                        help="go over HTTP to a local WSGI server instead "
+                             "of through the test client")
+    parser.add_argument('--only', nargs='*', help="route names to run")
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_scale(args.seed)
+
+    instrument_app()
+
+    with app.app_context():
+        user_ids = sample_ids(User)
+        message_ids = sample_ids(Message)
+        db.session.remove()
+
+    if not user_ids or not message_ids:
+        sys.exit("The database is empty: run with --seed first.")
+
+    results = {}
+    with WSGIServer() as server:
+        url = server.url if args.wsgi else None
+
+        for scenario in scenarios(user_ids, message_ids):
+            if args.only and scenario.name not in args.only:
+                continue
+            results[scenario.name] = run_scenario(
+                scenario, user_ids, args.concurrency, args.requests, url)
+
+    baseline = load_baseline(args.baseline)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+
+    found = regressions(results, baseline)
+    for name, reason in found:
+        print(f"REGRESSION {name}: {reason}")
+    if found:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""Compare how many concurrent connections one process handles in WSGI
+and ASGI mode.
+
+    DATABASE_URL=postgresql:///warbler_bench python -m benchmarks.serving
+
+Each mode is started as its own server process with the same number of
+threads running views (ASGI_WORKERS). Keep-alive clients then browse the
+read-heavy pages -- home, profiles, the user list and messages -- pausing
+between requests like people do, at increasing numbers of connections. A
+mode's capacity is the most connections it served with no errors and a p95
+under --target-ms. ASGI mode needs uvicorn (`pip install uvicorn`).
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from app import app
+from asgi import ASGI_WORKERS
+from models import db, User, Message
+from benchmarks.harness import percentile, session_cookie
+from benchmarks.routes import sample_ids
+
+REQUEST_TIMEOUT = 10
+
+
+##############################################################################
+# WSGI mode: a fixed pool of threads, one per connection being served
+
+
+class _KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """werkzeug server serving each connection on one of `threads` threads,
+    the way a threaded sync worker does."""
+
+    def __init__(self, host, port, wsgi_app, threads):
+        super().__init__(host, port, wsgi_app, handler=_KeepAliveHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._serve, request, client_address)
+
+    def _serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_wsgi(port, threads):
+    PooledWSGIServer('127.0.0.1', port, app, threads).serve_forever()
+
+
+def start_server(mode, port):
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'benchmarks.serving', '--serve-wsgi',
+                   str(port)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                   '--port', str(port), '--log-level', 'warning']
+
+    server = subprocess.Popen(command)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            return None
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.kill()
+    return None
+
+
+##############################################################################
+# Keep-alive clients
+
+
+async def _get(reader, writer, path, cookie):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Cookie: {cookie}\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+
+    return status, headers.get('connection') == 'close'
+
+
+async def _client(port, paths, cookie, think, until, latencies, errors):
+    reader = writer = None
+
+    while time.monotonic() < until:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, closed = await asyncio.wait_for(
+                _get(reader, writer, random.choice(paths)(), cookie),
+                REQUEST_TIMEOUT)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ValueError, IndexError) as error:
+            errors.append(type(error).__name__)
+            closed = True
+
+        if closed and writer is not None:
+            writer.close()
+            reader = writer = None
+
+        await asyncio.sleep(think)
+
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, connections, paths, cookies, think, duration):
+    latencies = []
+    errors = []
+    until = time.monotonic() + duration
+
+    await asyncio.gather(*[
+        _client(port, paths, random.choice(cookies), think, until,
+                latencies, errors)
+        for i in range(connections)])
+
+    latencies.sort()
+    return {
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': round(len(latencies) / duration, 1),
+        'p50_ms': round((percentile(latencies, 0.5) or 0) * 1000, 1),
+        'p95_ms': round((percentile(latencies, 0.95) or 0) * 1000, 1),
+    }
+
+
+##############################################################################
+# Running and reporting
+
+
+def read_paths():
+    with app.app_context():
+        user_ids = sample_ids(User)
+        message_ids = sample_ids(Message)
+        db.session.remove()
+
+    if not user_ids or not message_ids:
+        sys.exit("The database is empty: seed it first (see benchmarks/routes.py).")
+
+    paths = [
+        lambda: '/',
+        lambda: f"/users/{random.choice(user_ids)}",
+        lambda: '/users',
+        lambda: f"/messages/{random.choice(message_ids)}",
+    ]
+    with app.test_request_context():
+        cookies = [session_cookie(user_id) for user_id in user_ids[:100]]
+
+    return paths, cookies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--serve-wsgi', type=int, metavar='PORT',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--connections', type=int, nargs='+',
+                        default=[8, 32, 128, 512])
+    parser.add_argument('--think', type=float, default=0.1,
+                        help="seconds each client waits between requests")
+    parser.add_argument('--duration', type=float, default=10,
+                        help="seconds to run each level for")
+    parser.add_argument('--target-ms', type=float, default=500,
+                        help="p95 latency a level must stay under")
+    parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'])
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        return serve_wsgi(args.serve_wsgi, ASGI_WORKERS)
+
+    paths, cookies = read_paths()
+    capacity = {}
+
+    print(f"{'mode':<6}{'conns':>7}{'reqs':>8}{'err':>6}{'req/s':>9}"
+          f"{'p50':>9}{'p95':>9}")
+
+    for mode in args.modes:
+        port = 8700 + args.modes.index(mode)
+        server = start_server(mode, port)
+        if server is None:
+            print(f"{mode:<6}could not start the server, skipping")
+            continue
+
+        try:
+            capacity[mode] = 0
+            for connections in args.connections:
+                r = asyncio.run(_load(port, connections, paths, cookies,
+                                      args.think, args.duration))
+                print(f"{mode:<6}{r['connections']:>7}{r['requests']:>8}"
+                      f"{r['errors']:>6}{r['throughput']:>9}"
+                      f"{r['p50_ms']:>9}{r['p95_ms']:>9}")
+                if r['errors'] or r['p95_ms'] > args.target_ms:
+                    break
+                capacity[mode] = connections
+        finally:
+            server.terminate()
+            server.wait()
+
+    print()
+    for mode, connections in capacity.items():
+        print(f"{mode}: served {connections} concurrent connections within "
+              f"{args.target_ms:.0f}ms p95 ({ASGI_WORKERS} view threads)")
+
+
+if __name__ == '__main__':
+    main()
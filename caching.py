@@ -0,0 +1,123 @@
+"""HTTP caching for Warbler.
+
+Static files are served with a `?v=<content hash>` fingerprint in their URL
+(added by `url_for('static', ...)`), so fingerprinted requests can be cached
+for a year as immutable.
+
+Pages are validated with ETags built from cheap version stamps: every user
+row has a `version` that goes up whenever anything shown on their profile
+changes (see counters.py), and it's part of the cached identity snapshot.
+A view calls `not_modified` with the stamps its page depends on before
+doing any real work; if the browser already has that version, it gets a 304
+without the page's queries or template ever running. (The user list has no
+single stamp, so it is stamped with the versions of the users it lists and
+a 304 saves only the rendering.) Versions come from
+the identity cache, so a 304 can be up to IDENTITY_CACHE_TTL seconds stale
+when the change was made by another process.
+
+Anything else dynamic is marked no-store, as before.
+"""
+
+import hashlib
+import os
+
+from flask import g, request, session, make_response
+
+from identity import TTLCache
+from models import db, Message
+
+STATIC_CACHE_CONTROL = f"public, max-age={365 * 24 * 60 * 60}, immutable"
+
+# message id -> author id; a message never changes author
+MESSAGE_AUTHORS_SIZE = 100000
+MESSAGE_AUTHORS_TTL = 60 * 60
+
+message_authors = TTLCache(MESSAGE_AUTHORS_SIZE, MESSAGE_AUTHORS_TTL)
+
+_fingerprints = {}
+
+
+def static_fingerprint(static_folder, filename):
+    """Short hash of a static file's contents, or None if there's no file."""
+
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _fingerprints.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+        _fingerprints[path] = cached
+
+    return cached[1]
+
+
+def message_author(message_id):
+    """Id of the author of `message_id`, or None if there's no such message."""
+
+    author_id = message_authors.get(message_id)
+
+    if author_id is None:
+        author_id = (db.session
+                     .query(Message.user_id)
+                     .filter(Message.id == message_id)
+                     .scalar())
+        if author_id is None:
+            return None
+        message_authors.set(message_id, author_id)
+
+    return author_id
+
+
+def not_modified(*stamps):
+    """Return a 304 response if the browser's copy of this page was built
+    from the same `stamps`, otherwise None.
+
+    Either way the page's ETag is remembered, and added to the response.
+    Pages with flashed messages waiting are never cached.
+    """
+
+    if session.get('_flashes'):
+        return None
+
+    key = repr((request.full_path,) + stamps).encode('UTF-8')
+    g.etag = hashlib.sha1(key).hexdigest()
+
+    if g.etag in request.if_none_match:
+        return make_response('', 304)
+
+    return None
+
+
+def init_caching(app):
+    """Fingerprint static URLs and set caching headers on every response."""
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            fingerprint = static_fingerprint(app.static_folder,
+                                             values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    @app.after_request
+    def set_cache_headers(resp):
+        if request.endpoint == 'static':
+            if 'v' in request.args:
+                resp.headers['Cache-Control'] = STATIC_CACHE_CONTROL
+            else:
+                # still revalidated cheaply with the ETag send_file adds
+                resp.headers['Cache-Control'] = 'no-cache'
+            return resp
+
+        etag = g.get('etag')
+        if etag and resp.status_code in (200, 304):
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+        else:
+            resp.headers['Cache-Control'] = 'no-store'
+
+        return resp
@@ -0,0 +1,104 @@
+"""Denormalized counters for Warbler.
+
+`User` keeps counts of its messages, followers, following and likes, and
+`Message` keeps a count of its likes, so profile stats are read straight off
+the row instead of counting relationships. Views adjust the counters in the
+same transaction as the write they belong to; `reconcile_counters` recounts
+everything from the source tables to repair any drift.
+
+Every change to a user's counters also bumps their `version`, which pages
+are cached against (see caching.py).
+"""
+
+from sqlalchemy import func, or_
+
+from models import db, Follows, Likes, Message, User
+
+USER_COUNTERS = {
+    'messages': User.messages_count,
+    'followers': User.followers_count,
+    'following': User.following_count,
+    'likes': User.likes_count,
+}
+
+
+def adjust_user_counts(user_id, **deltas):
+    """Add `deltas` (e.g. messages=1, likes=-1) to a user's counters."""
+
+    values = {USER_COUNTERS[name]: USER_COUNTERS[name] + delta
+              for name, delta in deltas.items()}
+    values[User.version] = User.version + 1
+
+    User.query.filter(User.id == user_id).update(values, synchronize_session=False)
+
+
+def adjust_message_likes(message_id, delta):
+    """Add `delta` to a message's like counter."""
+
+    (Message
+     .query
+     .filter(Message.id == message_id)
+     .update({Message.likes_count: Message.likes_count + delta},
+             synchronize_session=False))
+
+
+def release_message_counts(message_id):
+    """Un-count the likes of a message that is about to be deleted."""
+
+    likers = (db.session
+              .query(Likes.user_id)
+              .filter(Likes.message_id == message_id))
+
+    (User
+     .query
+     .filter(User.id.in_(likers))
+     .update({User.likes_count: User.likes_count - 1,
+              User.version: User.version + 1},
+             synchronize_session=False))
+
+
+def reconcile_counters():
+    """Recount every counter from the source tables, fixing any that drifted.
+
+    Returns a (users repaired, messages repaired) tuple.
+    """
+
+    user_counts = {
+        User.messages_count: (db.session
+                              .query(func.count(Message.id))
+                              .filter(Message.user_id == User.id)
+                              .as_scalar()),
+        User.followers_count: (db.session
+                               .query(func.count(Follows.user_following_id))
+                               .filter(Follows.user_being_followed_id == User.id)
+                               .as_scalar()),
+        User.following_count: (db.session
+                               .query(func.count(Follows.user_being_followed_id))
+                               .filter(Follows.user_following_id == User.id)
+                               .as_scalar()),
+        User.likes_count: (db.session
+                           .query(func.count(Likes.id))
+                           .filter(Likes.user_id == User.id)
+                           .as_scalar()),
+    }
+
+    drifted = or_(*[column != count for column, count in user_counts.items()])
+    users = (User
+             .query
+             .filter(drifted)
+             .update({**user_counts, User.version: User.version + 1},
+                     synchronize_session=False))
+
+    message_likes = (db.session
+                     .query(func.count(Likes.id))
+                     .filter(Likes.message_id == Message.id)
+                     .as_scalar())
+
+    messages = (Message
+                .query
+                .filter(Message.likes_count != message_likes)
+                .update({Message.likes_count: message_likes},
+                        synchronize_session=False))
+
+    db.session.commit()
+    return users, messages
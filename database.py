@@ -0,0 +1,164 @@
+"""Database engine and session configuration.
+
+* The connection pool is sized and kept healthy from the DB_* settings:
+  DB_POOL_SIZE and DB_MAX_OVERFLOW connections, recycled after
+  DB_POOL_RECYCLE seconds and pinged before use (DB_POOL_PRE_PING).
+* Every Postgres connection gets a statement_timeout of
+  DB_STATEMENT_TIMEOUT_MS.
+  Endpoints listed in DB_ROUTE_TIMEOUTS_MS get their own, tighter budget,
+  set at the start of each of their transactions.
+* If a read replica is configured (the REPLICA_BIND entry of
+  SQLALCHEMY_BINDS), views decorated with @replica_reads send their queries
+  to it. Flushes always go to the primary, and after a user posts, follows or
+  otherwise writes, their reads stay on the primary for REPLICA_LAG_SECONDS
+  so they see their own changes. Identity snapshots and follow lists, which
+  are cached across requests, are always read on the primary
+  (`primary_reads`), so a lagging replica can't leak into them.
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm, text
+from sqlalchemy.pool import QueuePool
+
+REPLICA_BIND = 'replica'
+
+# session key: until when this user's reads stay on the primary
+PRIMARY_UNTIL_KEY = 'primary_until'
+
+
+def engine_options(config, url, poolclass=None):
+    """create_engine() options for the DB_* settings in `config`, for an
+    engine on `url` with `poolclass` (by default, its dialect's)."""
+
+    options = {
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+    # SQLite gets a NullPool or StaticPool, which have no size
+    if poolclass is None:
+        poolclass = url.get_dialect().get_pool_class(url)
+    if issubclass(poolclass, QueuePool):
+        options['pool_size'] = config['DB_POOL_SIZE']
+        options['max_overflow'] = config['DB_MAX_OVERFLOW']
+
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {
+            'options': f"-c statement_timeout={int(timeout)}"}
+
+    return options
+
+
+def route_timeouts(setting):
+    """Parse "endpoint=ms,endpoint=ms" into {endpoint: ms}."""
+
+    timeouts = {}
+    for item in setting.split(','):
+        if item.strip():
+            endpoint, _, ms = item.partition('=')
+            timeouts[endpoint.strip()] = int(ms)
+
+    return timeouts
+
+
+def replica_configured(app):
+    return REPLICA_BIND in (app.config['SQLALCHEMY_BINDS'] or {})
+
+
+def reading_from_replica():
+    return has_request_context() and g.get('read_replica', False)
+
+
+@contextmanager
+def primary_reads():
+    """Send the queries in the `with` block to the primary, even inside a
+    @replica_reads view -- for reads whose results outlive the request."""
+
+    if not has_request_context():
+        yield
+        return
+
+    reading = g.get('read_replica', False)
+    g.read_replica = False
+    try:
+        yield
+    finally:
+        g.read_replica = reading
+
+
+def replica_reads(view):
+    """Run `view`'s queries on the read replica, if there is one."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = (replica_configured(current_app) and
+                          session.get(PRIMARY_UNTIL_KEY, 0) <= time.time())
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+class RoutingSession(SignallingSession):
+    """Session sending the queries of @replica_reads views to the replica."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if reading_from_replica() and not self._flushing:
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_begin')
+def _set_route_timeout(session, transaction, connection):
+    timeout = g.get('statement_timeout') if has_request_context() else None
+    if timeout and connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT set_config('statement_timeout', :ms, true)"),
+                           ms=str(int(timeout)))
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with configured pools, timeouts and replica reads."""
+
+    def init_app(self, app):
+        app.config.setdefault('DB_POOL_SIZE', 5)
+        app.config.setdefault('DB_MAX_OVERFLOW', 10)
+        app.config.setdefault('DB_POOL_RECYCLE', 1800)
+        app.config.setdefault('DB_POOL_PRE_PING', True)
+        app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', 30000)
+        app.config.setdefault('DB_ROUTE_TIMEOUTS_MS', {})
+        app.config.setdefault('REPLICA_LAG_SECONDS', 5)
+
+        super().init_app(app)
+
+        @app.before_request
+        def set_statement_timeout():
+            g.statement_timeout = (app.config['DB_ROUTE_TIMEOUTS_MS']
+                                   .get(request.endpoint))
+
+        @app.after_request
+        def stick_to_primary(resp):
+            if (replica_configured(app) and
+                    request.method not in ('GET', 'HEAD', 'OPTIONS')):
+                session[PRIMARY_UNTIL_KEY] = (time.time() +
+                                              app.config['REPLICA_LAG_SECONDS'])
+            return resp
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super().apply_driver_hacks(app, sa_url, options)
+
+        ours = engine_options(app.config, sa_url, options.get('poolclass'))
+        options.setdefault('connect_args', {}).update(ours.pop('connect_args', {}))
+        options.update(ours)
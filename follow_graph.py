@@ -0,0 +1,282 @@
+"""In-memory follow graph.
+
+Each user's followers and the users they follow are kept as sorted arrays
+of ids (`array('i')`, 4 bytes an id rather than a Python int in a set) in a
+per-process TTL/LRU cache, read from `follows` on first use. Membership and
+degree are a binary search and a length, "followed by people you follow" is
+an intersection of two sorted arrays, and pages of followers are slices --
+none of them load a `User` row.
+
+Views that add or remove a follow call `add_follow`/`remove_follow` after
+committing, which updates this process's lists. Other processes pick the
+change up when their copy expires (FOLLOW_GRAPH_TTL), as with cached
+identities (see identity.py).
+
+`flask snapshot-follow-graph <file>` writes every list to a file. With
+FOLLOW_GRAPH_SNAPSHOT set to that file, each process loads it before its
+first request; lists whose length no longer matches the user's follower or
+following counter are skipped and read afresh when needed.
+"""
+
+import struct
+from array import array
+from bisect import bisect_left
+
+from database import primary_reads
+from identity import TTLCache
+from models import db, Follows, User
+from pagination import PAGE_SIZE, Page
+
+FOLLOW_GRAPH_SIZE = 100000
+FOLLOW_GRAPH_TTL = 300
+
+FOLLOWING = 0
+FOLLOWERS = 1
+
+SNAPSHOT_MAGIC = b'WFG1'
+SNAPSHOT_RECORD = struct.Struct('<BiI')
+
+
+def _ids(values=()):
+    return array('i', values)
+
+
+class FollowGraph:
+    """Sorted follower/following id arrays per user, cached."""
+
+    def __init__(self, maxsize=FOLLOW_GRAPH_SIZE, ttl=FOLLOW_GRAPH_TTL):
+        self.lists = TTLCache(maxsize, ttl)
+
+    def _get(self, direction, user_id):
+        ids = self.lists.get((direction, user_id))
+        if ids is None:
+            ids = _ids(self._read(direction, user_id))
+            self.lists.set((direction, user_id), ids)
+        return ids
+
+    def _read(self, direction, user_id):
+        if direction == FOLLOWING:
+            column, key = Follows.user_being_followed_id, Follows.user_following_id
+        else:
+            column, key = Follows.user_following_id, Follows.user_being_followed_id
+
+        # on the primary: the list is cached for everyone's requests
+        with primary_reads():
+            return [other_id for (other_id,) in
+                    db.session.query(column).filter(key == user_id).order_by(column)]
+
+    def following(self, user_id):
+        """Ids of the users `user_id` follows, ascending."""
+
+        return self._get(FOLLOWING, user_id)
+
+    def followers(self, user_id):
+        """Ids of the users following `user_id`, ascending."""
+
+        return self._get(FOLLOWERS, user_id)
+
+    def is_following(self, user_id, other_id):
+        """Does `user_id` follow `other_id`?"""
+
+        return _contains(self.following(user_id), other_id)
+
+    def following_among(self, user_id, user_ids):
+        """Which of `user_ids` does `user_id` follow? Returns a set."""
+
+        following = self.following(user_id)
+        return {other_id for other_id in user_ids
+                if _contains(following, other_id)}
+
+    def degree(self, user_id):
+        """(following, followers) counts of `user_id`."""
+
+        return len(self.following(user_id)), len(self.followers(user_id))
+
+    def followed_by_followed(self, viewer_id, user_id):
+        """Ids of the people `viewer_id` follows who follow `user_id`,
+        ascending."""
+
+        return _intersect(self.following(viewer_id), self.followers(user_id))
+
+    def following_page(self, user_id, before=None, per_page=PAGE_SIZE):
+        """A page of the ids `user_id` follows, highest (newest) first."""
+
+        return _id_page(self.following(user_id), before, per_page)
+
+    def followers_page(self, user_id, before=None, per_page=PAGE_SIZE):
+        """A page of the ids following `user_id`, highest (newest) first."""
+
+        return _id_page(self.followers(user_id), before, per_page)
+
+    def add_follow(self, follower_id, followed_id):
+        """Record a committed follow in the cached lists."""
+
+        self._update(FOLLOWING, follower_id, followed_id, add=True)
+        self._update(FOLLOWERS, followed_id, follower_id, add=True)
+
+    def remove_follow(self, follower_id, followed_id):
+        """Record a committed unfollow in the cached lists."""
+
+        self._update(FOLLOWING, follower_id, followed_id, add=False)
+        self._update(FOLLOWERS, followed_id, follower_id, add=False)
+
+    def _update(self, direction, user_id, other_id, add):
+        ids = self.lists.get((direction, user_id))
+        if ids is None:
+            return
+
+        # a fresh array rather than changing one another thread may be reading
+        position = bisect_left(ids, other_id)
+        present = position < len(ids) and ids[position] == other_id
+        if add and not present:
+            ids = ids[:position] + _ids([other_id]) + ids[position:]
+        elif not add and present:
+            ids = ids[:position] + ids[position + 1:]
+        else:
+            return
+
+        self.lists.set((direction, user_id), ids)
+
+    def clear(self):
+        self.lists.clear()
+
+    def save_snapshot(self, path, batch_size=10000):
+        """Write every user's lists, read from `follows`, to `path`.
+
+        Returns the number of lists written.
+        """
+
+        count = 0
+        with open(path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            for direction in (FOLLOWING, FOLLOWERS):
+                if direction == FOLLOWING:
+                    key, column = (Follows.user_following_id,
+                                   Follows.user_being_followed_id)
+                else:
+                    key, column = (Follows.user_being_followed_id,
+                                   Follows.user_following_id)
+
+                edges = (db.session
+                         .query(key, column)
+                         .order_by(key, column)
+                         .yield_per(batch_size))
+
+                user_id, ids = None, _ids()
+                for edge_key, other_id in edges:
+                    if edge_key != user_id:
+                        count += _write_record(f, direction, user_id, ids)
+                        user_id, ids = edge_key, _ids()
+                    ids.append(other_id)
+                count += _write_record(f, direction, user_id, ids)
+
+        return count
+
+    def load_snapshot(self, path, batch_size=1000):
+        """Fill the cache from a file written by `save_snapshot`, skipping
+        lists that no longer match their user's counters.
+
+        Returns the number of lists loaded.
+        """
+
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} isn't a follow graph snapshot")
+
+            loaded = 0
+            batch = []
+            while True:
+                header = f.read(SNAPSHOT_RECORD.size)
+                if not header:
+                    break
+                direction, user_id, length = SNAPSHOT_RECORD.unpack(header)
+                ids = _ids()
+                ids.fromfile(f, length)
+                batch.append((direction, user_id, ids))
+
+                if len(batch) == batch_size:
+                    loaded += self._load_batch(batch)
+                    batch = []
+
+            return loaded + self._load_batch(batch)
+
+    def _load_batch(self, batch):
+        if not batch:
+            return 0
+
+        counts = {user_id: (following, followers)
+                  for user_id, following, followers in
+                  db.session
+                  .query(User.id, User.following_count, User.followers_count)
+                  .filter(User.id.in_({user_id for _, user_id, _ in batch}))}
+
+        loaded = 0
+        for direction, user_id, ids in batch:
+            if user_id in counts and counts[user_id][direction] == len(ids):
+                self.lists.set((direction, user_id), ids)
+                loaded += 1
+
+        return loaded
+
+
+def _write_record(f, direction, user_id, ids):
+    if user_id is None:
+        return 0
+
+    f.write(SNAPSHOT_RECORD.pack(direction, user_id, len(ids)))
+    ids.tofile(f)
+    return 1
+
+
+def _contains(ids, user_id):
+    position = bisect_left(ids, user_id)
+    return position < len(ids) and ids[position] == user_id
+
+
+def _intersect(a, b):
+    """Ids in both sorted arrays, ascending."""
+
+    if len(a) > len(b):
+        a, b = b, a
+
+    # a few ids against a long list: binary search each of them
+    if len(a) * 16 < len(b):
+        return [user_id for user_id in a if _contains(b, user_id)]
+
+    return sorted(set(a).intersection(b))
+
+
+def _id_page(ids, before, per_page):
+    try:
+        end = bisect_left(ids, int(before))
+    except (TypeError, ValueError):
+        end = len(ids)
+
+    chunk = ids[max(end - per_page - 1, 0):end][::-1]
+    if len(chunk) > per_page:
+        return Page(list(chunk[:per_page]), str(chunk[per_page - 1]))
+
+    return Page(list(chunk), None)
+
+
+follow_graph = FollowGraph()
+
+
+def init_follow_graph(app):
+    """Warm the graph from FOLLOW_GRAPH_SNAPSHOT, if set, before the first
+    request."""
+
+    app.config.setdefault('FOLLOW_GRAPH_SNAPSHOT', None)
+
+    @app.before_first_request
+    def load_follow_graph_snapshot():
+        path = app.config['FOLLOW_GRAPH_SNAPSHOT']
+        if not path:
+            return
+
+        try:
+            loaded = follow_graph.load_snapshot(path)
+        except (OSError, ValueError, EOFError) as error:
+            app.logger.warning("couldn't load follow graph snapshot: %s", error)
+        else:
+            app.logger.info("loaded %s follow lists from %s", loaded, path)
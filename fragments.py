@@ -0,0 +1,180 @@
+"""Rendered-fragment cache for message and user cards.
+
+The markup of a message card or user card is the same for every viewer, so
+it's rendered once and kept in a cache; pages only render the per-viewer
+bits (like buttons, follow buttons) live. Card templates mark where those go
+with `<!--live-->`, and a cached card comes back as the list of pieces
+between the markers:
+
+    {% for msg, card in message_cards(messages) %}
+      {{ card[0] }} ...live like button... {{ card[1] }}
+    {% endfor %}
+
+Cards are keyed by message or user id plus a version token. A message card
+shows its author, so both card kinds use the author's token;
+`expire_user_cards` replaces it (when `profile()` edits a user) and every card showing them is
+re-rendered. `expire_message_card` drops a deleted message's card.
+
+The cache lives in-process by default (an LRU, per worker, so edits show up
+elsewhere after FRAGMENT_CACHE_TTL). Set `fragment_cache.backend` to a
+`ClientBackend` wrapping a memcached-style client to share it.
+"""
+
+import uuid
+
+from flask import current_app
+from markupsafe import Markup
+
+from identity import TTLCache
+
+FRAGMENT_CACHE_SIZE = 50000
+FRAGMENT_CACHE_TTL = 5 * 60
+
+LIVE = '<!--live-->'
+
+
+class LocalBackend:
+    """In-process LRU cache."""
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL):
+        self.cache = TTLCache(maxsize, ttl)
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.cache.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        for key, value in mapping.items():
+            self.cache.set(key, value)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ClientBackend:
+    """Shared cache through a memcached-style client (anything with
+    get_multi/set_multi/delete_multi, e.g. pymemcache or python-memcached)."""
+
+    def __init__(self, client, ttl=FRAGMENT_CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        return self.client.get_multi(keys) or {}
+
+    def set_many(self, mapping):
+        self.client.set_multi(mapping, self.ttl)
+
+    def delete_many(self, keys):
+        self.client.delete_multi(keys)
+
+    def clear(self):
+        pass
+
+
+class FragmentCache:
+    """Cache of rendered cards, split into pieces around the live bits."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def versions(self, user_ids):
+        """Current version token for each of `user_ids`."""
+
+        keys = {user_id: f"version:user:{user_id}" for user_id in user_ids}
+        found = self.backend.get_many(list(keys.values()))
+
+        versions = {}
+        missing = {}
+        for user_id, key in keys.items():
+            if key in found:
+                versions[user_id] = found[key]
+            else:
+                # no token (never set, or evicted): start a fresh one so no
+                # card rendered under an older token can be served
+                versions[user_id] = missing[key] = uuid.uuid4().hex[:12]
+
+        if missing:
+            self.backend.set_many(missing)
+
+        return versions
+
+    def cards(self, template, items, key_for, author_of, name):
+        """Return (item, pieces) for each of `items`, rendering and caching
+        the cards that aren't cached yet."""
+
+        versions = self.versions({author_of(item) for item in items})
+        keys = [f"{key_for(item)}:{versions[author_of(item)]}" for item in items]
+        found = self.backend.get_many(keys)
+
+        rendered = {}
+        if len(found) < len(keys):
+            card = current_app.jinja_env.get_template(template)
+            for item, key in zip(items, keys):
+                if key not in found and key not in rendered:
+                    rendered[key] = card.render(**{name: item})
+            self.backend.set_many(rendered)
+
+        self.hits += len(found)
+        self.misses += len(rendered)
+
+        return [(item, [Markup(piece) for piece in
+                        (found.get(key) or rendered[key]).split(LIVE)])
+                for item, key in zip(items, keys)]
+
+    def invalidate_user(self, user_id):
+        self.backend.delete_many([f"version:user:{user_id}"])
+
+    def invalidate_message(self, message_id, author_id):
+        key = f"version:user:{author_id}"
+        version = self.backend.get_many([key]).get(key)
+        if version:
+            self.backend.delete_many([f"card:message:{message_id}:{version}"])
+
+
+fragment_cache = FragmentCache(LocalBackend())
+
+
+def message_cards(messages):
+    """(message, card pieces) for each of `messages`."""
+
+    return fragment_cache.cards('messages/_card.html', messages,
+                                lambda msg: f"card:message:{msg.id}",
+                                lambda msg: msg.user_id, 'msg')
+
+
+def user_cards(users):
+    """(user, card pieces) for each of `users`."""
+
+    return fragment_cache.cards('users/_card.html', users,
+                                lambda user: f"card:user:{user.id}",
+                                lambda user: user.id, 'user')
+
+
+def expire_user_cards(user_id):
+    """Re-render every card showing `user_id` from now on."""
+
+    fragment_cache.invalidate_user(user_id)
+
+
+def expire_message_card(message_id, author_id):
+    """Forget the card of a deleted message."""
+
+    fragment_cache.invalidate_message(message_id, author_id)
+
+
+def init_fragments(app):
+    """Make the card helpers available to templates."""
+
+    app.jinja_env.globals.update(message_cards=message_cards,
+                                 user_cards=user_cards)
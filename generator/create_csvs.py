@@ -3,14 +3,14 @@
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
 tweak the CSV formats or generate fewer/more rows.
+
+For load-testing sized data (millions of rows), use create_scaled_csvs.py.
 """
 
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+from random import choice, randint
 from faker import Faker
-from helpers import get_random_datetime
+from helpers import get_random_datetime, HEADER_IMAGE_URLS, PROFILE_IMAGE_URLS
 
 MAX_WARBLER_LENGTH = 140
 
@@ -24,21 +24,6 @@ NUM_FOLLWERS = 5000
 
 fake = Faker()
 
-# Generate random profile image URLs to use for users
-
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
-]
-
-# Generate random header image URLs to use for users
-
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
-
 with open('generator/users.csv', 'w') as users_csv:
     users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
     users_writer.writeheader()
@@ -47,10 +32,10 @@ with open('generator/users.csv', 'w') as users_csv:
         users_writer.writerow(dict(
             email=fake.email(),
             username=fake.user_name(),
-            image_url=choice(image_urls),
+            image_url=choice(PROFILE_IMAGE_URLS),
             password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
             bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
+            header_image_url=choice(HEADER_IMAGE_URLS),
             location=fake.city()
         ))
 
@@ -65,13 +50,19 @@ with open('generator/messages.csv', 'w') as messages_csv:
             user_id=randint(1, NUM_USERS)
         ))
 
-# Generate follows.csv from random pairings of users
+# Generate follows.csv from random pairings of users, drawing pairs until
+# there are enough distinct ones rather than listing every possible pair
 
 with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
+    pairs = set()
+
+    while len(pairs) < NUM_FOLLWERS:
+        followed_user, follower = randint(1, NUM_USERS), randint(1, NUM_USERS)
+        if followed_user != follower:
+            pairs.add((followed_user, follower))
 
     users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
     users_writer.writeheader()
 
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
+    for followed_user, follower in pairs:
         users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
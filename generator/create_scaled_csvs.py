@@ -0,0 +1,230 @@
+"""Generate load-testing sized CSVs of Warbler data.
+
+Unlike create_csvs.py this can produce millions of users, messages and
+follows: rows are streamed to disk in chunks (one CSV file per chunk) rather
+than built up in memory, nothing is fetched over the network, and follows
+and messages follow a power law, so a few accounts have huge followings and
+post a lot while most have a handful.
+
+Run it from the project root, then load the output with seed_bulk.py:
+
+    python generator/create_scaled_csvs.py --users 1000000 \\
+        --messages 10000000 --follows 50000000
+    python seed_bulk.py generator/scaled
+"""
+
+import argparse
+import csv
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from helpers import HEADER_IMAGE_URLS, PROFILE_IMAGE_URLS
+
+MAX_WARBLER_LENGTH = 140
+
+USERS_CSV_HEADERS = ['id', 'email', 'username', 'image_url', 'password', 'bio',
+                     'header_image_url', 'location']
+MESSAGES_CSV_HEADERS = ['id', 'text', 'timestamp', 'user_id']
+FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+
+# bcrypt hash of "password", shared by every generated user
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+# how skewed popularity (who gets followed) and activity (who posts) are;
+# user #1 is the most popular and most active account
+FOLLOW_SKEW = 1.1
+POST_SKEW = 0.8
+
+WORDS = """
+    about after again air all also always another any around away back
+    because before best better big book both bring call came can change city
+    close come could country cup day did different does done down each early
+    earth end enough even every eye face family far feel few find first food
+    found friend from game get give good great group hand happy hard have
+    head hear help here high home house idea important just keep kind know
+    land large last late learn leave left let life light line little live
+    long look love made make many may mean might more morning most mother
+    move much music must name near need never new next night now number
+    often old once only open other own page paper part people picture place
+    plan play point put question quick read real right river road room run
+    same saw school sea second see seem set should show side small some
+    something song soon sound start state still stop story study such sun
+    sure take talk tell thing think those thought through time today
+    together too took tree try turn under until use very walk want watch
+    water way week well went while white whole why will with without word
+    work world would write year young
+""".split()
+
+HASHTAGS = ['#warbler', '#python', '#flask', '#monday', '#coffee', '#music',
+            '#travel', '#food', '#news', '#sports', '#tbt', '#nofilter']
+
+CITIES = ['Portland', 'Austin', 'Denver', 'Chicago', 'Seattle', 'Boston',
+          'Oakland', 'Atlanta', 'Detroit', 'Phoenix', 'Miami', 'Tucson']
+
+
+def power_law_cum_weights(n, skew):
+    """Cumulative weights making id `i` (1-based) `i ** -skew` likely."""
+
+    return list(accumulate(i ** -skew for i in range(1, n + 1)))
+
+
+def sentence(max_length):
+    """A random run of words, sometimes with a hashtag, up to `max_length`."""
+
+    words = random.choices(WORDS, k=random.randint(3, 20))
+    if random.random() < 0.2:
+        words.append(random.choice(HASHTAGS))
+
+    text = ' '.join(words).capitalize()
+    return text[:max_length].rstrip()
+
+
+class ChunkedWriter:
+    """Write CSV rows to numbered files of at most `chunk_size` rows each."""
+
+    def __init__(self, out_dir, name, headers, chunk_size):
+        self.out_dir = out_dir
+        self.name = name
+        self.headers = headers
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.file = None
+        self.started = time.perf_counter()
+
+    def writerow(self, row):
+        if self.rows % self.chunk_size == 0:
+            self._next_file()
+
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def _next_file(self):
+        self.close()
+
+        chunk = self.rows // self.chunk_size
+        path = os.path.join(self.out_dir, f"{self.name}-{chunk:05d}.csv")
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.headers)
+
+        if self.rows:
+            self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"{self.name}: {self.rows:,} rows "
+              f"({self.rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def generate_users(out_dir, num_users, chunk_size):
+    writer = ChunkedWriter(out_dir, 'users', USERS_CSV_HEADERS, chunk_size)
+
+    for user_id in range(1, num_users + 1):
+        writer.writerow([
+            user_id,
+            f"user{user_id}@example.com",
+            f"{random.choice(WORDS)}{user_id}",
+            random.choice(PROFILE_IMAGE_URLS),
+            PASSWORD,
+            sentence(100),
+            random.choice(HEADER_IMAGE_URLS),
+            random.choice(CITIES),
+        ])
+
+    writer.close()
+    writer.report()
+
+
+def generate_messages(out_dir, num_users, num_messages, chunk_size):
+    writer = ChunkedWriter(out_dir, 'messages', MESSAGES_CSV_HEADERS, chunk_size)
+
+    users = range(1, num_users + 1)
+    cum_weights = power_law_cum_weights(num_users, POST_SKEW)
+    now = datetime.now(timezone.utc)
+    span = timedelta(days=730).total_seconds()
+
+    for start in range(1, num_messages + 1, chunk_size):
+        count = min(chunk_size, num_messages + 1 - start)
+        authors = random.choices(users, cum_weights=cum_weights, k=count)
+
+        for message_id, author in zip(range(start, start + count), authors):
+            timestamp = now - timedelta(seconds=random.uniform(0, span))
+            writer.writerow([
+                message_id,
+                sentence(MAX_WARBLER_LENGTH),
+                timestamp.isoformat(),
+                author,
+            ])
+
+    writer.close()
+    writer.report()
+
+
+def generate_follows(out_dir, num_users, num_follows, chunk_size):
+    """Everyone follows about the same number of people, picked by popularity.
+
+    Each user's follows are drawn as a set, so pairs are distinct without
+    ever holding the whole follow graph in memory.
+    """
+
+    writer = ChunkedWriter(out_dir, 'follows', FOLLOWS_CSV_HEADERS, chunk_size)
+
+    users = range(1, num_users + 1)
+    cum_weights = power_law_cum_weights(num_users, FOLLOW_SKEW)
+    mean_following = num_follows / num_users
+
+    for follower in users:
+        remaining = num_follows - writer.rows
+        if remaining <= 0:
+            break
+
+        wanted = min(int(random.expovariate(1 / mean_following)) + 1,
+                     num_users - 1, remaining)
+
+        followed = set()
+        attempts = 0
+        while len(followed) < wanted and attempts < wanted * 10:
+            for user in random.choices(users, cum_weights=cum_weights,
+                                       k=wanted - len(followed)):
+                if user != follower:
+                    followed.add(user)
+            attempts += wanted
+
+        for user in followed:
+            writer.writerow([user, follower])
+
+    writer.close()
+    writer.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--follows', type=int, default=2000000)
+    parser.add_argument('--chunk-size', type=int, default=250000,
+                        help="rows per CSV file")
+    parser.add_argument('--out', default='generator/scaled',
+                        help="directory to write the CSV chunks to")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="random seed, for reproducible datasets")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+
+    generate_users(args.out, args.users, args.chunk_size)
+    generate_messages(args.out, args.users, args.messages, args.chunk_size)
+    generate_follows(args.out, args.users, args.follows, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Bounded bcrypt hashing for Warbler.
+
+bcrypt is deliberately slow, so a burst of logins can tie up every worker
+thread hashing passwords. All hashing instead runs on a small dedicated
+thread pool: at most HASH_WORKERS hashes run at once and at most
+HASH_QUEUE_SIZE more wait their turn. Past that, `HashingPoolSaturated` is
+raised and the app answers 503 with a Retry-After header instead of queueing
+without limit.
+
+The bcrypt cost is the BCRYPT_LOG_ROUNDS config value; passwords hashed at
+another cost are rehashed the next time their owner logs in.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+from flask_bcrypt import Bcrypt
+
+bcrypt = Bcrypt()
+
+
+class HashingPoolSaturated(Exception):
+    """Raised when the hashing pool has no room for another job."""
+
+
+class HashingPool:
+    """Thread pool for bcrypt work with a bounded queue and metrics."""
+
+    def __init__(self, workers=2, queue_size=16):
+        self.configure(workers, queue_size)
+        self.lock = Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=1000)
+
+    def configure(self, workers, queue_size):
+        # hashes already running on the old executor finish there
+        old = getattr(self, 'executor', None)
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='bcrypt')
+        self.slots = BoundedSemaphore(workers + queue_size)
+
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` on the pool and return its result.
+
+        Raises HashingPoolSaturated straight away if the pool is full.
+        """
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HashingPoolSaturated()
+
+        with self.lock:
+            self.in_flight += 1
+
+        start = time.perf_counter()
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.latencies.append(elapsed)
+            self.slots.release()
+
+    def stats(self):
+        """Return queue depth and hash latency figures."""
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            in_flight = self.in_flight
+            completed = self.completed
+            rejected = self.rejected
+
+        def percentile(p):
+            if not latencies:
+                return None
+            index = min(int(len(latencies) * p), len(latencies) - 1)
+            return round(latencies[index] * 1000, 1)
+
+        return {
+            'workers': self.workers,
+            'in_flight': in_flight,
+            'queue_depth': max(in_flight - self.workers, 0),
+            'queue_size': self.queue_size,
+            'completed': completed,
+            'rejected': rejected,
+            'latency_ms': {'p50': percentile(0.5),
+                           'p95': percentile(0.95),
+                           'max': percentile(1)},
+        }
+
+
+hashing_pool = HashingPool()
+
+
+def init_hashing(app):
+    """Configure bcrypt cost and the hashing pool from `app`'s config."""
+
+    bcrypt.init_app(app)
+    hashing_pool.configure(app.config.get('HASH_WORKERS', 2),
+                           app.config.get('HASH_QUEUE_SIZE', 16))
+
+
+def hash_password(password):
+    """Hash `password` at the configured cost."""
+
+    return hashing_pool.run(bcrypt.generate_password_hash, password).decode('UTF-8')
+
+
+def check_password(pw_hash, password):
+    """Does `password` match `pw_hash`?"""
+
+    return hashing_pool.run(bcrypt.check_password_hash, pw_hash, password)
+
+
+def needs_rehash(pw_hash, log_rounds):
+    """Was `pw_hash` made at a cost other than `log_rounds`?"""
+
+    try:
+        rounds = int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+
+    return rounds != log_rounds
@@ -0,0 +1,148 @@
+"""Cached identity of the logged-in user.
+
+`add_user_to_g` puts a `CurrentUser` on `g.user` instead of a `User` row.
+It's a small snapshot -- id, username, avatar, counters and the ids of the
+users they follow -- kept in a per-process TTL/LRU cache, so requests that
+only need to know who is logged in don't touch the database. Anything not in
+the snapshot falls through to the real `User` row, loaded on first use.
+
+Views that change what's in a snapshot call `invalidate` after committing.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from database import primary_reads
+from models import db, Follows, User
+
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_TTL = 60
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+identity_cache = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+
+
+class CurrentUser:
+    """Snapshot of the logged-in user, standing in for their `User` row."""
+
+    def __init__(self, snapshot):
+        self.__dict__.update(snapshot)
+        self._model = None
+
+    @property
+    def model(self):
+        """The logged-in user's `User` row, loaded on first use."""
+
+        if self._model is None:
+            self._model = User.query.get(self.id)
+        return self._model
+
+    def __getattr__(self, name):
+        # only called for attributes the snapshot doesn't have
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def is_following(self, other_user):
+        """Is this user following `other_user`?"""
+
+        return other_user.id in self.following_ids
+
+    def following_among(self, user_ids):
+        """Which of `user_ids` is this user following? Returns a set."""
+
+        return self.following_ids.intersection(user_ids)
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}: {self.username}>"
+
+
+SNAPSHOT_FIELDS = ['id', 'username', 'image_url', 'header_image_url',
+                   'messages_count', 'followers_count', 'following_count',
+                   'likes_count', 'version']
+
+
+def take_snapshot(user_id):
+    """Read the snapshot fields for `user_id`; None if there's no such user
+    (or they've deleted their account)."""
+
+    # one row per followed user (or a single row with a NULL if none); on
+    # the primary, since the snapshot is cached for everyone's requests
+    with primary_reads():
+        rows = (db.session
+                .query(Follows.user_being_followed_id,
+                       *[getattr(User, name) for name in SNAPSHOT_FIELDS])
+                .select_from(User)
+                .outerjoin(Follows, Follows.user_following_id == User.id)
+                .filter(User.id == user_id, User.deleted_at.is_(None))
+                .all())
+
+    if not rows:
+        return None
+
+    snapshot = dict(zip(SNAPSHOT_FIELDS, rows[0][1:]))
+    snapshot['following_ids'] = frozenset(row[0] for row in rows
+                                          if row[0] is not None)
+    return snapshot
+
+
+def load_identity(user_id):
+    """Return a CurrentUser for `user_id` from the cache, or None if there's
+    no such user."""
+
+    snapshot = identity_cache.get(user_id)
+
+    if snapshot is None:
+        snapshot = take_snapshot(user_id)
+        if snapshot is None:
+            return None
+        identity_cache.set(user_id, snapshot)
+
+    return CurrentUser(snapshot)
+
+
+def invalidate(*user_ids):
+    """Drop the cached snapshots of `user_ids`."""
+
+    for user_id in user_ids:
+        identity_cache.delete(user_id)
@@ -0,0 +1,161 @@
+"""Background jobs for the follow-up work of writes.
+
+A view queues work with `enqueue('fan_out_message', message_id=msg.id)`
+before it commits. The job row goes into the `jobs` table in the same
+transaction, so it exists exactly when the write does. The view then commits
+and returns without waiting for the work to finish.
+
+`flask run-jobs` runs a worker that drains the table in batches. It claims due
+jobs with SELECT ... FOR UPDATE SKIP LOCKED, so several workers can share
+the table; SQLite has no row locks but lets only one writer in at a time
+anyway. Each job runs in a savepoint and is deleted in the same transaction,
+so its effects are committed exactly when it leaves the queue. A job that
+fails is retried with exponential backoff and set aside after MAX_ATTEMPTS.
+Handlers must still be idempotent, and must cope with the rows they were
+queued for having changed or gone. They stick to SQL that SQLite runs as
+well as Postgres.
+
+With JOBS_EAGER set, jobs run as soon as they are queued. This is for
+development without a worker. Jobs queued by a running job, like the next
+batch of a purge, run after it returns rather than inside it, so long chains
+of them don't recurse.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from models import db, Follows, Job, Message
+from purge import purge_batch
+from recommendations import refresh_user_suggestions
+from timelines import (fan_out_message, backfill_follow, prune_follow,
+                       push_author)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+
+# seconds before the first retry; doubled for each one after
+RETRY_DELAY = 10
+
+logger = logging.getLogger('warbler.jobs')
+
+# the jobs waiting to run eagerly in this thread, while one is running
+_eager = threading.local()
+
+
+def _fan_out_message(message_id):
+    message = Message.query.get(message_id)
+    if message is not None:
+        fan_out_message(message)
+
+
+def _backfill_follow(follower_id, followed_id):
+    still_following = Follows.query.get((followed_id, follower_id))
+    if still_following is not None:
+        backfill_follow(follower_id, followed_id)
+
+
+def _purge_user(user_id, purged=0):
+    # one batch per job, so locks are only ever held on one batch of rows
+    removed = purge_batch(user_id, purged)
+    if removed:
+        enqueue('purge_user', user_id=user_id, purged=purged + removed)
+
+
+def _push_author(author_id, after=0):
+    # a batch of followers per job, like purges
+    last = push_author(author_id, after)
+    if last is not None:
+        enqueue('push_author', author_id=author_id, after=last)
+
+
+HANDLERS = {
+    'fan_out_message': _fan_out_message,
+    'backfill_follow': _backfill_follow,
+    'prune_follow': prune_follow,
+    'push_author': _push_author,
+    'purge_user': _purge_user,
+    'refresh_suggestions': refresh_user_suggestions,
+}
+
+
+def enqueue(kind, **payload):
+    """Queue a `kind` job in the current transaction."""
+
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job {kind!r}")
+
+    if db.get_app().config['JOBS_EAGER']:
+        _run_eagerly(kind, payload)
+        return None
+
+    job = Job(kind=kind, payload=payload)
+    db.session.add(job)
+    return job
+
+
+def _run_eagerly(kind, payload):
+    queued = getattr(_eager, 'queued', None)
+    if queued is not None:
+        queued.append((kind, payload))
+        return
+
+    _eager.queued = queued = deque([(kind, payload)])
+    try:
+        while queued:
+            kind, payload = queued.popleft()
+            HANDLERS[kind](**payload)
+    finally:
+        _eager.queued = None
+
+
+def run_pending(batch_size=BATCH_SIZE):
+    """Claim and run up to `batch_size` due jobs; return how many ran."""
+
+    now = datetime.now(timezone.utc)
+    jobs = (Job
+            .query
+            .filter(Job.failed_at.is_(None), Job.run_at <= now)
+            .order_by(Job.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all())
+
+    for job in jobs:
+        try:
+            with db.session.begin_nested():
+                HANDLERS[job.kind](**job.payload)
+        except Exception as error:
+            logger.exception("job %s (%s) failed", job.id, job.kind)
+            job.attempts += 1
+            job.last_error = repr(error)[:1000]
+            if job.attempts >= MAX_ATTEMPTS:
+                job.failed_at = now
+            else:
+                job.run_at = now + timedelta(
+                    seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            db.session.delete(job)
+
+    db.session.commit()
+    return len(jobs)
+
+
+def work(batch_size=BATCH_SIZE, poll_interval=1.0, once=False):
+    """Run jobs as they come due; with `once`, stop when none are left.
+
+    Returns the number of jobs run.
+    """
+
+    total = 0
+    while True:
+        ran = run_pending(batch_size)
+        total += ran
+
+        if once:
+            if not ran:
+                return total
+        elif ran < batch_size:
+            time.sleep(poll_interval)
@@ -0,0 +1,83 @@
+"""Likes for Warbler.
+
+A like is unique on (user_id, message_id). `toggle_like` flips it in a
+single statement: it deletes the like if there is one, otherwise inserts it
+-- unless the message doesn't exist or belongs to the user -- so a double
+click can't create two likes or trip over a half-finished toggle. Other
+databases than Postgres get the delete and the insert as two statements,
+with the unique constraint still keeping out a second like.
+
+`liked_among` answers "which of these messages has the viewer liked?" for a
+whole page in one query, returning a set for templates to test ids against.
+"""
+
+from sqlalchemy import literal, select, text
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Likes, Message
+
+TOGGLE_LIKE = text("""
+    WITH unliked AS (
+        DELETE FROM likes
+        WHERE user_id = :user_id AND message_id = :message_id
+        RETURNING id
+    ), liked AS (
+        INSERT INTO likes (user_id, message_id)
+        SELECT :user_id, messages.id
+        FROM messages
+        WHERE messages.id = :message_id
+          AND messages.user_id != :user_id
+          AND NOT EXISTS (SELECT 1 FROM unliked)
+        ON CONFLICT (user_id, message_id) DO NOTHING
+        RETURNING id
+    )
+    SELECT (SELECT count(*) FROM liked) - (SELECT count(*) FROM unliked)
+""")
+
+
+def toggle_like(user_id, message_id):
+    """Like `message_id` as `user_id`, or unlike it if they already do.
+
+    Returns 1 if it's now liked, -1 if it was unliked, and 0 if nothing
+    changed: the message doesn't exist or is the user's own.
+    """
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.session.execute(TOGGLE_LIKE, {'user_id': user_id,
+                                                'message_id': message_id}).scalar()
+
+    unliked = (Likes
+               .query
+               .filter(Likes.user_id == user_id, Likes.message_id == message_id)
+               .delete(synchronize_session=False))
+    if unliked:
+        return -1
+
+    likeable = (select([literal(user_id), Message.id])
+                .where(Message.id == message_id)
+                .where(Message.user_id != user_id))
+    try:
+        with db.session.begin_nested():
+            liked = db.session.execute(Likes
+                                       .__table__
+                                       .insert()
+                                       .from_select(['user_id', 'message_id'],
+                                                    likeable))
+    except IntegrityError:
+        # a concurrent toggle liked it first
+        return 0
+
+    return liked.rowcount
+
+
+def liked_among(user_id, message_ids):
+    """Which of `message_ids` has `user_id` liked? Returns a set."""
+
+    if user_id is None or not message_ids:
+        return set()
+
+    return {message_id for (message_id,) in
+            db.session
+              .query(Likes.message_id)
+              .filter(Likes.user_id == user_id,
+                      Likes.message_id.in_(message_ids))}
@@ -0,0 +1,178 @@
+"""Full-text search over messages.
+
+Queries are words, "quoted phrases" and prefixes (`warb*`); a message must
+match all of them. Results can be narrowed to one author and a time window,
+and come back either best match first or newest first.
+
+On Postgres each message has a `search_vector` column, filled in by a
+trigger when the message is written and indexed with GIN (see models.py), so
+new messages are searchable as soon as they commit. Ranking is done over the
+MAX_CANDIDATES newest matches only, which keeps a query for a common word
+as cheap as one for a rare word. Anywhere else the same queries run as
+substring matches, newest first.
+"""
+
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import contains_eager, joinedload
+
+from models import db, Message, User, MESSAGE_SEARCH_CONFIG
+from pagination import PAGE_SIZE, Page, keyset_page
+
+# best-match searches never rank or return more than this many messages
+MAX_CANDIDATES = 500
+MAX_RESULTS = 200
+
+Term = namedtuple('Term', ['words', 'prefix'])
+
+TOKENS = re.compile(r'"([^"]*)"|(\S+)')
+WORDS = re.compile(r'[^\W_]+')
+
+
+def parse_query(q):
+    """Split `q` into Terms: a phrase's words must appear in order, and the
+    last word of a prefix term only has to start a word."""
+
+    terms = []
+    for phrase, word in TOKENS.findall(q or ''):
+        words = tuple(WORDS.findall((phrase or word).lower()))
+        if words:
+            terms.append(Term(words, bool(word) and word.endswith('*')))
+
+    return terms
+
+
+def to_tsquery_text(terms):
+    """Render Terms in to_tsquery() syntax. Words are alphanumeric only, so
+    nothing from the user can change the query's structure."""
+
+    rendered = []
+    for term in terms:
+        words = list(term.words)
+        if term.prefix:
+            words[-1] += ':*'
+        rendered.append(' <-> '.join(words))
+
+    return ' & '.join(rendered)
+
+
+def search_args(args):
+    """search_messages() keyword arguments from a request's query string:
+    ?user=<author id>, ?since= and ?until= (YYYY-MM-DD, both days included)
+    and ?order=rank|recent. Raises ValueError for malformed values."""
+
+    def day(name):
+        return (datetime.strptime(args[name], '%Y-%m-%d')
+                .replace(tzinfo=timezone.utc))
+
+    kwargs = {}
+    if args.get('user'):
+        kwargs['author_id'] = int(args['user'])
+    if args.get('since'):
+        kwargs['since'] = day('since')
+    if args.get('until'):
+        kwargs['until'] = day('until') + timedelta(days=1)
+    if args.get('order'):
+        if args['order'] not in ('rank', 'recent'):
+            raise ValueError("order must be rank or recent")
+        kwargs['order'] = args['order']
+
+    return kwargs
+
+
+def search_messages(q, author_id=None, since=None, until=None,
+                    order='rank', before=None, per_page=PAGE_SIZE):
+    """Return a page of messages matching `q`, authors included.
+
+    `order` is 'rank' (best match first; `before` is an offset into the
+    capped ranking) or 'recent' (newest first, with keyset cursors).
+    """
+
+    terms = parse_query(q)
+    if not terms:
+        return Page([], None)
+
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+
+    query = (Message
+             .query
+             .join(User, User.id == Message.user_id)
+             .filter(User.deleted_at.is_(None)))
+    if author_id is not None:
+        query = query.filter(Message.user_id == author_id)
+    if since is not None:
+        query = query.filter(Message.timestamp >= since)
+    if until is not None:
+        query = query.filter(Message.timestamp < until)
+
+    if postgres:
+        vector = literal_column('messages.search_vector')
+        tsquery = func.to_tsquery(MESSAGE_SEARCH_CONFIG, to_tsquery_text(terms))
+        query = query.filter(vector.op('@@')(tsquery))
+    else:
+        for term in terms:
+            query = query.filter(Message.text.ilike(f"%{' '.join(term.words)}%"))
+
+    if order != 'rank' or not postgres:
+        query = query.options(contains_eager(Message.user))
+        return keyset_page(query, Message.timestamp, Message.id, before,
+                           per_page)
+
+    candidates = (query
+                  .with_entities(Message.id.label('id'),
+                                 func.ts_rank_cd(vector, tsquery).label('rank'))
+                  .order_by(Message.timestamp.desc(), Message.id.desc())
+                  .limit(MAX_CANDIDATES)
+                  .subquery())
+
+    try:
+        offset = max(int(before), 0)
+    except (TypeError, ValueError):
+        offset = 0
+
+    limit = min(per_page + 1, MAX_RESULTS - offset)
+    if limit <= 0:
+        return Page([], None)
+
+    messages = (Message
+                .query
+                .options(joinedload(Message.user))
+                .join(candidates, candidates.c.id == Message.id)
+                .order_by(candidates.c.rank.desc(), Message.id.desc())
+                .offset(offset)
+                .limit(limit)
+                .all())
+
+    if len(messages) > per_page:
+        return Page(messages[:per_page], str(offset + per_page))
+
+    return Page(messages, None)
+
+
+def reindex_messages(batch_size=10000):
+    """Recompute every message's search vector, committing after each batch
+    of `batch_size` ids, then refresh the planner's statistics. Returns the
+    number of messages reindexed."""
+
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return 0
+
+    last_id = db.session.query(func.max(Message.id)).scalar() or 0
+    count = 0
+
+    for start in range(0, last_id, batch_size):
+        result = db.session.execute(
+            "UPDATE messages "
+            "SET search_vector = to_tsvector(:config, text) "
+            "WHERE id > :start AND id <= :end",
+            {'config': MESSAGE_SEARCH_CONFIG, 'start': start,
+             'end': start + batch_size})
+        db.session.commit()
+        count += result.rowcount
+
+    db.session.execute("ANALYZE messages")
+    db.session.commit()
+    return count
@@ -0,0 +1,20 @@
+-- Precomputed home timelines (see timelines.py), as first added; later
+-- migrations change the timestamp type and the index. Once all of them
+-- have run, fill the timelines in with:
+--
+--    flask rebuild-timelines
+
+BEGIN;
+
+CREATE TABLE timeline_entries (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    message_id INTEGER NOT NULL REFERENCES messages (id) ON DELETE CASCADE,
+    author_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    timestamp VARCHAR NOT NULL,
+    PRIMARY KEY (user_id, message_id)
+);
+
+CREATE INDEX ix_timeline_entries_user_id_timestamp
+    ON timeline_entries (user_id, timestamp);
+
+COMMIT;
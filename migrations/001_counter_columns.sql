@@ -0,0 +1,18 @@
+-- Denormalized counters on users and messages.
+--
+-- After running this, fill them in with:
+--
+--    flask reconcile-counters
+
+BEGIN;
+
+ALTER TABLE users
+    ADD COLUMN messages_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN followers_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN following_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN likes_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE messages
+    ADD COLUMN likes_count INTEGER NOT NULL DEFAULT 0;
+
+COMMIT;
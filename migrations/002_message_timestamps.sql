@@ -0,0 +1,24 @@
+-- Store message timestamps as timestamptz instead of text, and index them.
+--
+-- Existing values are parsed by Postgres; values without an offset (like the
+-- ones in generator/messages.csv) are read in the server's TimeZone.
+
+BEGIN;
+
+ALTER TABLE messages
+    ALTER COLUMN timestamp TYPE TIMESTAMP WITH TIME ZONE
+    USING timestamp::timestamptz;
+
+ALTER TABLE timeline_entries
+    ALTER COLUMN timestamp TYPE TIMESTAMP WITH TIME ZONE
+    USING timestamp::timestamptz;
+
+COMMIT;
+
+-- Built outside the transaction so writes aren't blocked while they build.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_user_id_timestamp
+    ON messages (user_id, timestamp DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_timestamp
+    ON messages (timestamp DESC);
@@ -0,0 +1,20 @@
+-- Add the id tie-breaker to the ordering indexes so (timestamp, id) page
+-- cursors are a single index range scan. Run outside a transaction.
+
+CREATE INDEX CONCURRENTLY ix_messages_user_id_timestamp_id
+    ON messages (user_id, timestamp DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS ix_messages_user_id_timestamp;
+ALTER INDEX ix_messages_user_id_timestamp_id
+    RENAME TO ix_messages_user_id_timestamp;
+
+CREATE INDEX CONCURRENTLY ix_messages_timestamp_id
+    ON messages (timestamp DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS ix_messages_timestamp;
+ALTER INDEX ix_messages_timestamp_id
+    RENAME TO ix_messages_timestamp;
+
+CREATE INDEX CONCURRENTLY ix_timeline_entries_user_id_timestamp_id
+    ON timeline_entries (user_id, timestamp DESC, message_id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS ix_timeline_entries_user_id_timestamp;
+ALTER INDEX ix_timeline_entries_user_id_timestamp_id
+    RENAME TO ix_timeline_entries_user_id_timestamp;
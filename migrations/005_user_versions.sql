@@ -0,0 +1,5 @@
+-- Version stamp on users, bumped whenever anything on their profile changes.
+-- Page ETags are built from it (see caching.py).
+
+ALTER TABLE users
+    ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,15 @@
+-- Likes were unique on message_id alone, so only one user could ever like a
+-- given message. Make them unique per (user_id, message_id) instead, and
+-- keep an index on message_id for cascades and recounts. Run outside a
+-- transaction.
+
+CREATE UNIQUE INDEX CONCURRENTLY uq_likes_user_id_message_id
+    ON likes (user_id, message_id);
+
+CREATE INDEX CONCURRENTLY ix_likes_message_id
+    ON likes (message_id);
+
+ALTER TABLE likes
+    ADD CONSTRAINT uq_likes_user_id_message_id
+        UNIQUE USING INDEX uq_likes_user_id_message_id,
+    DROP CONSTRAINT likes_message_id_key;
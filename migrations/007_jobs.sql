@@ -0,0 +1,14 @@
+-- Outbox of follow-up work for writes, drained by `flask run-jobs` (see
+-- jobs.py).
+
+CREATE TABLE jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    last_error TEXT,
+    failed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX ix_jobs_run_at ON jobs (run_at);
@@ -0,0 +1,5 @@
+-- Deleted accounts are marked first and purged in the background (see
+-- purge.py).
+
+ALTER TABLE users
+    ADD COLUMN deleted_at TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,14 @@
+-- Full-text search over messages (see message_search.py). The trigger keeps
+-- new and edited messages indexed; fill in the existing ones afterwards with
+-- `flask reindex-messages`. Run outside a transaction.
+
+ALTER TABLE messages
+    ADD COLUMN search_vector tsvector;
+
+CREATE TRIGGER messages_search_vector_update
+    BEFORE INSERT OR UPDATE OF text ON messages FOR EACH ROW
+    EXECUTE PROCEDURE tsvector_update_trigger(
+        search_vector, 'pg_catalog.english', text);
+
+CREATE INDEX CONCURRENTLY ix_messages_search_vector
+    ON messages USING gin (search_vector);
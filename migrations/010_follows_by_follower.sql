@@ -0,0 +1,5 @@
+-- Who a user follows: home timelines look up the celebrities a reader
+-- follows on every read (see timelines.py). Run outside a transaction.
+
+CREATE INDEX CONCURRENTLY ix_follows_user_following_id
+    ON follows (user_following_id, user_being_followed_id);
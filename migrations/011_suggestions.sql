@@ -0,0 +1,13 @@
+-- Precomputed "who to follow" suggestions (see recommendations.py); fill
+-- them in afterwards with `flask refresh-suggestions`.
+
+CREATE TABLE suggestions (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    suggested_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    mutuals INTEGER NOT NULL,
+    PRIMARY KEY (user_id, suggested_id)
+);
+
+CREATE INDEX ix_suggestions_user_id_mutuals
+    ON suggestions (user_id, mutuals DESC, suggested_id);
+CREATE INDEX ix_suggestions_suggested_id ON suggestions (suggested_id);
@@ -0,0 +1,10 @@
+-- Time-bucketed like and hashtag counts behind the trending panel (see
+-- trending.py). They start filling in as soon as the code is deployed.
+
+CREATE TABLE trending_counts (
+    kind VARCHAR(16) NOT NULL,
+    bucket INTEGER NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, bucket, key)
+);
@@ -0,0 +1,9 @@
+-- Whether each user's messages are pushed to their followers or merged in on
+-- read is now stored on the user (see timelines.py). This marks everyone at
+-- or over the default CELEBRITY_FOLLOWERS; with another setting, run
+-- `flask rebuild-timelines` afterwards, which resets the flag from it.
+
+ALTER TABLE users
+    ADD COLUMN celebrity BOOLEAN NOT NULL DEFAULT false;
+
+UPDATE users SET celebrity = true WHERE followers_count >= 10000;
@@ -0,0 +1,8 @@
+-- How many messages have been pushed into each home timeline since it was
+-- last trimmed (see timelines.py). Timelines without a row start counting
+-- from zero, so one already too long is trimmed within TRIM_EVERY pushes.
+
+CREATE TABLE timeline_trims (
+    user_id INTEGER PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+    pushed INTEGER NOT NULL
+);
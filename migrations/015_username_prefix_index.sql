@@ -0,0 +1,5 @@
+-- Prefix index for user search on a Postgres without pg_trgm (see
+-- search.py). Run outside a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_prefix
+    ON users (lower(username) text_pattern_ops);
@@ -1,10 +1,12 @@
 """SQLAlchemy models for Warbler."""
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.sql import func
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+from database import RoutingSQLAlchemy
+from hashing import hash_password, check_password, needs_rehash
+
+db = RoutingSQLAlchemy()
 
 
 class Follows(db.Model):
@@ -24,6 +26,12 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    # the primary key finds a user's followers; this finds who they follow
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 user_following_id, user_being_followed_id),
+    )
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
@@ -43,7 +51,14 @@ class Likes(db.Model):
     message_id = db.Column(
         db.Integer,
         db.ForeignKey('messages.id', ondelete='cascade'),
-        unique=True
+        index=True
+    )
+
+    # a user likes a message at most once; also serves "which of these
+    # messages has this user liked?" (see likes.py)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'message_id',
+                            name='uq_likes_user_id_message_id'),
     )
 
 
@@ -92,25 +107,84 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message')
+    # denormalized counts, kept up to date by counters.py
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # goes up whenever anything shown on the profile changes; pages are
+    # cached against it (see caching.py)
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # whether the user's messages are merged into their followers' home
+    # timelines on read instead of pushed on write (see timelines.py)
+    celebrity = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default='false',
+    )
+
+    # set when the account is deleted; its rows are then purged in the
+    # background and the user row goes last (see purge.py)
+    deleted_at = db.Column(
+        db.DateTime(timezone=True),
+    )
+
+    # the database cascades deletes to these, so the ORM never needs to load
+    # them to delete a user
+    messages = db.relationship('Message', passive_deletes=True)
 
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
+        secondaryjoin=(Follows.user_following_id == id),
+        passive_deletes=True
     )
 
     following = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
+        secondaryjoin=(Follows.user_being_followed_id == id),
+        passive_deletes=True
     )
 
     likes = db.relationship(
         'Message',
-        secondary="likes"
+        secondary="likes",
+        passive_deletes=True
     )
 
     def __repr__(self):
@@ -119,14 +193,28 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.query.get((self.id, other_user.id)) is not None
 
     def is_following(self, other_user):
         """Is this user following `other_user`?"""
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.query.get((other_user.id, self.id)) is not None
+
+    def following_among(self, user_ids):
+        """Which of `user_ids` is this user following? Returns a set.
+
+        One query however many ids are asked about.
+        """
+
+        if not user_ids:
+            return set()
+
+        followed = (db.session
+                    .query(Follows.user_being_followed_id)
+                    .filter(Follows.user_following_id == self.id,
+                            Follows.user_being_followed_id.in_(user_ids)))
+
+        return {user_id for (user_id,) in followed}
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -135,7 +223,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hash_password(password)
 
         user = User(
             username=username,
@@ -156,18 +244,53 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the password was hashed at a different cost than the one now
+        configured, it's rehashed; the caller commits that change.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = (cls
+                .query
+                .filter_by(username=username, deleted_at=None)
+                .first())
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = check_password(user.password, password)
             if is_auth:
+                log_rounds = db.get_app().config['BCRYPT_LOG_ROUNDS']
+                if needs_rehash(user.password, log_rounds):
+                    user.password = hash_password(password)
                 return user
 
         return False
 
 
+@event.listens_for(User.__table__, 'after_create')
+def create_username_search_index(target, connection, **kw):
+    """Index usernames for search (see search.py).
+
+    On Postgres, lower(username) is indexed for prefix matching and, where
+    the pg_trgm extension is available, username by trigram. Anywhere else
+    search falls back to an in-process index.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute(
+        "CREATE INDEX ix_users_username_prefix "
+        "ON users (lower(username) text_pattern_ops)")
+
+    try:
+        with connection.begin_nested():
+            connection.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            connection.execute(
+                "CREATE INDEX ix_users_username_trgm "
+                "ON users USING gin (username gin_trgm_ops)")
+    except DBAPIError:
+        pass
+
+
 class Message(db.Model):
     """An individual message ("warble")."""
 
@@ -189,7 +312,7 @@ class Message(db.Model):
     )
     
     timestamp = db.Column(
-        db.String,
+        db.DateTime(timezone=True),
         nullable=False,
     )
 
@@ -199,8 +322,216 @@ class Message(db.Model):
         nullable=False,
     )
 
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
     user = db.relationship('User')
 
+    # profile pages read one user's newest messages and timelines read the
+    # newest messages overall; both are top-N scans of these indexes. The id
+    # breaks ties in timestamps and is the second half of a page cursor.
+    __table_args__ = (
+        db.Index('ix_messages_user_id_timestamp',
+                 user_id, timestamp.desc(), id.desc()),
+        db.Index('ix_messages_timestamp', timestamp.desc(), id.desc()),
+    )
+
+
+# text search configuration used for message search (see message_search.py)
+MESSAGE_SEARCH_CONFIG = 'english'
+
+
+@event.listens_for(Message.__table__, 'after_create')
+def create_message_search_index(target, connection, **kw):
+    """Give messages a full-text search vector, kept current by a trigger and
+    indexed with GIN (see message_search.py). Postgres only; elsewhere message
+    search falls back to substring matching.
+
+    The column isn't mapped, so loading messages never reads it.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute("ALTER TABLE messages ADD COLUMN search_vector tsvector")
+    connection.execute(
+        "CREATE TRIGGER messages_search_vector_update "
+        "BEFORE INSERT OR UPDATE OF text ON messages FOR EACH ROW "
+        "EXECUTE PROCEDURE tsvector_update_trigger("
+        f"search_vector, 'pg_catalog.{MESSAGE_SEARCH_CONFIG}', text)")
+    connection.execute(
+        "CREATE INDEX ix_messages_search_vector "
+        "ON messages USING gin (search_vector)")
+
+
+class TimelineEntry(db.Model):
+    """A message pushed into a follower's precomputed home timeline."""
+
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    # copied from the message so the timeline can be read in index order
+    # without touching the messages table
+    timestamp = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_timestamp',
+                 user_id, timestamp.desc(), message_id.desc()),
+    )
+
+
+class TimelineTrim(db.Model):
+    """How far a home timeline may have grown past its length."""
+
+    __tablename__ = 'timeline_trims'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    # messages pushed into the timeline since it was last trimmed
+    pushed = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+
+class Job(db.Model):
+    """Follow-up work for a write, queued in the same transaction (see jobs.py)."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    kind = db.Column(
+        db.String(50),
+        nullable=False,
+    )
+
+    payload = db.Column(
+        db.JSON,
+        nullable=False,
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # not before this time; pushed back after each failed attempt
+    run_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    # set once a job has used up its attempts; it is then left for a person
+    failed_at = db.Column(
+        db.DateTime(timezone=True),
+    )
+
+    __table_args__ = (
+        db.Index('ix_jobs_run_at', run_at),
+    )
+
+
+class Suggestion(db.Model):
+    """Someone a user might follow, precomputed (see recommendations.py)."""
+
+    __tablename__ = 'suggestions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    suggested_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    # how many of the people the user follows follow the suggested user
+    mutuals = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    # a user's suggestions are read best first; the second index finds the
+    # rows pointing at a user whose account is being purged
+    __table_args__ = (
+        db.Index('ix_suggestions_user_id_mutuals',
+                 user_id, mutuals.desc(), suggested_id),
+        db.Index('ix_suggestions_suggested_id', suggested_id),
+    )
+
+
+class TrendingCount(db.Model):
+    """How often a message was liked, or a hashtag used, in one time bucket
+    (see trending.py)."""
+
+    __tablename__ = 'trending_counts'
+
+    # 'message' (the key is a message id) or 'hashtag'
+    kind = db.Column(
+        db.String(16),
+        primary_key=True,
+    )
+
+    # time since the epoch // BUCKET_SECONDS
+    bucket = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    key = db.Column(
+        db.String(100),
+        primary_key=True,
+    )
+
+    count = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
@@ -210,3 +541,4 @@ def connect_db(app):
 
     db.app = app
     db.init_app(app)
+
@@ -0,0 +1,97 @@
+"""Keyset (cursor) pagination for Warbler's list pages.
+
+Message lists are ordered newest first by (timestamp, id). The cursor for
+the next page is the key of the last row shown, and the next page is every
+row strictly before that key, so fetching page 1000 is the same index range
+scan as fetching page 1 -- no OFFSET.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import tuple_
+
+PAGE_SIZE = 20
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(timestamp, id):
+    """Turn a (timestamp, id) key into a URL-safe cursor string."""
+
+    # SQLite hands back timestamps without their offset, which are UTC
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+    return f"{(timestamp - EPOCH) // MICROSECOND}_{id}"
+
+
+def decode_cursor(cursor):
+    """Turn a cursor string back into a (timestamp, id) key.
+
+    Returns None if there's no cursor or it isn't one of ours.
+    """
+
+    try:
+        micros, id = cursor.split('_')
+        return EPOCH + int(micros) * MICROSECOND, int(id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def keyset_rows(query, timestamp_col, id_col, before=None, limit=PAGE_SIZE):
+    """Return up to `limit` rows of `query` before the `before` cursor,
+    ordered by `timestamp_col`, `id_col` descending."""
+
+    key = decode_cursor(before)
+    if key:
+        query = query.filter(tuple_(timestamp_col, id_col) < tuple_(*key))
+
+    return (query
+            .order_by(timestamp_col.desc(), id_col.desc())
+            .limit(limit)
+            .all())
+
+
+def keyset_page(query, timestamp_col, id_col, before=None, per_page=PAGE_SIZE):
+    """Return the page of `query` that comes just before the `before` cursor.
+
+    Rows are ordered by `timestamp_col`, `id_col` descending; the items are
+    expected to have `timestamp` and `id` attributes matching those columns.
+    """
+
+    rows = keyset_rows(query, timestamp_col, id_col, before, per_page + 1)
+
+    return keyset_page_of(rows, per_page)
+
+
+def keyset_page_of(rows, per_page=PAGE_SIZE):
+    """Build a Page from up to `per_page` + 1 rows already in keyset order."""
+
+    return _page(rows, per_page, lambda row: encode_cursor(row.timestamp, row.id))
+
+
+def id_page(query, id_col, before=None, per_page=PAGE_SIZE):
+    """Return the page of `query`, ordered by `id_col` descending, before `before`."""
+
+    try:
+        query = query.filter(id_col < int(before))
+    except (TypeError, ValueError):
+        pass
+
+    rows = query.order_by(id_col.desc()).limit(per_page + 1).all()
+
+    return _page(rows, per_page, lambda row: str(row.id))
+
+
+def _page(rows, per_page, cursor_for):
+    """Build a Page from `per_page` + 1 rows: the extra one means there's more."""
+
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return Page(rows, cursor_for(rows[-1]))
+
+    return Page(rows, None)
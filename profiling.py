@@ -0,0 +1,178 @@
+"""Per-request SQL and render profiling.
+
+For every request we record how many SQL statements ran and how long they
+took, the slowest few statements, how long Jinja spent rendering and how
+many ORM objects were loaded, plus any timings code records along the way
+with `record_timing` (e.g. how a home timeline was assembled). It comes out
+three ways:
+
+* a `Server-Timing` response header, shown in the browser's dev tools;
+* a JSON line on the `warbler.profile` logger for a sample of requests
+  (PROFILE_SAMPLE_RATE) and every request slower than PROFILE_SLOW_MS;
+* `/_debug/profile`, listing the most recent requests -- only outside
+  production.
+"""
+
+import json
+import logging
+import random
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+SLOWEST_STATEMENTS = 5
+RECENT_PROFILES = 100
+
+logger = logging.getLogger('warbler.profile')
+
+recent_profiles = deque(maxlen=RECENT_PROFILES)
+
+
+class RequestProfile:
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = []
+        self.render_time = 0.0
+        self.objects_loaded = 0
+        self.render_started = None
+        self.timings = []
+
+    def add_statement(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+
+        self.statements.append((elapsed, statement))
+        if len(self.statements) > SLOWEST_STATEMENTS:
+            self.statements.sort(reverse=True)
+            self.statements.pop()
+
+    def server_timing(self, total):
+        recorded = ''
+        for name, elapsed, details in self.timings:
+            desc = ' '.join(f'{key}={value}' for key, value in details.items())
+            recorded += f'{name};dur={elapsed * 1000:.1f};desc="{desc}", '
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'render;dur={self.render_time * 1000:.1f}, '
+                f'{recorded}total;dur={total * 1000:.1f}')
+
+    def to_dict(self, total):
+        return {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'total_ms': round(total * 1000, 1),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'objects_loaded': self.objects_loaded,
+            'timings': {name: dict(details, ms=round(elapsed * 1000, 1))
+                        for name, elapsed, details in self.timings},
+            'slowest': [{'ms': round(elapsed * 1000, 1),
+                         'statement': statement[:300]}
+                        for elapsed, statement in sorted(self.statements,
+                                                         reverse=True)],
+        }
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('profile')
+    return None
+
+
+def record_timing(name, elapsed, **details):
+    """Add a named timing (seconds) to the current request's profile."""
+
+    profile = _current_profile()
+    if profile is not None:
+        profile.timings.append((name, elapsed, details))
+
+
+##############################################################################
+# SQL, template and ORM hooks
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['profile_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    profile = _current_profile()
+    if profile is not None:
+        elapsed = time.perf_counter() - conn.info['profile_started']
+        profile.add_statement(statement, elapsed)
+
+
+def _before_render(app, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile.render_started = time.perf_counter()
+
+
+def _after_render(app, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile.render_started is not None:
+        profile.render_time += time.perf_counter() - profile.render_started
+        profile.render_started = None
+
+
+def _object_loaded(target, context):
+    profile = _current_profile()
+    if profile is not None:
+        profile.objects_loaded += 1
+
+
+##############################################################################
+# Wiring it up
+
+
+def init_profiling(app):
+    """Profile every request `app` handles."""
+
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.01)
+    app.config.setdefault('PROFILE_SLOW_MS', 500)
+
+    # every engine, so statements sent to a read replica count too
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(db.Model, 'load', _object_loaded, propagate=True)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_profile():
+        g.profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(resp):
+        profile = g.get('profile')
+        if profile is None:
+            return resp
+
+        total = time.perf_counter() - profile.started
+        resp.headers['Server-Timing'] = profile.server_timing(total)
+
+        if request.endpoint == 'debug_profile':
+            return resp
+
+        summary = profile.to_dict(total)
+        recent_profiles.append(summary)
+
+        if (summary['total_ms'] >= app.config['PROFILE_SLOW_MS'] or
+                random.random() < app.config['PROFILE_SAMPLE_RATE']):
+            logger.info(json.dumps(summary))
+
+        return resp
@@ -0,0 +1,208 @@
+"""Deleting accounts.
+
+Deleting a prolific account in one go cascades through all of its messages,
+likes, follows and timeline entries at once, holding locks for as long as
+that takes. Instead `soft_delete_user` only marks the account deleted. From
+then on it can't log in and is left out of timelines, the user list and
+search. `purge_user` jobs (see jobs.py) then remove the account's rows in
+batches of PURGE_BATCH_SIZE, one batch per job, releasing the counters they
+held on other users and messages as they go. Once nothing else
+is left it deletes the user row itself. Progress is logged on the
+`warbler.purge` logger.
+"""
+
+import logging
+from collections import Counter, defaultdict
+
+from sqlalchemy import func, or_, tuple_
+
+from models import db, Follows, Likes, Message, Suggestion, TimelineEntry, User
+
+PURGE_BATCH_SIZE = 1000
+
+logger = logging.getLogger('warbler.purge')
+
+
+def soft_delete_user(user_id):
+    """Mark a user deleted; their rows are purged later."""
+
+    (User
+     .query
+     .filter(User.id == user_id)
+     .update({User.deleted_at: func.now(), User.version: User.version + 1},
+             synchronize_session=False))
+
+
+def _take(query, batch_size):
+    return [row[0] for row in query.limit(batch_size)]
+
+
+def _decrement(model, column, ids, amount=1):
+    """Take `amount` off `column` on the `ids` rows of `model`."""
+
+    values = {column: column - amount}
+    if model is User:
+        values[User.version] = User.version + 1
+
+    (model
+     .query
+     .filter(model.id.in_(ids))
+     .update(values, synchronize_session=False))
+
+
+def _purge_following(user_id, batch_size):
+    followed = _take(db.session
+                     .query(Follows.user_being_followed_id)
+                     .filter(Follows.user_following_id == user_id),
+                     batch_size)
+    if followed:
+        _decrement(User, User.followers_count, followed)
+        (Follows
+         .query
+         .filter(Follows.user_following_id == user_id,
+                 Follows.user_being_followed_id.in_(followed))
+         .delete(synchronize_session=False))
+    return len(followed)
+
+
+def _purge_followers(user_id, batch_size):
+    followers = _take(db.session
+                      .query(Follows.user_following_id)
+                      .filter(Follows.user_being_followed_id == user_id),
+                      batch_size)
+    if followers:
+        _decrement(User, User.following_count, followers)
+        (Follows
+         .query
+         .filter(Follows.user_being_followed_id == user_id,
+                 Follows.user_following_id.in_(followers))
+         .delete(synchronize_session=False))
+    return len(followers)
+
+
+def _purge_likes(user_id, batch_size):
+    liked = _take(db.session
+                  .query(Likes.message_id)
+                  .filter(Likes.user_id == user_id),
+                  batch_size)
+    if liked:
+        _decrement(Message, Message.likes_count, liked)
+        (Likes
+         .query
+         .filter(Likes.user_id == user_id, Likes.message_id.in_(liked))
+         .delete(synchronize_session=False))
+    return len(liked)
+
+
+def _purge_timeline_entries(user_id, batch_size):
+    # entries in other users' timelines, then the user's own timeline
+    entries = (db.session
+               .query(TimelineEntry.user_id, TimelineEntry.message_id)
+               .filter(TimelineEntry.author_id == user_id)
+               .limit(batch_size)
+               .all())
+    if not entries:
+        entries = (db.session
+                   .query(TimelineEntry.user_id, TimelineEntry.message_id)
+                   .filter(TimelineEntry.user_id == user_id)
+                   .limit(batch_size)
+                   .all())
+    if entries:
+        (TimelineEntry
+         .query
+         .filter(tuple_(TimelineEntry.user_id,
+                        TimelineEntry.message_id).in_(entries))
+         .delete(synchronize_session=False))
+    return len(entries)
+
+
+def _purge_suggestions(user_id, batch_size):
+    # suggestions made to the user, and of the user to others
+    pairs = (db.session
+             .query(Suggestion.user_id, Suggestion.suggested_id)
+             .filter(or_(Suggestion.user_id == user_id,
+                         Suggestion.suggested_id == user_id))
+             .limit(batch_size)
+             .all())
+    if pairs:
+        (Suggestion
+         .query
+         .filter(tuple_(Suggestion.user_id,
+                        Suggestion.suggested_id).in_(pairs))
+         .delete(synchronize_session=False))
+    return len(pairs)
+
+
+def _purge_likes_received(user_id, batch_size):
+    likes = (db.session
+             .query(Likes.id, Likes.user_id)
+             .join(Message, Message.id == Likes.message_id)
+             .filter(Message.user_id == user_id)
+             .limit(batch_size)
+             .all())
+    if likes:
+        # a user may have liked several of these; group them by how many
+        by_amount = defaultdict(list)
+        for liker, amount in Counter(liker for _, liker in likes).items():
+            by_amount[amount].append(liker)
+        for amount, likers in by_amount.items():
+            _decrement(User, User.likes_count, likers, amount)
+
+        (Likes
+         .query
+         .filter(Likes.id.in_([like_id for like_id, _ in likes]))
+         .delete(synchronize_session=False))
+    return len(likes)
+
+
+def _purge_messages(user_id, batch_size):
+    messages = _take(db.session
+                     .query(Message.id)
+                     .filter(Message.user_id == user_id),
+                     batch_size)
+    if messages:
+        (Message
+         .query
+         .filter(Message.id.in_(messages))
+         .delete(synchronize_session=False))
+    return len(messages)
+
+
+# in order: relationships first, so nothing is left for the database to
+# cascade through when the messages and finally the user row go
+PURGE_STEPS = [
+    ('follows', _purge_following),
+    ('followers', _purge_followers),
+    ('likes', _purge_likes),
+    ('timeline entries', _purge_timeline_entries),
+    ('suggestions', _purge_suggestions),
+    ('likes received', _purge_likes_received),
+    ('messages', _purge_messages),
+]
+
+
+def purge_batch(user_id, purged=0, batch_size=PURGE_BATCH_SIZE):
+    """Remove the next batch of a deleted user's rows.
+
+    Returns the number of rows removed; 0 once the user row itself is gone.
+    `purged` is how many were removed before, for the progress log. Users
+    that aren't marked deleted are left alone.
+    """
+
+    deleted = (db.session
+               .query(User.id)
+               .filter(User.id == user_id, User.deleted_at.isnot(None))
+               .first())
+    if deleted is None:
+        return 0
+
+    for name, step in PURGE_STEPS:
+        removed = step(user_id, batch_size)
+        if removed:
+            logger.info("purging user %s: removed %s %s (%s rows so far)",
+                        user_id, removed, name, purged + removed)
+            return removed
+
+    User.query.filter(User.id == user_id).delete(synchronize_session=False)
+    logger.info("purged user %s (%s rows)", user_id, purged + 1)
+    return 0
@@ -0,0 +1,114 @@
+"""Read queries shared by Warbler's views.
+
+Each function loads everything its template renders up front: message
+authors are eager-loaded alongside the messages, profile stats come from
+counters on the user row and follower lists from the follow graph, rather
+than from loading whole relationships.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy.orm import contains_eager
+
+from follow_graph import follow_graph
+from models import Likes, Message, User
+from pagination import PAGE_SIZE, Page, keyset_page, id_page
+from search import search_users
+
+UserStats = namedtuple('UserStats', ['messages', 'following', 'followers', 'likes'])
+
+
+def user_stats(user):
+    """Return the message/following/followers/likes counts for a user.
+
+    These are the denormalized counters on the user's row (see counters.py),
+    so no extra query is needed.
+    """
+
+    return UserStats(user.messages_count, user.following_count,
+                     user.followers_count, user.likes_count)
+
+
+def user_messages(user_id, before=None, per_page=PAGE_SIZE):
+    """Return a page of a user's messages, newest first, authors included."""
+
+    query = (Message
+             .query
+             .join(User, User.id == Message.user_id)
+             .options(contains_eager(Message.user))
+             .filter(Message.user_id == user_id, User.deleted_at.is_(None)))
+
+    return keyset_page(query, Message.timestamp, Message.id, before, per_page)
+
+
+def liked_messages(user_id, before=None, per_page=PAGE_SIZE):
+    """Return a page of the messages a user has liked, authors included."""
+
+    query = (Message
+             .query
+             .join(User, User.id == Message.user_id)
+             .options(contains_eager(Message.user))
+             .join(Likes, Likes.message_id == Message.id)
+             .filter(Likes.user_id == user_id, User.deleted_at.is_(None)))
+
+    return keyset_page(query, Message.timestamp, Message.id, before, per_page)
+
+
+def user_directory(search=None, before=None, per_page=PAGE_SIZE):
+    """Return a page of users: search results for `search` if given (best
+    match first, see search.py), otherwise everyone, newest first."""
+
+    if search:
+        return search_users(search, before, per_page)
+
+    query = User.query.filter(User.deleted_at.is_(None))
+    return id_page(query, User.id, before, per_page)
+
+
+def user_followers(user_id, before=None, per_page=PAGE_SIZE):
+    """Return a page of the users following `user_id`, newest users first."""
+
+    return _users_page(follow_graph.followers_page(user_id, before, per_page))
+
+
+def user_following(user_id, before=None, per_page=PAGE_SIZE):
+    """Return a page of the users `user_id` follows, newest users first."""
+
+    return _users_page(follow_graph.following_page(user_id, before, per_page))
+
+
+def _users_page(page):
+    """Load the users of a page of ids from the follow graph (see
+    follow_graph.py), leaving out deleted accounts."""
+
+    if not page.items:
+        return page
+
+    users = {user.id: user for user in
+             User
+             .query
+             .filter(User.id.in_(page.items), User.deleted_at.is_(None))}
+
+    return Page([users[user_id] for user_id in page.items if user_id in users],
+                page.next_cursor)
+
+
+def get_user(user_id):
+    """Return a user, or None (also if they have deleted their account)."""
+
+    return (User
+            .query
+            .filter(User.id == user_id, User.deleted_at.is_(None))
+            .first())
+
+
+def get_message(message_id):
+    """Return a message with its author, or None (also if the author has
+    deleted their account)."""
+
+    return (Message
+            .query
+            .join(User, User.id == Message.user_id)
+            .options(contains_eager(Message.user))
+            .filter(Message.id == message_id, User.deleted_at.is_(None))
+            .first())
@@ -0,0 +1,254 @@
+"""Who to follow.
+
+A user's suggestions are friends of friends: people followed by the people
+they follow, scored by how many of those follow them ("mutuals"), leaving
+out anyone they already follow, themselves and deleted accounts. The best
+SUGGESTIONS_PER_USER are stored in `suggestions`, so the homepage widget
+and /users/suggestions read them with one short index range scan.
+
+`flask refresh-suggestions` recomputes everyone's in batches of user ids.
+With NumPy and SciPy installed (`pip install numpy scipy`) each batch is a
+sparse matrix product: with A the follow graph's adjacency matrix (A[u, v]
+is 1 when u follows v), row u of A @ A counts the two-step paths from u to
+everyone else. Without them the same counts are taken user by user in
+Python, which is fine for a small site.
+
+Following or unfollowing someone queues a `refresh_suggestions` job that
+recomputes just that user's suggestions in SQL. How the change affects
+other users' suggestions waits for the next batch run.
+"""
+
+import heapq
+import io
+from array import array
+from collections import Counter, defaultdict
+
+from sqlalchemy import exists, func
+from sqlalchemy.orm import aliased
+
+from models import db, Follows, Suggestion, User
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+SUGGESTIONS_PER_USER = 20
+REFRESH_BATCH_SIZE = 5000
+
+
+##############################################################################
+# Reading and updating stored suggestions
+
+
+def suggestions_for(user_id, limit=SUGGESTIONS_PER_USER):
+    """A user's stored suggestions, best first, as (User, mutuals) pairs."""
+
+    return (db.session
+            .query(User, Suggestion.mutuals)
+            .join(Suggestion, Suggestion.suggested_id == User.id)
+            .filter(Suggestion.user_id == user_id, User.deleted_at.is_(None))
+            .order_by(Suggestion.mutuals.desc(), Suggestion.suggested_id)
+            .limit(limit)
+            .all())
+
+
+def drop_suggestion(user_id, suggested_id):
+    """Stop suggesting `suggested_id` to `user_id`, who now follows them."""
+
+    (Suggestion
+     .query
+     .filter(Suggestion.user_id == user_id,
+             Suggestion.suggested_id == suggested_id)
+     .delete(synchronize_session=False))
+
+
+def refresh_user_suggestions(user_id, per_user=SUGGESTIONS_PER_USER):
+    """Recompute one user's suggestions in SQL; returns how many there are."""
+
+    first, second, mine = aliased(Follows), aliased(Follows), aliased(Follows)
+    candidate = second.user_being_followed_id
+    mutuals = func.count().label('mutuals')
+
+    already_following = (exists()
+                         .where(mine.user_following_id == user_id)
+                         .where(mine.user_being_followed_id == candidate))
+
+    best = (db.session
+            .query(candidate, mutuals)
+            .select_from(first)
+            .join(second, second.user_following_id == first.user_being_followed_id)
+            .join(User, User.id == candidate)
+            .filter(first.user_following_id == user_id,
+                    candidate != user_id,
+                    ~already_following,
+                    User.deleted_at.is_(None))
+            .group_by(candidate)
+            .order_by(mutuals.desc(), candidate)
+            .limit(per_user)
+            .all())
+
+    _store(Suggestion.user_id == user_id,
+           [(user_id, suggested_id, count) for suggested_id, count in best])
+    return len(best)
+
+
+def refresh_suggestions(batch_size=REFRESH_BATCH_SIZE,
+                        per_user=SUGGESTIONS_PER_USER):
+    """Recompute every user's suggestions from the whole follow graph,
+    committing after each batch of `batch_size` user ids.
+
+    Returns the number of suggestions stored.
+    """
+
+    followers, followed = read_edges()
+    deleted = [user_id for (user_id,) in
+               db.session.query(User.id).filter(User.deleted_at.isnot(None))]
+    users = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+
+    compute = sparse_suggestions if sparse is not None else python_suggestions
+
+    stored = 0
+    for start, stop, rows in compute(followers, followed, users, deleted,
+                                     batch_size, per_user):
+        stored += _store(Suggestion.user_id.between(start, stop - 1), rows)
+        db.session.commit()
+
+    return stored
+
+
+def read_edges():
+    """(followers, followed) id sequences of every follow."""
+
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        edges = db.session.query(Follows.user_following_id,
+                                 Follows.user_being_followed_id).all()
+        return [u for u, _ in edges], [v for _, v in edges]
+
+    # COPY is several times faster than fetching rows one at a time
+    buffer = io.StringIO()
+    connection.connection.cursor().copy_expert(
+        "COPY follows (user_following_id, user_being_followed_id) TO STDOUT",
+        buffer)
+
+    if np is not None:
+        ids = np.fromstring(buffer.getvalue(), dtype=np.int32, sep=' ')
+    else:
+        ids = array('i', map(int, buffer.getvalue().split()))
+
+    return ids[0::2], ids[1::2]
+
+
+def _store(users, rows):
+    """Replace the suggestions of the `users` condition with `rows` of
+    (user_id, suggested_id, mutuals); returns how many were stored."""
+
+    Suggestion.query.filter(users).delete(synchronize_session=False)
+
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        data = io.StringIO(''.join(f"{user_id}\t{suggested_id}\t{mutuals}\n"
+                                   for user_id, suggested_id, mutuals in rows))
+        connection.connection.cursor().copy_expert(
+            "COPY suggestions (user_id, suggested_id, mutuals) FROM STDIN",
+            data)
+    else:
+        connection.execute(Suggestion.__table__.insert(),
+                           [{'user_id': user_id, 'suggested_id': suggested_id,
+                             'mutuals': mutuals}
+                            for user_id, suggested_id, mutuals in rows])
+
+    return len(rows)
+
+
+##############################################################################
+# Computing suggestions for the whole graph
+#
+# Both take the follow graph as parallel sequences of follower and followed
+# ids, with ids below `users`, and yield (start, stop, rows) for each batch
+# of user ids start <= id < stop, rows being (user_id, suggested_id,
+# mutuals) ordered best first within each user. `starts` picks the batches
+# to compute by their first id; all of them by default.
+
+
+def sparse_suggestions(followers, followed, users, deleted=(),
+                       batch_size=REFRESH_BATCH_SIZE,
+                       per_user=SUGGESTIONS_PER_USER, starts=None):
+    """Suggestions from sparse matrix products (needs NumPy and SciPy)."""
+
+    followers = np.asarray(followers, dtype=np.int32)
+    followed = np.asarray(followed, dtype=np.int32)
+
+    # deleted accounts neither get suggestions, nor count as a mutual, nor
+    # are suggested
+    active = np.ones(users, dtype=np.int32)
+    active[np.asarray(list(deleted), dtype=np.int64)] = 0
+    keep = sparse.diags(active, dtype=np.int32)
+
+    graph = sparse.csr_matrix(
+        (np.ones(len(followers), dtype=np.int32), (followers, followed)),
+        shape=(users, users))
+    graph.data[:] = 1
+    graph = (keep @ graph @ keep).tocsr()
+    graph.eliminate_zeros()
+
+    for start in starts or range(0, users, batch_size):
+        stop = min(start + batch_size, users)
+        rows = graph[start:stop]
+
+        scores = (rows @ graph).tocsr()
+        scores = (scores - scores.multiply(rows)).tocsr()
+
+        row_of = np.repeat(np.arange(stop - start), np.diff(scores.indptr))
+        scores.data[scores.indices == row_of + start] = 0
+        scores.eliminate_zeros()
+
+        # best first within each row: by row, then mutuals down, then id
+        row_of = np.repeat(np.arange(stop - start), np.diff(scores.indptr))
+        order = np.lexsort((scores.indices, -scores.data, row_of))
+        rank = np.arange(len(order)) - scores.indptr[row_of[order]]
+        best = order[rank < per_user]
+
+        yield start, stop, zip((row_of[best] + start).tolist(),
+                               scores.indices[best].tolist(),
+                               scores.data[best].tolist())
+
+
+def python_suggestions(followers, followed, users, deleted=(),
+                       batch_size=REFRESH_BATCH_SIZE,
+                       per_user=SUGGESTIONS_PER_USER, starts=None):
+    """The same suggestions, counted user by user in Python."""
+
+    deleted = set(deleted)
+    following = defaultdict(list)
+    for follower_id, followed_id in zip(followers, followed):
+        if follower_id not in deleted and followed_id not in deleted:
+            following[follower_id].append(followed_id)
+
+    for start in starts or range(0, users, batch_size):
+        stop = min(start + batch_size, users)
+        rows = []
+
+        for user_id in range(start, stop):
+            mine = following.get(user_id)
+            if not mine:
+                continue
+
+            counts = Counter()
+            for followed_id in mine:
+                counts.update(following.get(followed_id, ()))
+            for seen in [user_id, *mine]:
+                counts.pop(seen, None)
+
+            best = heapq.nsmallest(per_user, counts.items(),
+                                   key=lambda item: (-item[1], item[0]))
+            rows.extend((user_id, suggested_id, mutuals)
+                        for suggested_id, mutuals in best)
+
+        yield start, stop, rows
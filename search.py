@@ -0,0 +1,247 @@
+"""User search for Warbler.
+
+Usernames are matched by substring and by trigram similarity (so a typo
+still finds the user) and ranked: exact matches first, then prefix matches,
+then other substring matches, then fuzzy matches, each by similarity.
+
+On Postgres with the pg_trgm index (see models.py) the search runs in SQL.
+A Postgres without pg_trgm only matches by prefix, through an index on
+lower(username). Other databases -- SQLite test runs -- get the full ranking
+from a trigram index kept in process. Either way, callers only use
+`search_users`.
+"""
+
+import heapq
+import re
+from collections import defaultdict
+
+from sqlalchemy import case, event, func, or_
+
+from models import db, User
+from pagination import PAGE_SIZE, Page
+
+# searches never rank or return more than this many users
+MAX_RESULTS = 100
+
+# the in-process index loads at most this many candidates per search, with
+# headroom for ones that turn out deleted or renamed
+MAX_CANDIDATES = 2 * MAX_RESULTS
+
+# pg_trgm's default similarity threshold for fuzzy matches
+SIMILARITY_THRESHOLD = 0.3
+
+# the search backend picked for each engine
+backends = {}
+
+
+def search_users(q, before=None, per_page=PAGE_SIZE):
+    """Return a page of users whose username best matches `q`.
+
+    Results are ranked, so `before` is an offset into the (capped) ranking
+    rather than a keyset cursor.
+    """
+
+    try:
+        offset = max(int(before), 0)
+    except (TypeError, ValueError):
+        offset = 0
+
+    limit = min(per_page + 1, MAX_RESULTS - offset)
+    if not q or limit <= 0:
+        return Page([], None)
+
+    users = _get_backend().search(q, offset, limit)
+
+    if len(users) > per_page:
+        return Page(users[:per_page], str(offset + per_page))
+
+    return Page(users, None)
+
+
+def trigrams(text):
+    """Return the set of trigrams in `text`, padded the way pg_trgm does."""
+
+    found = set()
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f"  {word} "
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+def similarity(a, b):
+    """Return the trigram similarity (0 to 1) of two strings."""
+
+    a, b = trigrams(a), trigrams(b)
+    if not (a or b):
+        return 0
+    return len(a & b) / len(a | b)
+
+
+def _get_backend():
+    """Pick the search backend for the connected database, once."""
+
+    engine = db.engine
+    if engine not in backends:
+        if engine.dialect.name != 'postgresql':
+            backends[engine] = TrigramIndex.from_db()
+        elif _has_trigram_index():
+            backends[engine] = PostgresSearch()
+        else:
+            backends[engine] = PrefixSearch()
+
+    return backends[engine]
+
+
+def _has_trigram_index():
+    found = db.session.execute(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_users_username_trgm'")
+    return found.first() is not None
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PostgresSearch:
+    """Search backed by the pg_trgm GIN index on users.username."""
+
+    def search(self, q, offset, limit):
+        contains = f"%{_escape_like(q)}%"
+        prefix = f"{_escape_like(q)}%"
+
+        rank = case([
+            (func.lower(User.username) == q.lower(), 0),
+            (User.username.ilike(prefix, escape='\\'), 1),
+            (User.username.ilike(contains, escape='\\'), 2),
+        ], else_=3)
+
+        # `%%` is pg_trgm's similarity operator, escaped for psycopg2
+        return (User
+                .query
+                .filter(or_(User.username.ilike(contains, escape='\\'),
+                            User.username.op('%%')(q)),
+                        User.deleted_at.is_(None))
+                .order_by(rank,
+                          func.similarity(User.username, q).desc(),
+                          User.id)
+                .offset(offset)
+                .limit(limit)
+                .all())
+
+
+class PrefixSearch:
+    """Prefix-only search for a Postgres without pg_trgm, backed by the
+    text_pattern_ops index on lower(username). Names sort after their
+    prefixes, so an exact match comes first."""
+
+    def search(self, q, offset, limit):
+        # no ESCAPE clause: Postgres escapes with a backslash by default, and
+        # an explicit one keeps the planner from using the index
+        prefix = f"{_escape_like(q.lower())}%"
+
+        return (User
+                .query
+                .filter(func.lower(User.username).like(prefix),
+                        User.deleted_at.is_(None))
+                .order_by(func.lower(User.username), User.id)
+                .offset(offset)
+                .limit(limit)
+                .all())
+
+
+class TrigramIndex:
+    """In-process trigram index of usernames.
+
+    Kept current by the User mapper events below; candidates are re-checked
+    against the database rows before they're returned.
+    """
+
+    def __init__(self):
+        self.usernames = {}
+        self.postings = defaultdict(set)
+
+    @classmethod
+    def from_db(cls):
+        index = cls()
+        for user_id, username in db.session.query(User.id, User.username):
+            index.add(user_id, username)
+        return index
+
+    def add(self, user_id, username):
+        self.remove(user_id)
+        self.usernames[user_id] = username
+        for trigram in trigrams(username):
+            self.postings[trigram].add(user_id)
+
+    def remove(self, user_id):
+        username = self.usernames.pop(user_id, None)
+        if username is not None:
+            for trigram in trigrams(username):
+                self.postings[trigram].discard(user_id)
+
+    def candidates(self, q):
+        """Return ids of the best MAX_CANDIDATES indexed matches for `q`."""
+
+        if len(q) < 3:
+            # too short to share a trigram with a name it's in the middle of
+            ids = self.usernames
+        else:
+            ids = set()
+            for trigram in trigrams(q):
+                ids |= self.postings.get(trigram, set())
+
+        ranked = heapq.nsmallest(
+            MAX_CANDIDATES,
+            (rank for user_id in ids
+             for rank in [self.rank(user_id, self.usernames[user_id], q)]
+             if rank is not None))
+
+        return [user_id for *_, user_id in ranked]
+
+    def search(self, q, offset, limit):
+        ids = self.candidates(q)
+        users = (User
+                 .query
+                 .filter(User.id.in_(ids), User.deleted_at.is_(None))
+                 .all()) if ids else []
+
+        ranked = sorted(
+            (rank, user) for user in users
+            for rank in [self.rank(user.id, user.username, q)]
+            if rank is not None)
+
+        return [user for rank, user in ranked[:MAX_RESULTS]][offset:offset + limit]
+
+    def rank(self, user_id, username, q):
+        """Return a sort key for a user matching `q`, or None if it doesn't."""
+
+        username, needle = username.lower(), q.lower()
+        score = similarity(username, needle)
+
+        if username == needle:
+            bucket = 0
+        elif username.startswith(needle):
+            bucket = 1
+        elif needle in username:
+            bucket = 2
+        elif score >= SIMILARITY_THRESHOLD:
+            bucket = 3
+        else:
+            return None
+
+        return bucket, -score, user_id
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _index_user(mapper, connection, user):
+    backend = backends.get(connection.engine)
+    if isinstance(backend, TrigramIndex):
+        backend.add(user.id, user.username)
+
+
+@event.listens_for(User, 'after_delete')
+def _unindex_user(mapper, connection, user):
+    backend = backends.get(connection.engine)
+    if isinstance(backend, TrigramIndex):
+        backend.remove(user.id)
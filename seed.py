@@ -3,6 +3,8 @@
 from csv import DictReader
 from app import db
 from models import User, Message, Follows
+from counters import reconcile_counters
+from timelines import rebuild_timelines
 
 
 db.drop_all()
@@ -18,3 +20,9 @@ with open('generator/follows.csv') as follows:
     db.session.bulk_insert_mappings(Follows, DictReader(follows))
 
 db.session.commit()
+
+# Fill in the denormalized counters and build everyone's home timeline
+# from the seeded messages and follows
+
+reconcile_counters()
+rebuild_timelines()
@@ -0,0 +1,134 @@
+"""Bulk load CSV chunks from generator/create_scaled_csvs.py.
+
+Each chunk is streamed into Postgres with COPY and committed on its own, so
+millions of rows load in minutes rather than the hours bulk_insert_mappings
+would take. Other databases fall back to executemany. Afterwards the id
+sequences are moved past the loaded ids, counters and home timelines are
+rebuilt and the tables are analyzed.
+
+    python seed_bulk.py generator/scaled [--skip-timelines]
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+
+# loading and rebuilding can take far longer than a web request may
+os.environ.setdefault('DB_STATEMENT_TIMEOUT_MS', '0')
+
+from app import db
+from counters import reconcile_counters
+from timelines import rebuild_timelines
+
+# load order matters: messages and follows reference users
+TABLES = ['users', 'messages', 'follows']
+
+SEQUENCES = [('users', 'id'), ('messages', 'id')]
+
+
+def load_chunk(path, table):
+    """Load one CSV file into `table`, returning the number of rows."""
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+
+        if db.engine.dialect.name != 'postgresql':
+            rows = list(reader)
+            params = ', '.join('?' for column in columns)
+            conn = db.engine.raw_connection()
+            try:
+                conn.cursor().executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({params})",
+                    rows)
+                conn.commit()
+            finally:
+                conn.close()
+            return len(rows)
+
+        f.seek(0)
+        conn = db.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) "
+                f"FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+            count = cursor.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return count
+
+
+def load_table(csv_dir, table):
+    paths = sorted(glob.glob(os.path.join(csv_dir, f"{table}-*.csv")))
+    started = time.perf_counter()
+    total = 0
+
+    for path in paths:
+        total += load_chunk(path, table)
+        elapsed = time.perf_counter() - started
+        print(f"{table}: {total:,} rows from {os.path.basename(path)} "
+              f"({total / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+    return total
+
+
+def reset_sequences():
+    """Point each id sequence past the largest loaded id."""
+
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    for table, column in SEQUENCES:
+        db.session.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+            f"COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)")
+    db.session.commit()
+
+
+def analyze():
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    conn = db.engine.raw_connection()
+    try:
+        conn.cursor().execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv_dir', nargs='?', default='generator/scaled')
+    parser.add_argument('--skip-timelines', action='store_true',
+                        help="don't rebuild home timelines after loading")
+    args = parser.parse_args()
+
+    db.drop_all()
+    db.create_all()
+
+    for table in TABLES:
+        load_table(args.csv_dir, table)
+
+    reset_sequences()
+
+    started = time.perf_counter()
+    users, messages = reconcile_counters()
+    print(f"counters: {users:,} users, {messages:,} messages "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    if not args.skip_timelines:
+        started = time.perf_counter()
+        rebuilt = rebuild_timelines()
+        print(f"timelines: {rebuilt:,} users "
+              f"({time.perf_counter() - started:.1f}s)")
+
+    analyze()
+
+
+if __name__ == '__main__':
+    main()
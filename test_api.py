@@ -0,0 +1,168 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_api.py
+
+
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from models import db, User, Message, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+from likes import toggle_like
+from purge import soft_delete_user
+from queries import user_messages
+from testing import reset_process_caches
+from timelines import rebuild_timelines
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class APITestCase(TestCase):
+    """Test the /api/v1 routes."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id, name in [(100, "abc"), (200, "efg"), (300, "hij")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        now = datetime.now(timezone.utc)
+        db.session.add_all([Message(id=i, text=f"warble {i}", user_id=200,
+                                    timestamp=now + timedelta(minutes=i))
+                            for i in range(1, 6)])
+        db.session.add_all([Follows(user_being_followed_id=200,
+                                    user_following_id=100),
+                            Follows(user_being_followed_id=300,
+                                    user_following_id=100)])
+        db.session.commit()
+
+        toggle_like(100, 3)
+        db.session.commit()
+        reconcile_counters()
+        rebuild_timelines()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def get(self, c, url):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 100
+        return c.get(url)
+
+    def test_login_required(self):
+        """Is the API closed to anonymous users ?"""
+        res = self.client.get('/api/v1/timeline')
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json, {'error': 'login required'})
+
+    def test_timeline_pages(self):
+        """Does the timeline page through with cursors ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/timeline?limit=2')
+            self.assertEqual([m['id'] for m in res.json['data']], [5, 4])
+            self.assertEqual(res.json['data'][0]['user']['username'], 'efg')
+
+            res = self.get(c, res.json['next'])
+            self.assertEqual([m['id'] for m in res.json['data']], [3, 2])
+            self.assertTrue(res.json['data'][0]['liked'])
+            self.assertFalse(res.json['data'][1]['liked'])
+
+            res = self.get(c, res.json['next'])
+            self.assertEqual([m['id'] for m in res.json['data']], [1])
+            self.assertIsNone(res.json['next_cursor'])
+
+    def test_sparse_fields(self):
+        """Are only the requested fields sent ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/users/200/messages?fields=id,text&limit=1')
+            self.assertEqual(res.json['data'], [{'id': 5, 'text': 'warble 5'}])
+            self.assertIn('fields=id%2Ctext', res.json['next'])
+
+            res = self.get(c, '/api/v1/users/200/messages?fields=id,password')
+            self.assertEqual(res.status_code, 400)
+            self.assertIn('password', res.json['error'])
+
+    def test_next_link_keeps_view_args(self):
+        """Does a query parameter named like a view argument leave the next
+        link pointing at the same user ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/users/200/messages?limit=2&user_id=300')
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.json['next'].startswith('/api/v1/users/200/messages?'))
+
+            res = self.get(c, res.json['next'])
+            self.assertEqual([m['id'] for m in res.json['data']], [3, 2])
+
+    def test_likes(self):
+        """Are a user's liked messages listed ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/users/100/likes')
+            self.assertEqual([m['id'] for m in res.json['data']], [3])
+
+    def test_follows(self):
+        """Are followers and following listed, with follow state ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/users/100/following?fields=id,followed')
+            self.assertEqual(res.json['data'], [{'id': 300, 'followed': True},
+                                                {'id': 200, 'followed': True}])
+
+            res = self.get(c, '/api/v1/users/200/followers?fields=username')
+            self.assertEqual(res.json['data'], [{'username': 'abc'}])
+
+    def test_deleted_user_gone(self):
+        """Are a deleted account's messages, likes and follows hidden ?"""
+        soft_delete_user(200)
+        db.session.commit()
+
+        with self.client as c:
+            for path in ['messages', 'likes', 'followers', 'following']:
+                res = self.get(c, f'/api/v1/users/200/{path}')
+                self.assertEqual(res.status_code, 404)
+                self.assertEqual(res.json, {'error': 'no such user'})
+
+        self.assertEqual(user_messages(200).items, [])
+
+    def test_search(self):
+        """Can users be searched ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/users?q=hij&fields=id')
+            self.assertEqual(res.json['data'], [{'id': 300}])
+
+    def test_streamed(self):
+        """Is the body streamed rather than built up front ?"""
+        with self.client as c:
+            res = self.get(c, '/api/v1/timeline')
+            self.assertTrue(res.is_streamed)
@@ -0,0 +1,153 @@
+"""ASGI serving mode tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_asgi.py
+
+
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from models import db, User, Message, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app
+from asgi import WSGIBridge, build_environ
+from benchmarks.harness import session_cookie
+from testing import reset_process_caches
+from timelines import rebuild_timelines
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def call(application, method, path, body=b'', headers=()):
+    """Run one request through an ASGI app; return (status, headers, chunks)."""
+
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'query_string': query.encode(), 'root_path': '',
+             'headers': [(name.encode(), value.encode())
+                         for name, value in headers]}
+    incoming = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+
+    start = sent[0]
+    chunks = [m['body'] for m in sent[1:] if m['body']]
+    return start['status'], dict(start['headers']), chunks
+
+
+class ASGITestCase(TestCase):
+    """Test the ASGI bridge."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+        self.application = WSGIBridge(app, workers=2)
+
+        for user_id, name in [(100, "abc"), (200, "efg")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        message = Message(text="hello asgi", user_id=200,
+                          timestamp=datetime.now(timezone.utc))
+        db.session.add_all([message, Follows(user_being_followed_id=200,
+                                             user_following_id=100)])
+        db.session.commit()
+        self.message_id = message.id
+        rebuild_timelines()
+
+        with app.test_request_context():
+            self.cookie = ('cookie', session_cookie(100))
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_same_page(self):
+        """Is a page served the same as under WSGI ?"""
+        status, headers, chunks = call(self.application, 'GET', '/users/200')
+        self.assertEqual(status, 200)
+        self.assertEqual(b''.join(chunks), self.client.get('/users/200').data)
+        self.assertIn(b'text/html', headers[b'content-type'])
+
+        status, headers, chunks = call(self.application, 'GET', '/messages/999',
+                                       headers=[self.cookie])
+        self.assertEqual(status, 302)
+        self.assertEqual(headers[b'location'], b'http://localhost/')
+
+    def test_form_post(self):
+        """Are request bodies and the session cookie passed through ?"""
+        status, headers, chunks = call(
+            self.application, 'POST', '/messages/new', b'text=posted+over+asgi',
+            [('content-type', 'application/x-www-form-urlencoded'), self.cookie])
+        self.assertEqual(status, 302)
+        self.assertEqual(Message.query.filter_by(user_id=100).count(), 1)
+
+    def test_streamed(self):
+        """Are streamed API responses sent chunk by chunk ?"""
+        status, headers, chunks = call(self.application, 'GET',
+                                       '/api/v1/timeline?fields=id',
+                                       headers=[self.cookie])
+        self.assertEqual(status, 200)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b''.join(chunks))['data'],
+                         [{'id': self.message_id}])
+
+    def test_lifespan(self):
+        """Does the app start up and shut down cleanly ?"""
+        incoming = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+    def test_environ(self):
+        """Are repeated headers joined and the body length set ?"""
+        environ = build_environ({'method': 'GET', 'path': '/', 'query_string': b'a=1',
+                                 'headers': [(b'accept', b'a'), (b'accept', b'b'),
+                                             (b'content-length', b'99')]}, b'xy')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'a,b')
+        self.assertEqual(environ['CONTENT_LENGTH'], '2')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1')
@@ -0,0 +1,93 @@
+"""Benchmark harness tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_benchmarks.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app
+from benchmarks.harness import (Scenario, instrument_app, run_scenario,
+                                WSGIServer, percentile, regressions)
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+instrument_app()
+
+
+class BenchmarkTestCase(TestCase):
+    """Test the benchmark harness."""
+
+    def setUp(self):
+        """Add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        u = User.signup("testuser", "test@test.com", "password", None)
+        u.id = 100
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_run_scenario(self):
+        """Are latency, throughput and SQL counts reported per route ?"""
+        scenario = Scenario('users_show', 'GET', lambda u: f"/users/{u}")
+        result = run_scenario(scenario, [100], concurrency=2, requests=4)
+
+        self.assertEqual(result['requests'], 4)
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['queries_per_request'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_run_scenario_over_http(self):
+        """Can the same scenario be driven through a WSGI server ?"""
+        scenario = Scenario('messages_add', 'POST', lambda u: '/messages/new',
+                            lambda: {'text': 'hello'})
+
+        with WSGIServer() as server:
+            result = run_scenario(scenario, [100], concurrency=1, requests=2,
+                                  url=server.url)
+
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(User.query.get(100).messages_count, 2)
+
+    def test_regressions(self):
+        """Are slower routes and extra queries flagged ?"""
+        baseline = {'a': {'p95_ms': 10, 'queries_per_request': 2},
+                    'b': {'p95_ms': 10, 'queries_per_request': 2}}
+        results = {'a': {'p95_ms': 11, 'queries_per_request': 2},
+                   'b': {'p95_ms': 20, 'queries_per_request': 3},
+                   'c': {'p95_ms': 99, 'queries_per_request': 9}}
+
+        self.assertEqual([name for name, reason in regressions(results, baseline)],
+                         ['b', 'b'])
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 3)
+        self.assertIsNone(percentile([], 0.5))
@@ -0,0 +1,163 @@
+"""HTTP caching tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_caching.py
+
+
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from testing import QueryCountMixin, reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class CachingTestCase(QueryCountMixin, TestCase):
+    """Test static caching and conditional GETs."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u1 = User.signup("abc", "abc@test.com", "password", None)
+        u1.id = 100
+        u2 = User.signup("efg", "efg@test.com", "password", None)
+        u2.id = 200
+        db.session.commit()
+
+        db.session.add(Message(id=1, text="hello", user_id=200,
+                               timestamp=datetime.now(timezone.utc)))
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 100
+
+    def revalidate(self, c, url, etag):
+        return c.get(url, headers={'If-None-Match': f'"{etag}"'})
+
+    def test_static_fingerprint(self):
+        """Are fingerprinted static files cached as immutable ?"""
+        res = self.client.get('/login')
+        self.assertIn('/static/stylesheets/style.css?v=', str(res.data))
+
+        start = str(res.data).index('/static/stylesheets/style.css?v=')
+        url = str(res.data)[start:].split('"')[0]
+
+        res = self.client.get(url)
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', res.headers['Cache-Control'])
+
+        res = self.client.get('/static/stylesheets/style.css')
+        self.assertEqual(res.headers['Cache-Control'], 'no-cache')
+
+    def test_profile_not_modified(self):
+        """Does revalidating an unchanged profile skip every query ?"""
+        with self.client as c:
+            self.login(c)
+            res = c.get('/users/200')
+            etag = res.headers['ETag'].strip('"')
+            self.assertEqual(res.headers['Cache-Control'], 'private, no-cache')
+
+            with self.assertMaxQueries(0):
+                res = self.revalidate(c, '/users/200', etag)
+            self.assertEqual(res.status_code, 304)
+
+            # a new follower changes the page
+            c.post('/users/follow/200')
+            res = self.revalidate(c, '/users/200', etag)
+            self.assertEqual(res.status_code, 200)
+
+    def test_profile_edit_changes_etag(self):
+        """Does editing a profile change its ETag ?"""
+        with self.client as c:
+            self.login(c)
+            etag = c.get('/users/100').headers['ETag'].strip('"')
+
+            c.post('/users/profile/100', data={
+                "username": "renamed",
+                "email": "abc@test.com",
+                "password": "password",
+                "bio": "hi",
+            })
+
+            res = self.revalidate(c, '/users/100', etag)
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('renamed', str(res.data))
+
+    def test_message_not_modified(self):
+        """Do message pages revalidate, and notice deletion ?"""
+        with self.client as c:
+            self.login(c)
+            etag = c.get('/messages/1').headers['ETag'].strip('"')
+
+            with self.assertMaxQueries(0):
+                res = self.revalidate(c, '/messages/1', etag)
+            self.assertEqual(res.status_code, 304)
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 200
+            etag = c.get('/messages/1').headers['ETag'].strip('"')
+            c.post('/messages/1/delete')
+
+            res = self.revalidate(c, '/messages/1', etag)
+            self.assertEqual(res.status_code, 302)
+
+    def test_user_list_not_modified(self):
+        """Does the user list revalidate against its users' versions ?"""
+        with self.client as c:
+            res = c.get('/users')
+            etag = res.headers['ETag'].strip('"')
+
+            with self.assertMaxQueries(1):
+                res = self.revalidate(c, '/users', etag)
+            self.assertEqual(res.status_code, 304)
+
+            User.signup("hij", "hij@test.com", "password", None)
+            db.session.commit()
+
+            res = self.revalidate(c, '/users', etag)
+            self.assertEqual(res.status_code, 200)
+
+    def test_flashes_not_cached(self):
+        """Are pages showing a flashed message never cached ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['_flashes'] = [('success', 'Hello')]
+
+            res = c.get('/users/200')
+            self.assertNotIn('ETag', res.headers)
+            self.assertEqual(res.headers['Cache-Control'], 'no-store')
@@ -0,0 +1,128 @@
+"""Denormalized counter tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+from datetime import datetime
+
+from models import db, Message, User, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class CounterTestCase(TestCase):
+    """Test the counters kept on users and messages."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u1 = User.signup("abc", "abc@test.com", "password", None)
+        u1.id = 100
+        u2 = User.signup("efg", "efg@test.com", "password", None)
+        u2.id = 200
+        db.session.commit()
+
+        self.time = datetime.now().astimezone()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def login(self, c, user_id):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_follow_counts(self):
+        """Do following and unfollowing update both users' counters ?"""
+        with self.client as c:
+            self.login(c, 100)
+            c.post('/users/follow/200')
+
+            self.assertEqual(User.query.get(100).following_count, 1)
+            self.assertEqual(User.query.get(200).followers_count, 1)
+
+            c.post('/users/stop-following/200')
+
+            self.assertEqual(User.query.get(100).following_count, 0)
+            self.assertEqual(User.query.get(200).followers_count, 0)
+
+    def test_message_counts(self):
+        """Do posting and deleting update the messages counter ?"""
+        with self.client as c:
+            self.login(c, 100)
+            c.post('/messages/new', data={"text": "Hello"})
+
+            self.assertEqual(User.query.get(100).messages_count, 1)
+
+            msg = Message.query.one()
+            c.post(f'/messages/{msg.id}/delete')
+
+            self.assertEqual(User.query.get(100).messages_count, 0)
+
+    def test_like_counts(self):
+        """Do liking and unliking update the user and message counters ?"""
+        db.session.add(Message(id=1, text="likable", user_id=200, timestamp=self.time))
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c, 100)
+            c.post('/users/add_like/1')
+
+            self.assertEqual(User.query.get(100).likes_count, 1)
+            self.assertEqual(Message.query.get(1).likes_count, 1)
+
+            c.post('/users/add_like/1')
+
+            self.assertEqual(User.query.get(100).likes_count, 0)
+            self.assertEqual(Message.query.get(1).likes_count, 0)
+
+    def test_reconcile_counters(self):
+        """Does reconciling repair counters that drifted ?"""
+        db.session.add(Message(id=1, text="hi", user_id=200, timestamp=self.time))
+        db.session.commit()
+        db.session.add(Follows(user_being_followed_id=200, user_following_id=100))
+        db.session.add(Likes(user_id=100, message_id=1))
+        db.session.commit()
+
+        self.assertEqual(reconcile_counters(), (2, 1))
+
+        u1 = User.query.get(100)
+        u2 = User.query.get(200)
+        self.assertEqual((u1.following_count, u1.likes_count), (1, 1))
+        self.assertEqual((u2.messages_count, u2.followers_count), (1, 1))
+        self.assertEqual(Message.query.get(1).likes_count, 1)
+
+        self.assertEqual(reconcile_counters(), (0, 0))
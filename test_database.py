@@ -0,0 +1,203 @@
+"""Database configuration tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_database.py
+
+
+import os
+import time
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from database import (REPLICA_BIND, PRIMARY_UNTIL_KEY, engine_options,
+                      route_timeouts)
+from identity import identity_cache
+from testing import count_queries, reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class DatabaseTestCase(TestCase):
+    """Test pool settings, statement timeouts and replica routing."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id, name in [(100, "abc"), (200, "efg")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        db.session.add(Message(text="hello", user_id=200,
+                               timestamp=datetime.now(timezone.utc)))
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        app.config['SQLALCHEMY_BINDS'] = None
+        app.config['DB_ROUTE_TIMEOUTS_MS'] = {}
+        db.session.rollback()
+        return resp
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 100
+
+    def use_replica(self):
+        # the test database stands in for its own replica
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: app.config['SQLALCHEMY_DATABASE_URI']}
+        return db.get_engine(app, bind=REPLICA_BIND)
+
+    def test_engine_options(self):
+        """Are the pool and timeout settings applied to the engine ?"""
+        options = engine_options(app.config, db.engine.url)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=30000'})
+
+        self.assertEqual(db.engine.pool.size(), app.config['DB_POOL_SIZE'])
+        self.assertEqual(db.session.execute("SHOW statement_timeout").scalar(),
+                         '30s')
+
+        self.assertNotIn('connect_args',
+                         engine_options({**app.config,
+                                         'DB_STATEMENT_TIMEOUT_MS': 0},
+                                        db.engine.url))
+
+    def test_sqlite_engine_options(self):
+        """Does SQLite get only the settings its pools and driver take ?"""
+        options = engine_options(app.config, make_url('sqlite:///warbler.db'))
+        self.assertEqual(set(options), {'pool_recycle', 'pool_pre_ping'})
+
+        postgres = app.config['SQLALCHEMY_DATABASE_URI']
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        try:
+            self.assertEqual(db.get_engine(app).execute("SELECT 1").scalar(), 1)
+        finally:
+            app.config['SQLALCHEMY_DATABASE_URI'] = postgres
+
+    def test_route_timeouts(self):
+        """Do listed endpoints get their own statement timeout ?"""
+        self.assertEqual(route_timeouts(" list_users=2000, homepage=500,"),
+                         {'list_users': 2000, 'homepage': 500})
+
+        app.config['DB_ROUTE_TIMEOUTS_MS'] = {'list_users': 1234}
+
+        with self.client as c:
+            with count_queries() as queries:
+                c.get('/users')
+            self.assertTrue(any('set_config' in statement
+                                for statement in queries.statements))
+
+            with count_queries() as queries:
+                c.get('/messages/new')
+            self.assertFalse(any('set_config' in statement
+                                 for statement in queries.statements))
+
+    def test_reads_without_replica(self):
+        """Do reads stay on the primary when no replica is configured ?"""
+        with self.client as c:
+            self.login(c)
+            with count_queries() as queries:
+                res = c.get('/users')
+            self.assertEqual(res.status_code, 200)
+            self.assertGreater(len(queries), 0)
+
+    def test_replica_reads(self):
+        """Do read-only pages query the replica ?"""
+        replica = self.use_replica()
+
+        with self.client as c:
+            self.login(c)
+            with count_queries() as primary:
+                res = c.get('/users/200')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('hello', str(res.data))
+
+        # only the identities of the logged-in and shown users are read from
+        # the primary
+        self.assertLessEqual(len(primary), 2)
+        self.assertIsNot(replica, db.engine)
+
+    def test_read_your_writes(self):
+        """After posting, do a user's reads stay on the primary ?"""
+        self.use_replica()
+
+        with self.client as c:
+            self.login(c)
+            c.post('/messages/new', data={'text': 'fresh warble'})
+
+            with c.session_transaction() as sess:
+                self.assertGreater(sess[PRIMARY_UNTIL_KEY], 0)
+
+            with count_queries() as primary:
+                res = c.get('/users/100')
+            self.assertIn('fresh warble', str(res.data))
+            self.assertGreater(len(primary), 1)
+
+            with c.session_transaction() as sess:
+                sess[PRIMARY_UNTIL_KEY] = 0
+
+            with count_queries() as primary:
+                c.get('/users/100')
+            self.assertLessEqual(len(primary), 1)
+
+    def test_identity_snapshots_come_from_the_primary(self):
+        """Does a snapshot taken on a replica page still see fresh counts ?"""
+        replica = self.use_replica()
+        identity_cache.clear()
+        User.query.get(200).messages_count = 1
+        db.session.commit()
+
+        # a replica that hasn't caught up with any of user 200's messages
+        def lagging(conn, cursor, statement, parameters, context, executemany):
+            return statement.replace('users.messages_count', '0'), parameters
+
+        event.listen(replica, 'before_cursor_execute', lagging, retval=True)
+        try:
+            with self.client as c:
+                self.login(c)
+                res = c.get('/users/200')
+                self.assertEqual(res.status_code, 200)
+
+                # user 200 has just posted, so their reads are on the primary
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = 200
+                    sess[PRIMARY_UNTIL_KEY] = time.time() + 60
+                res = c.get('/')
+        finally:
+            event.remove(replica, 'before_cursor_execute', lagging)
+
+        self.assertIn('<a href="/users/200">1</a>', str(res.data))
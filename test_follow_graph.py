@@ -0,0 +1,187 @@
+"""Follow graph tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_follow_graph.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+
+from models import db, User, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from follow_graph import FollowGraph, follow_graph
+from testing import count_queries, reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# who follows whom: (follower, followed)
+EDGES = [(100, 200), (100, 300), (100, 400), (200, 300), (400, 300),
+         (500, 300), (300, 100)]
+
+
+class FollowGraphTestCase(TestCase):
+    """Test the in-memory follow graph."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id in [100, 200, 300, 400, 500]:
+            u = User.signup(f"user{user_id}", f"{user_id}@test.com",
+                            "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        db.session.add_all([Follows(user_following_id=follower,
+                                    user_being_followed_id=followed)
+                            for follower, followed in EDGES])
+        for follower, followed in EDGES:
+            User.query.get(follower).following_count += 1
+            User.query.get(followed).followers_count += 1
+        db.session.commit()
+
+        self.graph = FollowGraph()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_lists(self):
+        """Are lists sorted, and only read once ?"""
+        self.assertEqual(list(self.graph.following(100)), [200, 300, 400])
+        self.assertEqual(list(self.graph.followers(300)), [100, 200, 400, 500])
+        self.assertEqual(list(self.graph.followers(500)), [])
+
+        with count_queries() as queries:
+            self.assertTrue(self.graph.is_following(100, 300))
+            self.assertFalse(self.graph.is_following(100, 500))
+            self.assertEqual(self.graph.following_among(100, [200, 500, 400]),
+                             {200, 400})
+            self.assertEqual(self.graph.degree(100), (3, 1))
+        self.assertEqual(len(queries), 1)
+
+    def test_followed_by_followed(self):
+        """Which of the people we follow follow someone else ?"""
+        self.assertEqual(self.graph.followed_by_followed(100, 300), [200, 400])
+        self.assertEqual(self.graph.followed_by_followed(500, 300), [])
+
+    def test_pages(self):
+        """Do pages run highest id first and cover every id once ?"""
+        first = self.graph.followers_page(300, per_page=3)
+        self.assertEqual(first.items, [500, 400, 200])
+        rest = self.graph.followers_page(300, before=first.next_cursor,
+                                         per_page=3)
+        self.assertEqual(rest.items, [100])
+        self.assertIsNone(rest.next_cursor)
+
+        self.assertEqual(self.graph.following_page(100, before='nonsense').items,
+                         [400, 300, 200])
+
+    def test_updates(self):
+        """Do follows and unfollows update the cached lists ?"""
+        self.graph.following(500)
+        self.graph.followers(200)
+
+        self.graph.add_follow(500, 200)
+        self.graph.add_follow(500, 200)
+        self.assertEqual(list(self.graph.following(500)), [200, 300])
+        self.assertEqual(list(self.graph.followers(200)), [100, 500])
+
+        self.graph.remove_follow(500, 300)
+        self.assertEqual(list(self.graph.following(500)), [200])
+
+    def test_snapshot(self):
+        """Does a snapshot warm a graph, skipping lists that changed ?"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph')
+            # 5 users follow someone, 4 are followed
+            self.assertEqual(self.graph.save_snapshot(path, batch_size=2), 9)
+
+            # 500 stops following 300 after the snapshot
+            Follows.query.filter_by(user_following_id=500).delete()
+            User.query.get(500).following_count -= 1
+            User.query.get(300).followers_count -= 1
+            db.session.commit()
+
+            warm = FollowGraph()
+            self.assertEqual(warm.load_snapshot(path, batch_size=4), 7)
+
+        with count_queries() as queries:
+            self.assertEqual(list(warm.following(100)), [200, 300, 400])
+            self.assertEqual(list(warm.followers(100)), [300])
+        self.assertEqual(len(queries), 0)
+
+        self.assertEqual(list(warm.followers(300)), [100, 200, 400])
+
+    def test_follow_views(self):
+        """Do follower pages page, and follows show up straight away ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 500
+
+            res = c.get('/users/300/followers')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('@user100', str(res.data))
+
+            c.post('/users/follow/100')
+            res = c.get('/users/500/following')
+            self.assertIn('@user100', str(res.data))
+            self.assertTrue(follow_graph.is_following(500, 100))
+
+            c.post('/users/stop-following/300')
+            res = c.get('/users/300/followers')
+            self.assertNotIn('@user500', str(res.data))
+
+            res = c.get('/users/300/followers?before=400')
+            self.assertIn('@user200', str(res.data))
+            self.assertNotIn('@user400', str(res.data))
+
+    def test_repeated_follows_and_unfollows(self):
+        """Do double submits leave the follows and counters alone ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 500
+
+            self.assertEqual(c.post('/users/follow/100').status_code, 302)
+            self.assertEqual(c.post('/users/follow/100').status_code, 302)
+            self.assertEqual(c.post('/users/stop-following/200').status_code, 302)
+
+            with count_queries() as queries:
+                c.post('/users/stop-following/100')
+            # never a load of everyone 500 follows
+            self.assertFalse(any('FROM users, follows' in statement
+                                 for statement in queries.statements))
+            self.assertEqual(c.post('/users/stop-following/100').status_code, 302)
+
+        user = User.query.get(500)
+        self.assertEqual(user.following_count, 1)
+        self.assertEqual(User.query.get(100).followers_count, 1)
+        self.assertEqual(User.query.get(200).followers_count, 1)
+        self.assertEqual([u.id for u in user.following], [300])
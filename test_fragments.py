@@ -0,0 +1,157 @@
+"""Fragment cache tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_fragments.py
+
+
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from fragments import ClientBackend, FragmentCache, fragment_cache
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class DictClient:
+    """Stand-in for a memcached client."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get_multi(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set_multi(self, mapping, ttl):
+        self.data.update(mapping)
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class FragmentTestCase(TestCase):
+    """Test cached message and user cards."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u1 = User.signup("abc", "abc@test.com", "password", None)
+        u1.id = 100
+        u2 = User.signup("efg", "efg@test.com", "password", None)
+        u2.id = 200
+        db.session.commit()
+
+        for i in range(1, 4):
+            db.session.add(Message(id=i, text=f"warble {i}", user_id=100,
+                                   timestamp=datetime.now(timezone.utc)))
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def login(self, c, user_id=100):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_cards_cached(self):
+        """Are cards rendered once and then served from the cache ?"""
+        with self.client as c:
+            self.login(c)
+            c.get('/users/100')
+            hits, misses = fragment_cache.hits, fragment_cache.misses
+
+            res = c.get('/users/100')
+
+            self.assertEqual(fragment_cache.hits - hits, 3)
+            self.assertEqual(fragment_cache.misses, misses)
+            self.assertIn('warble 2', str(res.data))
+
+    def test_live_bits(self):
+        """Do per-viewer follow buttons stay live around cached cards ?"""
+        with self.client as c:
+            self.login(c, 200)
+            res = c.get('/users')
+            self.assertIn('action="/users/follow/100"', str(res.data))
+
+            c.post('/users/follow/100')
+            res = c.get('/users')
+            self.assertIn('action="/users/stop-following/100"', str(res.data))
+            self.assertIn('@abc', str(res.data))
+
+    def test_profile_edit_expires(self):
+        """Does editing a profile re-render the cards showing that user ?"""
+        with self.client as c:
+            self.login(c)
+            c.get('/users')
+            c.get('/users/100')
+
+            c.post('/users/profile/100', data={
+                "username": "renamed",
+                "email": "abc@test.com",
+                "password": "password",
+                "bio": "hi",
+            })
+
+            self.assertIn('@renamed', str(c.get('/users').data))
+            self.assertNotIn('@abc', str(c.get('/users/100').data))
+
+    def test_message_delete_expires(self):
+        """Is a deleted message's card dropped ?"""
+        with self.client as c:
+            self.login(c)
+            c.get('/users/100')
+            cached = len(fragment_cache.backend.cache.entries)
+
+            c.post('/messages/2/delete')
+
+            self.assertEqual(len(fragment_cache.backend.cache.entries), cached - 1)
+            self.assertNotIn('warble 2', str(c.get('/users/100').data))
+
+    def test_shared_backend(self):
+        """Can cards be kept in a shared cache ?"""
+        cache = FragmentCache(ClientBackend(DictClient()))
+        users = [User.query.get(100), User.query.get(200)]
+
+        with app.test_request_context():
+            first = cache.cards('users/_card.html', users,
+                                lambda user: f"card:user:{user.id}",
+                                lambda user: user.id, 'user')
+            again = cache.cards('users/_card.html', users,
+                                lambda user: f"card:user:{user.id}",
+                                lambda user: user.id, 'user')
+
+        self.assertEqual(first, again)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        self.assertIn('@abc', first[0][1][0])
@@ -0,0 +1,151 @@
+"""Password hashing pool tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_hashing.py
+
+
+import os
+from threading import Event, Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app
+from hashing import (HashingPool, HashingPoolSaturated, init_hashing,
+                     hashing_pool, needs_rehash)
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class HashingPoolTestCase(TestCase):
+    """Test the bounded hashing pool."""
+
+    def test_saturation(self):
+        """Does a full pool turn work away instead of queueing it ?"""
+        pool = HashingPool(workers=1, queue_size=1)
+        release = Event()
+        threads = [Thread(target=pool.run, args=(release.wait,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+
+        while pool.stats()['in_flight'] < 2:
+            pass
+
+        self.assertEqual(pool.stats()['queue_depth'], 1)
+        with self.assertRaises(HashingPoolSaturated):
+            pool.run(print)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        stats = pool.stats()
+        self.assertEqual((stats['completed'], stats['rejected']), (2, 1))
+        self.assertEqual(pool.run(len, "abc"), 3)
+
+    def test_reconfigure_shuts_down_old_executor(self):
+        """Does reconfiguring the pool let go of its old threads ?"""
+        pool = HashingPool(workers=1, queue_size=1)
+        old = pool.executor
+        pool.configure(2, 4)
+
+        with self.assertRaises(RuntimeError):
+            old.submit(print)
+        self.assertEqual(pool.run(len, "abc"), 3)
+        self.assertEqual(pool.stats()['queue_size'], 4)
+
+    def test_errors_propagate(self):
+        """Do errors raised while hashing reach the caller ?"""
+        with self.assertRaises(ValueError):
+            hashing_pool.run(int, "not a number")
+
+
+class HashingViewTestCase(TestCase):
+    """Test hashing through signup and login."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u = User.signup("testuser", "test@test.com", "password", None)
+        u.id = 100
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        app.config['BCRYPT_LOG_ROUNDS'] = 12
+        init_hashing(app)
+        return resp
+
+    def test_saturated_login(self):
+        """Does a saturated pool answer 503 with Retry-After ?"""
+        with patch('hashing.hashing_pool.run', side_effect=HashingPoolSaturated):
+            res = self.client.post('/login', data={'username': 'testuser',
+                                                   'password': 'password'})
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '5')
+
+    def test_rehash_on_login(self):
+        """Is a password rehashed at the new cost when its owner logs in ?"""
+        self.assertTrue(User.query.get(100).password.startswith('$2b$12$'))
+
+        app.config['BCRYPT_LOG_ROUNDS'] = 4
+        init_hashing(app)
+
+        res = self.client.post('/login', data={'username': 'testuser',
+                                               'password': 'password'})
+        self.assertEqual(res.status_code, 302)
+
+        user = User.query.get(100)
+        self.assertTrue(user.password.startswith('$2b$04$'))
+        self.assertEqual(User.authenticate('testuser', 'password').id, 100)
+
+    def test_needs_rehash_follows_config(self):
+        """Is a hash made at another cost spotted ?"""
+        pw_hash = User.query.get(100).password
+
+        self.assertFalse(needs_rehash(pw_hash, app.config['BCRYPT_LOG_ROUNDS']))
+        self.assertTrue(needs_rehash(pw_hash, 4))
+        self.assertTrue(needs_rehash("not a hash", 4))
+
+    def test_metrics(self):
+        """Are pool metrics published outside production only ?"""
+        self.assertEqual(self.client.get('/_metrics/hashing').status_code, 404)
+
+        app.config['ENV'] = 'development'
+        try:
+            res = self.client.get('/_metrics/hashing')
+        finally:
+            app.config['ENV'] = 'production'
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('queue_depth', res.json)
+        self.assertIn('p95', res.json['latency_ms'])
@@ -0,0 +1,121 @@
+"""Cached identity tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_identity.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from identity import load_identity, TTLCache
+from testing import QueryCountMixin, reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class IdentityTestCase(QueryCountMixin, TestCase):
+    """Test the cached snapshot of the logged-in user."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u1 = User.signup("abc", "abc@test.com", "password", None)
+        u1.id = 100
+        u2 = User.signup("efg", "efg@test.com", "password", None)
+        u2.id = 200
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 100
+
+    def test_identity_only_request(self):
+        """Does a warm identity cache keep identity-only pages off the DB ?"""
+        with self.client as c:
+            self.login(c)
+            c.get('/messages/new')
+
+            with self.assertMaxQueries(0):
+                res = c.get('/messages/new')
+            self.assertIn('alt="abc"', str(res.data))
+
+    def test_follow_invalidates(self):
+        """Does following someone refresh both users' snapshots ?"""
+        with self.client as c:
+            self.login(c)
+            self.assertEqual(load_identity(100).following_ids, frozenset())
+            self.assertEqual(load_identity(200).followers_count, 0)
+
+            c.post('/users/follow/200')
+
+            self.assertEqual(load_identity(100).following_ids, {200})
+            self.assertEqual(load_identity(200).followers_count, 1)
+
+    def test_profile_invalidates(self):
+        """Does editing a profile refresh the snapshot ?"""
+        with self.client as c:
+            self.login(c)
+            self.assertEqual(load_identity(100).username, "abc")
+
+            c.post('/users/profile/100', data={
+                "username": "renamed",
+                "email": "abc@test.com",
+                "password": "password",
+                "bio": "hi",
+            })
+
+            self.assertEqual(load_identity(100).username, "renamed")
+
+    def test_falls_through_to_row(self):
+        """Are attributes outside the snapshot read from the User row ?"""
+        current = load_identity(100)
+        self.assertEqual(current.email, "abc@test.com")
+        self.assertIsNone(load_identity(999))
+
+    def test_ttl_cache(self):
+        """Does the cache evict the least recently used and expired entries ?"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.get(1)
+        cache.set(3, "three")
+
+        self.assertEqual(cache.get(1), "one")
+        self.assertIsNone(cache.get(2))
+
+        expired = TTLCache(maxsize=2, ttl=-1)
+        expired.set(1, "one")
+        self.assertIsNone(expired.get(1))
@@ -0,0 +1,243 @@
+"""Background job tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_jobs.py
+
+
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Follows, Job, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from jobs import HANDLERS, MAX_ATTEMPTS, enqueue, run_pending, work
+from testing import SQLiteMixin, reset_process_caches
+from timelines import home_timeline
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class JobsTestCase(TestCase):
+    """Test the job outbox and worker."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id, name in [(100, "abc"), (200, "efg")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        db.session.add(Follows(user_being_followed_id=200, user_following_id=100))
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        app.config['JOBS_EAGER'] = False
+        db.session.rollback()
+        return resp
+
+    def post_message(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 200
+            c.post('/messages/new', data={"text": "queued warble"})
+
+    def test_queued_with_write(self):
+        """Is a job queued by the write, and left out if it rolls back ?"""
+        self.post_message()
+        self.assertEqual([job.kind for job in Job.query], ['fan_out_message'])
+        self.assertEqual(TimelineEntry.query.count(), 0)
+
+        with app.test_request_context():
+            enqueue('prune_follow', follower_id=100, followed_id=200)
+        db.session.rollback()
+        self.assertEqual(Job.query.count(), 1)
+
+        with self.assertRaises(ValueError):
+            with app.test_request_context():
+                enqueue('no_such_job')
+
+    def test_worker_runs_jobs(self):
+        """Does the worker run jobs and remove them from the queue ?"""
+        self.post_message()
+
+        self.assertEqual(work(once=True), 1)
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(TimelineEntry.query.one().user_id, 100)
+
+    def test_retry_then_give_up(self):
+        """Are failed jobs retried later, then set aside ?"""
+        self.post_message()
+        job_id = Job.query.one().id
+
+        failing = {'fan_out_message': lambda message_id: 1 / 0}
+        with patch.dict(HANDLERS, failing):
+            self.assertEqual(run_pending(), 1)
+
+            job = Job.query.get(job_id)
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('ZeroDivisionError', job.last_error)
+            self.assertGreater(job.run_at, datetime.now(timezone.utc))
+
+            # not due again yet
+            self.assertEqual(run_pending(), 0)
+
+            for attempt in range(MAX_ATTEMPTS - 1):
+                job.run_at = datetime.now(timezone.utc)
+                db.session.commit()
+                run_pending()
+
+        job = Job.query.get(job_id)
+        self.assertEqual(job.attempts, MAX_ATTEMPTS)
+        self.assertIsNotNone(job.failed_at)
+        self.assertEqual(run_pending(), 0)
+
+    def test_failure_rolls_back_job_only(self):
+        """Does a failing job leave no partial work, and others still run ?"""
+        self.post_message()
+        self.post_message()
+        first = Job.query.order_by(Job.id).first().id
+        crashing = Message.query.order_by(Message.id).first().id
+
+        real = HANDLERS['fan_out_message']
+
+        def fan_out_then_crash(message_id):
+            real(message_id)
+            if message_id == crashing:
+                raise RuntimeError("worker crashed")
+
+        with patch.dict(HANDLERS, {'fan_out_message': fan_out_then_crash}):
+            self.assertEqual(run_pending(), 2)
+
+        self.assertEqual(TimelineEntry.query.count(), 1)
+        self.assertEqual([job.id for job in Job.query], [first])
+
+    def test_idempotent_fan_out(self):
+        """Can a fan-out run again, or after a backfill, without failing ?"""
+        self.post_message()
+        message_id = Message.query.one().id
+
+        with app.test_request_context():
+            enqueue('backfill_follow', follower_id=100, followed_id=200)
+            enqueue('fan_out_message', message_id=message_id)
+        db.session.commit()
+
+        work(once=True)
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(TimelineEntry.query.count(), 1)
+
+    def test_skip_locked(self):
+        """Are jobs claimed by another worker skipped ?"""
+        self.post_message()
+
+        other = db.engine.connect()
+        transaction = other.begin()
+        other.execute("SELECT id FROM jobs FOR UPDATE")
+        try:
+            self.assertEqual(run_pending(), 0)
+        finally:
+            transaction.rollback()
+            other.close()
+
+        self.assertEqual(run_pending(), 1)
+
+    def test_eager(self):
+        """In eager mode, do jobs run right away ?"""
+        app.config['JOBS_EAGER'] = True
+        self.post_message()
+
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(TimelineEntry.query.count(), 1)
+
+    def test_eager_chains_dont_recurse(self):
+        """In eager mode, does a long chain of jobs run without recursing ?"""
+        app.config['JOBS_EAGER'] = True
+
+        def one_at_a_time(user_id, purged):
+            return 1 if purged < 5000 else 0
+
+        with patch('jobs.purge_batch', side_effect=one_at_a_time) as purge_batch:
+            enqueue('purge_user', user_id=1)
+
+        self.assertEqual(purge_batch.call_count, 5001)
+        self.assertEqual(Job.query.count(), 0)
+
+
+class SQLiteJobsTestCase(SQLiteMixin, TestCase):
+    """Test the jobs on the SQLite stand-in."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+        self.client = app.test_client()
+        app.config['CELEBRITY_FOLLOWERS'] = 2
+
+        for user_id, name in [(100, "abc"), (200, "efg"), (300, "hij")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.add(Message(id=1, text="older warble", user_id=200,
+                               timestamp=datetime.now(timezone.utc)))
+        db.session.commit()
+
+    def tearDown(self):
+        app.config['CELEBRITY_FOLLOWERS'] = 10000
+        return super().tearDown()
+
+    def post(self, user_id, url, data=None):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+            res = c.post(url, data=data)
+        self.assertEqual(res.status_code, 302)
+
+    def test_writes_to_worker(self):
+        """Does every job the writes queue run through the worker ?"""
+        self.post(100, '/users/follow/200')
+        # the second follower makes 200 a celebrity, and unfollowing
+        # pushes them again
+        self.post(300, '/users/follow/200')
+        self.post(300, '/users/stop-following/200')
+        self.post(200, '/messages/new', {"text": "newer warble"})
+        self.post(300, '/users/delete')
+
+        self.assertEqual({job.kind for job in Job.query},
+                         {'backfill_follow', 'refresh_suggestions',
+                          'push_author', 'prune_follow', 'fan_out_message',
+                          'purge_user'})
+
+        while run_pending():
+            pass
+
+        self.assertEqual([(job.kind, job.last_error) for job in Job.query], [])
+        self.assertEqual([m.text for m in home_timeline(100).items],
+                         ["newer warble", "older warble"])
+        self.assertIsNone(User.query.get(300))
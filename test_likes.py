@@ -0,0 +1,129 @@
+"""Likes tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_likes.py
+
+
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from models import db, User, Message, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from likes import toggle_like, liked_among
+from testing import SQLiteMixin, reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class LikesTestCase(TestCase):
+    """Test like toggling and lookups."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id, name in [(100, "abc"), (200, "efg"), (300, "hij")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        now = datetime.now(timezone.utc)
+        db.session.add_all([Message(id=1, text="one", user_id=100, timestamp=now),
+                            Message(id=2, text="two", user_id=100, timestamp=now)])
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_toggle(self):
+        """Does toggling like, then unlike ?"""
+        self.assertEqual(toggle_like(200, 1), 1)
+        self.assertEqual(toggle_like(200, 1), -1)
+        self.assertEqual(toggle_like(200, 1), 1)
+        db.session.commit()
+
+        self.assertEqual(Likes.query.filter_by(user_id=200).count(), 1)
+
+    def test_many_users_like_a_message(self):
+        """Can more than one user like the same message ?"""
+        toggle_like(200, 1)
+        toggle_like(300, 1)
+        db.session.commit()
+
+        self.assertEqual(Likes.query.filter_by(message_id=1).count(), 2)
+
+    def test_own_or_missing_message(self):
+        """Are own and missing messages left alone ?"""
+        self.assertEqual(toggle_like(100, 1), 0)
+        self.assertEqual(toggle_like(200, 999), 0)
+        self.assertEqual(Likes.query.count(), 0)
+
+    def test_liked_among(self):
+        """Is the viewer's like state for a page answered as a set ?"""
+        toggle_like(200, 2)
+        db.session.commit()
+
+        self.assertEqual(liked_among(200, [1, 2]), {2})
+        self.assertEqual(liked_among(300, [1, 2]), set())
+        self.assertEqual(liked_among(None, [1, 2]), set())
+
+    def test_like_view(self):
+        """Does the like route toggle and keep counters right ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 200
+
+            c.post('/users/add_like/1')
+            self.assertEqual(User.query.get(200).likes_count, 1)
+            self.assertEqual(Message.query.get(1).likes_count, 1)
+
+            res = c.get('/users/100')
+            self.assertEqual(str(res.data).count('fa-star'), 1)
+
+            c.post('/users/add_like/1')
+            self.assertEqual(User.query.get(200).likes_count, 0)
+            self.assertEqual(Message.query.get(1).likes_count, 0)
+
+            self.assertEqual(c.post('/users/add_like/999').status_code, 404)
+
+    def test_like_own_view(self):
+        """Is liking your own post refused ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 100
+
+            res = c.post('/users/add_like/1', follow_redirects=True)
+            self.assertIn("like your own post", str(res.data))
+            self.assertEqual(Likes.query.count(), 0)
+
+
+class SQLiteLikesTestCase(SQLiteMixin, LikesTestCase):
+    """Test likes on the SQLite stand-in."""
@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 from sqlalchemy import exc
-from datetime import datetime
+from datetime import datetime, timezone
 
 from models import db, User, Message, Follows
 def echo(name):
@@ -26,6 +26,7 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
 # Now we can import app
 
 from app import app
+from testing import reset_process_caches
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -40,6 +41,7 @@ class MessageModelTestCase(TestCase):
         """Create test client, add sample data."""
         db.drop_all()
         db.create_all()
+        reset_process_caches()
 
         u1 = User.signup("test1", "email1@email.com", "password", None)
         uid1 = 1111
@@ -82,6 +84,20 @@ class MessageModelTestCase(TestCase):
         mssg = Message.query.get(m2.id)
         self.assertEqual(mssg.id, m2.id)
 
+    def test_timestamp_ordering(self):
+        """Are timestamps stored as real times, not text ?"""
+        earlier = datetime(2020, 1, 2, 9, 0, tzinfo=timezone.utc)
+        later = datetime(2020, 1, 10, 9, 0, tzinfo=timezone.utc)
+        db.session.add_all([
+            Message(id=21, text="later", timestamp=later, user_id=1111),
+            Message(id=22, text="earlier", timestamp=earlier, user_id=1111),
+        ])
+        db.session.commit()
+
+        mssgs = Message.query.order_by(Message.timestamp.desc()).all()
+        self.assertEqual([m.id for m in mssgs], [21, 22])
+        self.assertEqual(mssgs[0].timestamp, later)
+
     def test_fail_user_id(self):
         m2 = Message(text="test mssg", timestamp=None, user_id=3)
         m2.id = 13
@@ -0,0 +1,186 @@
+"""Message search tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_message_search.py
+
+
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from message_search import (Term, parse_query, to_tsquery_text, search_args,
+                            search_messages, reindex_messages)
+from purge import soft_delete_user
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# ids clear of the messages posted through the views
+TEXTS = {
+    101: (100, "the quick brown fox"),
+    102: (100, "brown bread for breakfast"),
+    103: (200, "warbling about quick quick foxes"),
+    104: (200, "fox brown quick"),
+    105: (300, "nothing to see here"),
+}
+
+
+class MessageSearchTestCase(TestCase):
+    """Test full-text message search."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id, name in [(100, "abc"), (200, "efg"), (300, "hij")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        self.start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        db.session.add_all([Message(id=i, text=text, user_id=user_id,
+                                    timestamp=self.start + timedelta(days=i - 100))
+                            for i, (user_id, text) in TEXTS.items()])
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def ids(self, q, **kwargs):
+        return [m.id for m in search_messages(q, **kwargs).items]
+
+    def test_parse_query(self):
+        """Are words, phrases and prefixes understood, and nothing else ?"""
+        terms = parse_query('"Quick brown" warb* fox: & !')
+        self.assertEqual(terms, [Term(('quick', 'brown'), False),
+                                 Term(('warb',), True),
+                                 Term(('fox',), False)])
+        self.assertEqual(to_tsquery_text(terms),
+                         "quick <-> brown & warb:* & fox")
+        self.assertEqual(parse_query('  " " '), [])
+
+    def test_words_and_phrases(self):
+        """Do all words have to match, and phrases in order ?"""
+        self.assertEqual(sorted(self.ids('brown fox')), [101, 104])
+        self.assertEqual(self.ids('"quick brown"'), [101])
+        # words are stemmed
+        self.assertEqual(sorted(self.ids('foxes')), [101, 103, 104])
+        self.assertEqual(self.ids(''), [])
+
+    def test_prefix(self):
+        """Do prefix terms match the start of words ?"""
+        self.assertEqual(self.ids('warb*'), [103])
+        self.assertEqual(self.ids('bre*'), [102])
+
+    def test_ranked(self):
+        """Are better matches ranked first ?"""
+        # "quick" twice beats "quick" once; ties go to the newest
+        self.assertEqual(self.ids('quick'), [103, 104, 101])
+        self.assertEqual(self.ids('quick', order='recent'), [104, 103, 101])
+
+    def test_filters(self):
+        """Can results be narrowed to an author and a time window ?"""
+        self.assertEqual(sorted(self.ids('brown', author_id=100)), [101, 102])
+        self.assertEqual(
+            self.ids('brown', since=self.start + timedelta(days=2),
+                     until=self.start + timedelta(days=4)),
+            [102])
+
+    def test_paging(self):
+        """Do both orders page through every result once ?"""
+        for order in ['rank', 'recent']:
+            seen = []
+            before = None
+            while True:
+                page = search_messages('quick', order=order, before=before,
+                                       per_page=2)
+                seen += [m.id for m in page.items]
+                before = page.next_cursor
+                if before is None:
+                    break
+            self.assertEqual(sorted(seen), [101, 103, 104], order)
+
+    def test_new_and_deleted(self):
+        """Are new messages searchable at once, and deleted authors hidden ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 300
+            c.post('/messages/new', data={"text": "a freshly posted zebra"})
+
+        self.assertEqual(len(self.ids('zebra')), 1)
+
+        soft_delete_user(300)
+        db.session.commit()
+        self.assertEqual(self.ids('zebra'), [])
+
+    def test_reindex(self):
+        """Does a reindex rebuild every message's vector ?"""
+        db.session.execute("UPDATE messages SET search_vector = NULL")
+        db.session.commit()
+        self.assertEqual(self.ids('fox'), [])
+
+        self.assertEqual(reindex_messages(batch_size=20), len(TEXTS))
+        self.assertEqual(sorted(self.ids('fox')), [101, 103, 104])
+
+    def test_search_args(self):
+        """Are query string filters parsed, and bad ones refused ?"""
+        self.assertEqual(search_args({'user': '100', 'since': '2024-01-02',
+                                      'until': '2024-01-03', 'order': 'recent'}),
+                         {'author_id': 100,
+                          'since': datetime(2024, 1, 2, tzinfo=timezone.utc),
+                          'until': datetime(2024, 1, 4, tzinfo=timezone.utc),
+                          'order': 'recent'})
+
+        for bad in [{'user': 'abc'}, {'since': 'yesterday'}, {'order': 'best'}]:
+            with self.assertRaises(ValueError):
+                search_args(bad)
+
+    def test_search_views(self):
+        """Do the search page and API show results ?"""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 100
+
+            res = c.get('/messages/search?q=bread')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('brown bread for breakfast', str(res.data))
+
+            res = c.get('/messages/search?q=quick&user=200&order=recent')
+            self.assertIn('fox brown quick', str(res.data))
+            self.assertNotIn('the quick brown fox', str(res.data))
+
+            res = c.get('/api/v1/messages/search?q=quick&fields=id&limit=2')
+            self.assertEqual(res.json['data'], [{'id': 103}, {'id': 104}])
+            self.assertIsNotNone(res.json['next'])
+
+            res = c.get('/api/v1/messages/search?q=quick&since=soon')
+            self.assertEqual(res.status_code, 400)
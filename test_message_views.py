@@ -9,6 +9,7 @@ import os
 from unittest import TestCase
 from datetime import datetime
 from models import db, connect_db, Message, User
+from testing import QueryCountMixin, reset_process_caches
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -34,7 +35,7 @@ db.create_all()
 app.config['WTF_CSRF_ENABLED'] = False
 
 
-class MessageViewTestCase(TestCase):
+class MessageViewTestCase(QueryCountMixin, TestCase):
     """Test views for messages."""
 
     def setUp(self):
@@ -42,6 +43,7 @@ class MessageViewTestCase(TestCase):
 
         db.drop_all()
         db.create_all()
+        reset_process_caches()
 
         self.client = app.test_client()
 
@@ -146,6 +148,25 @@ class MessageViewTestCase(TestCase):
             self.assertEqual(res.status_code, 200)
             self.assertIn(rec_mssg.text, str(res.data))
 
+    def test_mssg_show_query_count(self):
+        """Is the message page rendered without lazy-loading its author ?"""
+        mssg = Message(
+            id=1222,
+            text= 'test text',
+            user_id= self.testuser.id,
+            timestamp=self.time
+        )
+        db.session.add(mssg)
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with self.assertMaxQueries(2):
+                res = c.get('/messages/1222')
+            self.assertEqual(res.status_code, 200)
+
     def test_invalid_message_show(self):
         """Do we get rejected if our mssg ID does not exist ?"""
         with self.client as c:
@@ -0,0 +1,117 @@
+"""Cursor pagination tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_pagination.py
+
+
+import os
+from unittest import TestCase
+from datetime import datetime, timedelta, timezone
+
+from models import db, Message, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app
+from pagination import encode_cursor, decode_cursor
+from queries import user_messages, user_directory
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+
+class PaginationTestCase(TestCase):
+    """Test paging through messages and users with cursors."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u = User(id=1, username="author", email="author@test.com", password="x")
+        db.session.add(u)
+        db.session.commit()
+
+        # 25 messages, the last five sharing one timestamp
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        db.session.add_all([
+            Message(id=i, text=f"warble {i}", user_id=1,
+                    timestamp=start + timedelta(minutes=min(i, 20)))
+            for i in range(1, 26)
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_cursor_round_trip(self):
+        """Does a cursor decode back to the key it was made from ?"""
+        when = datetime(2020, 5, 17, 8, 30, 15, 123456, tzinfo=timezone.utc)
+
+        self.assertEqual(decode_cursor(encode_cursor(when, 42)), (when, 42))
+        self.assertEqual(encode_cursor(when.replace(tzinfo=None), 42),
+                         encode_cursor(when, 42))
+        self.assertIsNone(decode_cursor(None))
+        self.assertIsNone(decode_cursor("garbage"))
+
+    def test_message_pages(self):
+        """Do cursors walk every message exactly once, newest first ?"""
+        first = user_messages(1, per_page=10)
+        second = user_messages(1, before=first.next_cursor, per_page=10)
+        third = user_messages(1, before=second.next_cursor, per_page=10)
+
+        ids = [m.id for page in (first, second, third) for m in page.items]
+        self.assertEqual(ids, [25, 24, 23, 22, 21, 20, 19, 18, 17, 16, 15, 14, 13,
+                               12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1])
+        self.assertIsNone(third.next_cursor)
+
+    def test_user_pages(self):
+        """Do user directory pages follow on from each other ?"""
+        db.session.add_all([
+            User(id=i, username=f"user{i}", email=f"{i}@test.com", password="x")
+            for i in range(2, 6)
+        ])
+        db.session.commit()
+
+        first = user_directory(per_page=3)
+        second = user_directory(before=first.next_cursor, per_page=3)
+
+        self.assertEqual([u.id for u in first.items], [5, 4, 3])
+        self.assertEqual([u.id for u in second.items], [2, 1])
+        self.assertIsNone(second.next_cursor)
+
+    def test_profile_next_link(self):
+        """Does the profile page link to the next page ?"""
+        with self.client as c:
+            res = c.get('/users/1')
+            html = res.get_data(as_text=True)
+
+            self.assertIn('warble 25', html)
+            self.assertNotIn('warble 5<', html)
+            self.assertIn('?before=', html)
+
+            cursor = html.split('?before=')[1].split('"')[0]
+            res = c.get(f'/users/1?before={cursor}')
+            html = res.get_data(as_text=True)
+
+            self.assertIn('warble 5<', html)
+            self.assertNotIn('?before=', html)
@@ -0,0 +1,111 @@
+"""Request profiling tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_profiling.py
+
+
+import os
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from profiling import recent_profiles
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ProfilingTestCase(TestCase):
+    """Test per-request profiling."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        u = User.signup("testuser", "test@test.com", "password", None)
+        u.id = 100
+        db.session.commit()
+
+        for i in range(3):
+            db.session.add(Message(text=f"warble {i}", user_id=100,
+                                   timestamp=datetime.now(timezone.utc)))
+        db.session.commit()
+
+        recent_profiles.clear()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_server_timing(self):
+        """Does every response say where its time went ?"""
+        res = self.client.get('/users/100')
+
+        timing = res.headers['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_recorded_profile(self):
+        """Are queries, render time and loaded objects recorded ?"""
+        self.client.get('/users/100')
+
+        profile = recent_profiles[-1]
+        self.assertEqual(profile['endpoint'], 'users_show')
+        self.assertGreater(profile['queries'], 0)
+        self.assertGreater(profile['render_ms'], 0)
+        self.assertGreaterEqual(profile['objects_loaded'], 3)
+        self.assertLessEqual(len(profile['slowest']), 5)
+
+    def test_sampled_log(self):
+        """Are slow requests always logged ?"""
+        app.config['PROFILE_SLOW_MS'] = 0
+        try:
+            with self.assertLogs('warbler.profile') as logs:
+                self.client.get('/users')
+        finally:
+            app.config['PROFILE_SLOW_MS'] = 500
+
+        self.assertIn('"endpoint": "list_users"', logs.output[0])
+
+    def test_debug_endpoint(self):
+        """Is /_debug/profile hidden in production only ?"""
+        self.client.get('/users/100')
+
+        self.assertEqual(self.client.get('/_debug/profile').status_code, 404)
+
+        app.config['ENV'] = 'development'
+        try:
+            res = self.client.get('/_debug/profile')
+        finally:
+            app.config['ENV'] = 'production'
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json[0]['endpoint'], 'users_show')
@@ -0,0 +1,168 @@
+"""Account deletion tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_purge.py
+
+
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes, Job, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+from identity import load_identity
+from jobs import work
+from likes import toggle_like
+from purge import purge_batch, soft_delete_user
+from queries import user_directory
+from testing import count_queries, reset_process_caches
+from timelines import home_timeline, rebuild_timelines
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PurgeTestCase(TestCase):
+    """Test soft deletion and the background purge."""
+
+    def setUp(self):
+        """Create test client, add sample data.
+
+        User 100 is the one deleted: they follow 200, are followed by 300,
+        like one of 200's messages and have their messages liked by both.
+        """
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id, name in [(100, "abc"), (200, "efg"), (300, "hij")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        now = datetime.now(timezone.utc)
+        db.session.add_all([Message(id=i, text=f"warble {i}", user_id=100,
+                                    timestamp=now + timedelta(minutes=i))
+                            for i in range(1, 4)])
+        db.session.add(Message(id=4, text="other", user_id=200, timestamp=now))
+        db.session.add_all([Follows(user_being_followed_id=200,
+                                    user_following_id=100),
+                            Follows(user_being_followed_id=100,
+                                    user_following_id=300)])
+        db.session.commit()
+
+        for user_id, message_id in [(100, 4), (200, 1), (200, 2), (300, 3)]:
+            toggle_like(user_id, message_id)
+        db.session.commit()
+
+        reconcile_counters()
+        rebuild_timelines()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def delete_account(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 100
+            return c.post('/users/delete')
+
+    def test_hidden_at_once(self):
+        """Is a deleted account hidden before it's purged ?"""
+        res = self.delete_account()
+        self.assertEqual(res.status_code, 302)
+
+        self.assertIsNotNone(User.query.get(100).deleted_at)
+        self.assertEqual([job.kind for job in Job.query], ['purge_user'])
+
+        self.assertIsNone(load_identity(100))
+        self.assertFalse(User.authenticate("abc", "password"))
+        self.assertEqual(home_timeline(300).items, [])
+        self.assertEqual([u.id for u in user_directory().items], [300, 200])
+        self.assertEqual([u.id for u in user_directory("abc").items], [])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 300
+            self.assertEqual(c.get('/users/100').status_code, 302)
+            self.assertEqual(c.post('/users/follow/100').status_code, 404)
+
+    def test_purge_in_batches(self):
+        """Are the rows removed in bounded batches, counters kept right ?"""
+        soft_delete_user(100)
+        db.session.commit()
+
+        batches = []
+        while True:
+            removed = purge_batch(100, batch_size=1)
+            db.session.commit()
+            if not removed:
+                break
+            batches.append(removed)
+
+        # 1 follow, 1 follower, 1 like, 4 timeline entries (3 in 300's
+        # timeline, 1 in their own), 3 likes received and 3 messages
+        self.assertEqual(batches, [1] * 13)
+
+        self.assertIsNone(User.query.get(100))
+        self.assertEqual(Message.query.filter_by(user_id=100).count(), 0)
+        self.assertEqual(Likes.query.count(), 0)
+        self.assertEqual(Follows.query.count(), 0)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+
+        # nothing for a recount to repair
+        self.assertEqual(reconcile_counters(), (0, 0))
+
+    def test_purge_job(self):
+        """Does the worker purge a deleted account to the end ?"""
+        self.delete_account()
+
+        work(once=True)
+        self.assertIsNone(User.query.get(100))
+        self.assertEqual(Job.query.count(), 0)
+
+        user = User.query.get(200)
+        self.assertEqual((user.followers_count, user.likes_count), (0, 0))
+        self.assertEqual(Message.query.get(4).likes_count, 0)
+
+    def test_live_accounts_kept(self):
+        """Are accounts that weren't deleted left alone ?"""
+        self.assertEqual(purge_batch(200), 0)
+        self.assertIsNotNone(User.query.get(200))
+        self.assertEqual(Follows.query.count(), 2)
+
+    def test_orm_delete_is_passive(self):
+        """Does deleting a user through the ORM leave cascades to the database ?"""
+        user = User.query.get(100)
+
+        with count_queries() as queries:
+            db.session.delete(user)
+            db.session.commit()
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Message.query.filter_by(user_id=100).count(), 0)
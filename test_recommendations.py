@@ -0,0 +1,182 @@
+"""Who to follow tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_recommendations.py
+
+
+import os
+from unittest import TestCase, skipIf
+
+from models import db, User, Follows, Suggestion
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from jobs import work
+from purge import purge_batch, soft_delete_user
+from recommendations import (sparse, suggestions_for, refresh_suggestions,
+                             refresh_user_suggestions, sparse_suggestions,
+                             python_suggestions)
+from testing import reset_process_caches
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# who follows whom: (follower, followed). 1 follows 2, 3 and 4, who between
+# them follow 5 three times, 6 twice and 7 once.
+EDGES = [(1, 2), (1, 3), (1, 4),
+         (2, 5), (3, 5), (4, 5),
+         (2, 6), (3, 6), (2, 7),
+         (2, 3), (4, 1)]
+
+# what user 1 should be offered, best first: 3 is followed by 2 but 1
+# already follows them, and 1 itself is followed by 4
+EXPECTED = [(5, 3), (6, 2), (7, 1)]
+
+
+def rows_by_user(batches):
+    found = {}
+    for start, stop, rows in batches:
+        for user_id, suggested_id, mutuals in rows:
+            found.setdefault(user_id, []).append((suggested_id, mutuals))
+    return found
+
+
+class RecommendationsTestCase(TestCase):
+    """Test friends-of-friends suggestions."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        for user_id in range(1, 9):
+            u = User.signup(f"user{user_id}", f"{user_id}@test.com",
+                            "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        db.session.add_all([Follows(user_following_id=follower,
+                                    user_being_followed_id=followed)
+                            for follower, followed in EDGES])
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def login(self, c, user_id=1):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_python_suggestions(self):
+        """Are friends of friends ranked by mutuals, leaving out follows ?"""
+        followers, followed = zip(*EDGES)
+        found = rows_by_user(python_suggestions(followers, followed, 9,
+                                                batch_size=4))
+        self.assertEqual(found[1], EXPECTED)
+        self.assertEqual(found[4], [(2, 1), (3, 1)])
+
+        found = rows_by_user(python_suggestions(followers, followed, 9,
+                                                deleted=[5], per_user=1))
+        self.assertEqual(found[1], [(6, 2)])
+
+    @skipIf(sparse is None, "needs numpy and scipy")
+    def test_sparse_matches_python(self):
+        """Do the sparse matrix and Python versions agree ?"""
+        followers, followed = zip(*EDGES)
+        for deleted in [(), (3,), (5, 6)]:
+            for per_user in [1, 2, 20]:
+                self.assertEqual(
+                    rows_by_user(sparse_suggestions(followers, followed, 9,
+                                                    deleted, 3, per_user)),
+                    rows_by_user(python_suggestions(followers, followed, 9,
+                                                    deleted, 3, per_user)))
+
+    def test_refresh(self):
+        """Are suggestions stored, and read back best first ?"""
+        self.assertEqual(refresh_suggestions(batch_size=3), 5)
+        self.assertEqual([(user.id, mutuals)
+                          for user, mutuals in suggestions_for(1)], EXPECTED)
+        self.assertEqual([user.id for user, _ in suggestions_for(1, 2)], [5, 6])
+
+        # one user's refresh agrees with the batch
+        Suggestion.query.filter_by(user_id=1).delete()
+        self.assertEqual(refresh_user_suggestions(1), 3)
+        self.assertEqual([(user.id, mutuals)
+                          for user, mutuals in suggestions_for(1)], EXPECTED)
+
+    def test_deleted_accounts(self):
+        """Are deleted accounts hidden, then purged from suggestions ?"""
+        refresh_suggestions()
+        soft_delete_user(5)
+        db.session.commit()
+        self.assertEqual([user.id for user, _ in suggestions_for(1)], [6, 7])
+
+        while purge_batch(5):
+            pass
+        self.assertEqual(Suggestion.query.filter(
+            (Suggestion.user_id == 5) | (Suggestion.suggested_id == 5)).count(),
+            0)
+
+    def test_follow_updates_suggestions(self):
+        """Does following someone drop them and refresh our suggestions ?"""
+        refresh_suggestions()
+
+        with self.client as c:
+            self.login(c)
+            c.post('/users/follow/5')
+            self.assertEqual([user.id for user, _ in suggestions_for(1)],
+                             [6, 7])
+
+            work(once=True)
+            # 5 follows nobody, so nothing new; 6 and 7 keep their places
+            self.assertEqual([user.id for user, _ in suggestions_for(1)],
+                             [6, 7])
+
+            c.post('/users/stop-following/2')
+            work(once=True)
+            # without 2, only 3 and 4 are left to suggest through
+            self.assertEqual([(user.id, mutuals)
+                              for user, mutuals in suggestions_for(1)],
+                             [(6, 1)])
+
+    def test_suggestion_views(self):
+        """Do the homepage and the suggestions page show suggestions ?"""
+        refresh_suggestions()
+
+        with self.client as c:
+            self.login(c)
+            res = c.get('/')
+            self.assertIn('Who to follow', str(res.data))
+            self.assertIn('@user5', str(res.data))
+
+            res = c.get('/users/suggestions')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('@user7', str(res.data))
+            self.assertIn('Followed by 3 people you follow', str(res.data))
+
+            self.login(c, 8)
+            res = c.get('/')
+            self.assertNotIn('Who to follow', str(res.data))
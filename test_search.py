@@ -0,0 +1,166 @@
+"""User search tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_search.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app
+from search import (backends, search_users, similarity, MAX_CANDIDATES,
+                    MAX_RESULTS, PrefixSearch, TrigramIndex)
+from testing import reset_process_caches, SQLiteMixin
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+
+def add_users(names, start=1):
+    db.session.add_all([
+        User(id=i, username=name, email=f"{name}@test.com", password="x")
+        for i, name in enumerate(names, start=start)
+    ])
+    db.session.commit()
+
+
+class SearchTestCase(TestCase):
+    """Test ranked user search."""
+
+    def setUp(self):
+        """Add users to search through."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        add_users(["bobby", "bob", "jimbob", "robert", "alice"])
+
+        search_users("bob")
+        if isinstance(backends[db.engine], PrefixSearch):
+            db.session.rollback()
+            self.skipTest("ranked search on Postgres needs pg_trgm")
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_similarity(self):
+        """Does similarity behave like pg_trgm's ?"""
+        self.assertEqual(similarity("word", "word"), 1)
+        self.assertEqual(similarity("abc", "xyz"), 0)
+        self.assertAlmostEqual(similarity("word", "two words"), 4 / 11)
+
+    def test_ranking(self):
+        """Do exact, prefix, substring and fuzzy matches come in that order ?"""
+        page = search_users("bob")
+        self.assertEqual([u.username for u in page.items], ["bob", "bobby", "jimbob"])
+
+        page = search_users("alise")
+        self.assertEqual([u.username for u in page.items], ["alice"])
+
+    def test_pages(self):
+        """Can we page through results ?"""
+        first = search_users("bob", per_page=2)
+        second = search_users("bob", before=first.next_cursor, per_page=2)
+
+        self.assertEqual([u.username for u in first.items], ["bob", "bobby"])
+        self.assertEqual([u.username for u in second.items], ["jimbob"])
+        self.assertIsNone(second.next_cursor)
+
+    def test_result_cap(self):
+        """Are results capped at MAX_RESULTS ?"""
+        page = search_users("bob", before=str(MAX_RESULTS))
+        self.assertEqual(page.items, [])
+
+    def test_renamed_user(self):
+        """Does search follow username changes ?"""
+        user = User.query.get(5)
+        user.username = "bobcat"
+        db.session.commit()
+
+        self.assertIn("bobcat", [u.username for u in search_users("bob").items])
+        self.assertEqual(search_users("alice").items, [])
+
+
+class SQLiteSearchTestCase(SQLiteMixin, SearchTestCase):
+    """Test ranked user search over the in-process index."""
+
+    def test_candidate_cap(self):
+        """Does a short query load at most MAX_CANDIDATES users ?"""
+        add_users([f"xbob{i}" for i in range(MAX_CANDIDATES + 10)], start=6)
+
+        index = backends[db.engine]
+        self.assertIsInstance(index, TrigramIndex)
+        self.assertEqual(len(index.candidates("bo")), MAX_CANDIDATES)
+
+        page = search_users("bo")
+        self.assertEqual([u.username for u in page.items[:2]], ["bob", "bobby"])
+
+
+class PrefixSearchTestCase(TestCase):
+    """Test prefix search on a Postgres without pg_trgm."""
+
+    def setUp(self):
+        """Add users to search through."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        add_users(["bobby", "Bob", "jimbob", "b_b", "alice"])
+        backends[db.engine] = PrefixSearch()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def test_prefix_index(self):
+        """Is lower(username) indexed for prefix matching ?"""
+        found = db.session.execute(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE indexname = 'ix_users_username_prefix'").scalar()
+        self.assertIn("text_pattern_ops", found)
+
+    def test_prefix_matches(self):
+        """Are only prefix matches returned, exact match first ?"""
+        page = search_users("bob")
+        self.assertEqual([u.username for u in page.items], ["Bob", "bobby"])
+
+        page = search_users("B_")
+        self.assertEqual([u.username for u in page.items], ["b_b"])
+
+    def test_pages(self):
+        """Can we page through results, capped at MAX_RESULTS ?"""
+        first = search_users("b", per_page=2)
+        second = search_users("b", before=first.next_cursor, per_page=2)
+
+        self.assertEqual([u.username for u in first.items], ["b_b", "Bob"])
+        self.assertEqual([u.username for u in second.items], ["bobby"])
+        self.assertIsNone(second.next_cursor)
+        self.assertEqual(search_users("b", before=str(MAX_RESULTS)).items, [])
+
+    def test_deleted_user(self):
+        """Are deleted users left out ?"""
+        User.query.get(1).deleted_at = db.func.now()
+        db.session.commit()
+
+        self.assertEqual([u.username for u in search_users("bob").items], ["Bob"])
@@ -0,0 +1,368 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_timelines.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime, timedelta
+
+from models import db, Message, User, Follows, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from jobs import work
+from purge import soft_delete_user
+from testing import SQLiteMixin, reset_process_caches
+from timelines import (home_timeline, rebuild_timelines, fan_out_message,
+                       merge_newest, update_celebrity, celebrity_messages)
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class TimelineTestCase(TestCase):
+    """Test the precomputed home timelines."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        reader = User.signup("reader", "reader@test.com", "password", None)
+        reader.id = 100
+        author = User.signup("author", "author@test.com", "password", None)
+        author.id = 200
+        db.session.commit()
+
+        self.time = datetime.now().astimezone()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        app.config['CELEBRITY_FOLLOWERS'] = 10000
+        return resp
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 100
+
+    def test_follow_backfills_timeline(self):
+        """Does following someone pull their messages into our timeline ?"""
+        m = Message(id=1, text="old warble", user_id=200, timestamp=self.time)
+        db.session.add(m)
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c)
+            c.post('/users/follow/200')
+
+        self.assertEqual(home_timeline(100).items, [])
+        work(once=True)
+        self.assertEqual([m.id for m in home_timeline(100).items], [1])
+
+    def test_new_message_fans_out(self):
+        """Does a new message land in each follower's timeline ?"""
+        db.session.add(Follows(user_being_followed_id=200, user_following_id=100))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 200
+            c.post('/messages/new', data={"text": "fresh warble"})
+
+        work(once=True)
+        entry = TimelineEntry.query.one()
+        self.assertEqual(entry.user_id, 100)
+        self.assertEqual(entry.author_id, 200)
+
+        self.assertEqual([m.text for m in home_timeline(100).items], ["fresh warble"])
+
+        with self.client as c:
+            self.login(c)
+            res = c.get('/')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('fresh warble', str(res.data))
+
+    @patch('timelines.TRIM_EVERY', 2)
+    @patch('timelines.TIMELINE_LENGTH', 3)
+    def test_fan_out_trims_each_timeline(self):
+        """Is every timeline kept near its length, whatever the message ids ?"""
+        db.session.add(Follows(user_being_followed_id=200, user_following_id=100))
+        db.session.commit()
+
+        lengths = []
+        # odd ids only, which no global "every n-th message" rule would hit
+        for n, message_id in enumerate(range(1, 21, 2)):
+            m = Message(id=message_id, text=f"warble {message_id}",
+                        user_id=200, timestamp=self.time + timedelta(minutes=n))
+            db.session.add(m)
+            db.session.flush()
+            fan_out_message(m)
+            lengths.append(TimelineEntry.query.filter_by(user_id=100).count())
+        db.session.commit()
+
+        self.assertLessEqual(max(lengths), 4)
+        self.assertEqual(lengths[-1], 3)
+        self.assertEqual([m.id for m in home_timeline(100).items], [19, 17, 15])
+
+    def test_unfollow_prunes_timeline(self):
+        """Does unfollowing someone remove their messages from our timeline ?"""
+        m = Message(id=1, text="old warble", user_id=200, timestamp=self.time)
+        db.session.add(m)
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c)
+            c.post('/users/follow/200')
+            c.post('/users/stop-following/200')
+
+        work(once=True)
+        self.assertEqual(home_timeline(100).items, [])
+
+    def test_rebuild_timelines(self):
+        """Does a rebuild order timelines newest first ?"""
+        db.session.add(Follows(user_being_followed_id=200, user_following_id=100))
+        db.session.add_all([
+            Message(id=1, text="older", user_id=200,
+                    timestamp=self.time - timedelta(days=1)),
+            Message(id=2, text="newer", user_id=200, timestamp=self.time),
+        ])
+        db.session.commit()
+
+        self.assertEqual(rebuild_timelines(), 2)
+        self.assertEqual([m.id for m in home_timeline(100).items], [2, 1])
+        self.assertEqual(home_timeline(200).items, [])
+
+    def add_celebrity(self):
+        """Make user 300 a celebrity followed by the reader."""
+        app.config['CELEBRITY_FOLLOWERS'] = 3
+
+        celeb = User.signup("celeb", "celeb@test.com", "password", None)
+        celeb.id = 300
+        db.session.flush()
+        celeb.followers_count = 3
+        celeb.celebrity = True
+        db.session.add_all([
+            Follows(user_being_followed_id=200, user_following_id=100),
+            Follows(user_being_followed_id=300, user_following_id=100),
+        ])
+        db.session.commit()
+
+    def test_celebrity_merged_on_read(self):
+        """Are celebrities' messages merged in on read instead of pushed ?"""
+        self.add_celebrity()
+
+        for i in range(1, 7):
+            m = Message(id=i, text=f"warble {i}", user_id=200 if i % 2 else 300,
+                        timestamp=self.time + timedelta(minutes=i))
+            db.session.add(m)
+            db.session.flush()
+            fan_out_message(m)
+        db.session.commit()
+
+        self.assertEqual(sorted(e.message_id for e in TimelineEntry.query),
+                         [1, 3, 5])
+
+        first = home_timeline(100, per_page=4)
+        self.assertEqual([m.id for m in first.items], [6, 5, 4, 3])
+        rest = home_timeline(100, before=first.next_cursor, per_page=4)
+        self.assertEqual([m.id for m in rest.items], [2, 1])
+        self.assertIsNone(rest.next_cursor)
+
+        soft_delete_user(300)
+        db.session.commit()
+        self.assertEqual([m.id for m in home_timeline(100).items], [5, 3, 1])
+
+    def test_rebuild_leaves_out_celebrities(self):
+        """Do rebuilt timelines still get celebrities' messages on read ?"""
+        self.add_celebrity()
+        db.session.add_all([
+            Message(id=1, text="plain", user_id=200, timestamp=self.time),
+            Message(id=2, text="famous", user_id=300,
+                    timestamp=self.time + timedelta(minutes=1)),
+        ])
+        db.session.commit()
+
+        rebuild_timelines()
+        self.assertEqual([e.message_id for e in TimelineEntry.query], [1])
+        self.assertEqual([m.id for m in home_timeline(100).items], [2, 1])
+
+    def test_merge_newest(self):
+        """Are streams merged newest first, without duplicates ?"""
+        m = [Message(id=i, timestamp=self.time + timedelta(minutes=i))
+             for i in range(5)]
+
+        self.assertEqual(merge_newest([[m[4], m[2], m[1]], [m[3], m[2], m[0]]],
+                                      limit=4),
+                         [m[4], m[3], m[2], m[1]])
+
+    def test_timeline_path_recorded(self):
+        """Does the homepage report which path its timeline took ?"""
+        with self.client as c:
+            self.login(c)
+            res = c.get('/')
+            self.assertIn('timeline;', res.headers['Server-Timing'])
+            self.assertIn('path=push', res.headers['Server-Timing'])
+
+            self.add_celebrity()
+            db.session.add(Message(text="famous", user_id=300,
+                                   timestamp=self.time))
+            db.session.commit()
+            res = c.get('/')
+            self.assertIn('path=hybrid celebrities=1 merge_ms=',
+                          res.headers['Server-Timing'])
+
+    def test_celebrity_who_loses_followers_is_backfilled(self):
+        """When a celebrity drops back under the threshold, do their earlier
+        messages stay in their followers' timelines ?"""
+        self.add_celebrity()
+        app.config['CELEBRITY_FOLLOWERS'] = 2
+        db.session.add(Follows(user_being_followed_id=300, user_following_id=200))
+        User.query.get(300).followers_count = 2
+        db.session.add(Message(id=1, text="famous", user_id=300,
+                               timestamp=self.time))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 200
+
+            # one follower left is under 90% of the threshold of two
+            c.post('/users/stop-following/300')
+            self.assertFalse(User.query.get(300).celebrity)
+            work(once=True)
+
+        self.assertEqual([e.message_id for e in
+                          TimelineEntry.query.filter_by(user_id=100)], [1])
+        self.assertEqual([m.id for m in home_timeline(100).items], [1])
+
+    def test_celebrity_threshold_has_slack(self):
+        """Does a follower count hovering at the threshold keep its flag ?"""
+        app.config['CELEBRITY_FOLLOWERS'] = 10
+        author = User.query.get(200)
+
+        author.followers_count = 10
+        db.session.flush()
+        self.assertIs(update_celebrity(200), True)
+        author.followers_count = 9
+        db.session.flush()
+        self.assertIsNone(update_celebrity(200))
+        author.followers_count = 8
+        db.session.flush()
+        self.assertIs(update_celebrity(200), False)
+        self.assertIsNone(update_celebrity(200))
+
+    def test_message_deleted_during_merge_is_dropped(self):
+        """Is a celebrity message deleted between the two queries left out ?"""
+        self.add_celebrity()
+        for i in (1, 2):
+            db.session.add(Message(id=i, text=f"famous {i}", user_id=300,
+                                   timestamp=self.time + timedelta(minutes=i)))
+        db.session.commit()
+
+        def then_delete(*args):
+            found = celebrity_messages(*args)
+            Message.query.filter_by(id=2).delete()
+            return found
+
+        with patch('timelines.celebrity_messages', then_delete):
+            page = home_timeline(100)
+
+        self.assertEqual([m.id for m in page.items], [1])
+        self.assertTrue(all(isinstance(m, Message) for m in page.items))
+
+
+class SQLiteTimelineTestCase(SQLiteMixin, TestCase):
+    """Test the home timelines on the SQLite stand-in."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+        self.client = app.test_client()
+        app.config['CELEBRITY_FOLLOWERS'] = 1
+
+        for user_id, name in [(100, "reader"), (200, "author"), (300, "celeb")]:
+            u = User.signup(name, f"{name}@test.com", "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        self.time = datetime.now().astimezone()
+
+    def tearDown(self):
+        app.config['CELEBRITY_FOLLOWERS'] = 10000
+        return super().tearDown()
+
+    def test_celebrities(self):
+        """Do follows flip the celebrity flag, and are celebrities merged in ?"""
+        db.session.add_all([
+            Message(id=i, text=f"famous {i}", user_id=300,
+                    timestamp=self.time + timedelta(minutes=i))
+            for i in range(1, 4)])
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 100
+
+            self.assertEqual(c.post('/users/follow/300').status_code, 302)
+            self.assertTrue(User.query.get(300).celebrity)
+
+            res = c.get('/')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('path=hybrid', res.headers['Server-Timing'])
+
+        first = home_timeline(100, per_page=2)
+        self.assertEqual([m.id for m in first.items], [3, 2])
+        rest = home_timeline(100, before=first.next_cursor, per_page=2)
+        self.assertEqual([m.id for m in rest.items], [1])
+
+        User.query.get(300).followers_count = 0
+        db.session.flush()
+        self.assertIs(update_celebrity(300), False)
+        self.assertIsNone(update_celebrity(300))
+
+    @patch('timelines.TRIM_EVERY', 2)
+    @patch('timelines.TIMELINE_LENGTH', 3)
+    def test_posts_fan_out_and_trim(self):
+        """Are posted messages pushed, and timelines trimmed ?"""
+        app.config['JOBS_EAGER'] = True
+        db.session.add(Follows(user_being_followed_id=200, user_following_id=100))
+        db.session.commit()
+
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = 200
+                for n in range(5):
+                    res = c.post('/messages/new', data={"text": f"warble {n}"})
+                    self.assertEqual(res.status_code, 302)
+        finally:
+            app.config['JOBS_EAGER'] = False
+
+        self.assertEqual([m.text for m in home_timeline(100).items],
+                         ["warble 4", "warble 3", "warble 2", "warble 1"])
@@ -0,0 +1,218 @@
+"""Trending tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_trending.py
+
+
+import os
+import time
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, TrendingCount
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from purge import soft_delete_user
+from testing import SQLiteMixin, reset_process_caches
+from trending import (BUCKET_SECONDS, FLUSH_SECONDS, HASHTAGS, MESSAGES,
+                      WINDOW_BUCKETS, SpaceSaving, bucket_of, extract_hashtags,
+                      init_trending, recorder, rankings, top_keys,
+                      trending_hashtags, trending_messages)
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class TrendingTestCase(TestCase):
+    """Test trending messages and hashtags."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        self.client = app.test_client()
+
+        self.user_ids = [1, 2, 3, 4]
+        self.author_id = 1
+        for user_id in self.user_ids:
+            u = User.signup(f"user{user_id}", f"{user_id}@test.com",
+                            "password", None)
+            u.id = user_id
+        db.session.commit()
+
+        # clear of the ids that messages posted in the tests get
+        self.message_ids = [101, 102, 103]
+        db.session.add_all([Message(id=message_id, text=f"warble {message_id}",
+                                    user_id=self.author_id,
+                                    timestamp=datetime.now(timezone.utc))
+                            for message_id in self.message_ids])
+        db.session.commit()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.rollback()
+        return resp
+
+    def like(self, user_id, message_id):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+            return c.post(f"/users/add_like/{message_id}")
+
+    def test_extract_hashtags(self):
+        text = "#Flask and #flask, #2024, c#, a#b, &#39; #naïve #web_dev"
+        self.assertEqual(extract_hashtags(text), ['flask', 'naïve', 'web_dev'])
+        self.assertEqual(extract_hashtags(None), [])
+
+    def test_space_saving_keeps_heavy_hitters(self):
+        sketch = SpaceSaving(3)
+        stream = ['a'] * 50 + ['b'] * 30 + [f"noise{n}" for n in range(20)]
+        stream += ['a'] * 10 + ['b'] * 5
+
+        for key in stream:
+            sketch.add(key)
+
+        self.assertEqual(len(sketch), 3)
+        counts = {key: (count, error) for key, count, error in sketch.items()}
+        self.assertEqual(counts['a'], (60, 0))
+        self.assertEqual(counts['b'], (35, 0))
+
+        # the third counter has been passed from noise key to noise key
+        (key, (count, error)), = [item for item in counts.items()
+                                  if item[0] not in ('a', 'b')]
+        self.assertTrue(key.startswith('noise'))
+        self.assertLessEqual(count - error, 1)
+
+    def test_likes_rank_messages(self):
+        first, second, third = self.message_ids
+        for user_id in self.user_ids[1:]:
+            self.like(user_id, second)
+        self.like(self.user_ids[1], first)
+        self.like(self.user_ids[2], first)
+        # liking again unlikes, which isn't counted either way
+        self.like(self.user_ids[2], first)
+
+        recorder.flush(force=True)
+
+        self.assertEqual([m.id for m in trending_messages()], [second, first])
+        self.assertEqual(top_keys(MESSAGES),
+                         [(str(second), 3.0), (str(first), 2.0)])
+
+    def test_posted_hashtags_trend(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.author_id
+            for text in ["#python is fun", "#Python and #flask",
+                         "more #flask #python"]:
+                resp = c.post("/messages/new", data={"text": text})
+                self.assertEqual(resp.status_code, 302)
+
+        recorder.flush(force=True)
+
+        self.assertEqual(trending_hashtags(), ['python', 'flask'])
+
+    def test_older_activity_counts_less(self):
+        now = time.time()
+        old, new, expired = map(str, self.message_ids)
+
+        for _ in range(3):
+            recorder.add(MESSAGES, old, now - 3 * 3600)
+        for _ in range(2):
+            recorder.add(MESSAGES, new, now)
+        for _ in range(10):
+            recorder.add(MESSAGES, expired,
+                         now - (WINDOW_BUCKETS + 1) * BUCKET_SECONDS)
+        recorder.flush(force=True)
+
+        scores = dict(top_keys(MESSAGES, now=now))
+        self.assertEqual(list(scores), [new, old])
+        self.assertLess(scores[old], 3 * 0.5 ** 2.5)
+
+    def test_flushes_are_batched_and_prune_old_buckets(self):
+        now = time.time()
+        recorder.add(HASHTAGS, 'stale', now - (WINDOW_BUCKETS + 5) * BUCKET_SECONDS)
+        recorder.flush(force=True)
+        self.assertEqual(TrendingCount.query.count(), 1)
+
+        recorder.add(HASHTAGS, 'fresh', now)
+        recorder.add(HASHTAGS, 'fresh', now)
+        # too soon after the last flush
+        self.assertEqual(recorder.flush(), 0)
+        self.assertEqual(recorder.flush(force=True), 1)
+
+        counts = TrendingCount.query.all()
+        self.assertEqual([(c.key, c.bucket, c.count) for c in counts],
+                         [('fresh', bucket_of(now), 2)])
+
+    def test_reads_flush_pending_counts(self):
+        """Are counts flushed by reads, in a process that records no more ?"""
+        recorder.add(HASHTAGS, 'quiet')
+        recorder.flush()
+        self.assertEqual(TrendingCount.query.count(), 0)
+
+        recorder.flushed_at -= FLUSH_SECONDS
+        self.assertEqual(trending_hashtags(), ['quiet'])
+        self.assertEqual(TrendingCount.query.count(), 1)
+
+    def test_counts_flushed_at_exit(self):
+        """Are the counts left over when the process exits flushed ?"""
+        with patch('trending.atexit.register') as register:
+            init_trending(app)
+        flush_at_exit, = register.call_args[0]
+
+        recorder.add(HASHTAGS, 'goodbye')
+        flush_at_exit()
+
+        self.assertEqual([c.key for c in TrendingCount.query], ['goodbye'])
+
+    def test_deleted_authors_drop_out(self):
+        self.like(self.user_ids[1], self.message_ids[0])
+        recorder.flush(force=True)
+        self.assertEqual(len(trending_messages()), 1)
+
+        soft_delete_user(self.author_id)
+        db.session.commit()
+        rankings.clear()
+
+        self.assertEqual(trending_messages(), [])
+
+    def test_homepage_shows_trending(self):
+        self.like(self.user_ids[1], self.message_ids[1])
+        recorder.add(HASHTAGS, 'warbler')
+        recorder.flush(force=True)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_ids[2]
+            resp = c.get("/")
+
+        html = resp.get_data(as_text=True)
+        self.assertIn('id="trending"', html)
+        self.assertIn('#warbler', html)
+        self.assertIn(f'href="/messages/{self.message_ids[1]}"', html)
+
+
+class SQLiteTrendingTestCase(SQLiteMixin, TrendingTestCase):
+    """Test trending messages and hashtags on the SQLite stand-in."""
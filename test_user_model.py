@@ -25,6 +25,7 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
 # Now we can import app
 
 from app import app
+from testing import reset_process_caches
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -39,6 +40,7 @@ class UserModelTestCase(TestCase):
         """Create test client, add sample data."""
         db.drop_all()
         db.create_all()
+        reset_process_caches()
 
         u1 = User.signup("test1", "email1@email.com", "password", None)
         uid1 = 1111
@@ -107,6 +109,17 @@ class UserModelTestCase(TestCase):
         self.assertTrue(self.u2.is_followed_by(self.u1))
         self.assertFalse(self.u1.is_followed_by(self.u2))
 
+    def test_following_among(self):
+        """Can we ask which of several users we follow in one go ?"""
+        u3 = User.signup("test3", "email3@email.com", "password", None)
+        u3.id = 3333
+        self.u1.following.append(self.u2)
+        db.session.commit()
+
+        self.assertEqual(self.u1.following_among([self.uid2, 3333, 9999]), {self.uid2})
+        self.assertEqual(self.u2.following_among([self.uid1, 3333]), set())
+        self.assertEqual(self.u1.following_among([]), set())
+
     def test_valid_signup(self):
         u_test = User.signup("test9", "email9@email.com", "password", None)
         uid = 12
@@ -10,6 +10,8 @@ from unittest import TestCase
 from datetime import datetime
 from models import db, connect_db, Message, User, Likes, Follows
 from bs4 import BeautifulSoup
+from testing import QueryCountMixin, reset_process_caches
+from counters import reconcile_counters
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -35,7 +37,7 @@ app.config['WTF_CSRF_ENABLED'] = False
 def echo(element):
     print(f'***********  {element}')
 
-class MessageViewTestCase(TestCase):
+class MessageViewTestCase(QueryCountMixin, TestCase):
     """Test views for messages."""
 
     def setUp(self):
@@ -43,6 +45,7 @@ class MessageViewTestCase(TestCase):
 
         db.drop_all()
         db.create_all()
+        reset_process_caches()
 
         self.client = app.test_client()
 
@@ -80,6 +83,23 @@ class MessageViewTestCase(TestCase):
             self.assertIn('@abc', str(res.data))
             self.assertIn('@hij', str(res.data))
 
+    def test_user_index_follow_buttons(self):
+        """Are follow buttons on the users page answered without a query per card ?"""
+        self.setup_followers()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with self.assertMaxQueries(2):
+                res = c.get('/users')
+
+            soup = BeautifulSoup(str(res.data), 'html.parser')
+            unfollow = soup.find_all('form', {'action': lambda a: a and 'stop-following' in a})
+            self.assertEqual(sorted(f['action'] for f in unfollow),
+                             [f'/users/stop-following/{self.u1_id}',
+                              f'/users/stop-following/{self.u2_id}'])
+
     def test_user_search(self):
         """Are we getting the correct user index searching ?"""
         with self.client as c:
@@ -111,6 +131,9 @@ class MessageViewTestCase(TestCase):
         db.session.add(l1)
         db.session.commit()
 
+        # rows added straight to the tables bypass the counters
+        reconcile_counters()
+
     def test_user_show_with_likes(self):
         """Can we see likes when logging in ?"""
         self.setup_likes()
@@ -138,6 +161,32 @@ class MessageViewTestCase(TestCase):
             self.assertIn("1", found[3].text)
 
 
+    def test_user_show_query_count(self):
+        """Does the profile page load authors and stats without N+1 queries ?"""
+        self.setup_likes()
+        self.setup_followers()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            with self.assertMaxQueries(6):
+                res = c.get(f'/users/{self.testuser_id}')
+            self.assertEqual(res.status_code, 200)
+
+    def test_user_likes_query_count(self):
+        """Does the likes page load authors and stats without N+1 queries ?"""
+        self.setup_likes()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with self.assertMaxQueries(6):
+                res = c.get(f'/users/{self.testuser_id}/likes')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('likable warble', str(res.data))
+
     def test_add_like(self):
         m = Message(id=1234, text="New test mssg", user_id=f'{self.u1_id}', timestamp=self.time)
         db.session.add(m)
@@ -189,6 +238,7 @@ class MessageViewTestCase(TestCase):
 
         db.session.add_all([f1,f2,f3])
         db.session.commit()
+        reconcile_counters()
 
     def test_user_with_follows(self):
         self.setup_followers()
@@ -0,0 +1,91 @@
+"""Helpers for Warbler's test suite."""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from follow_graph import follow_graph
+from fragments import fragment_cache
+from identity import identity_cache
+from models import db
+from search import backends as search_backends
+from trending import bucket_tops, rankings, recorder
+
+
+def reset_process_caches():
+    """Forget everything cached in this process about the database's rows,
+    for tests that start over on a fresh database."""
+
+    identity_cache.clear()
+    fragment_cache.backend.clear()
+    follow_graph.clear()
+    recorder.clear()
+    bucket_tops.clear()
+    rankings.clear()
+    search_backends.clear()
+
+
+class QueryCounter:
+    """Record every SQL statement sent to the database."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements run inside the `with` block."""
+
+    counter = QueryCounter()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', counter)
+
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+class QueryCountMixin:
+    """TestCase mixin for putting a hard cap on SQL statements per request."""
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """Fail if the `with` block runs more than `limit` SQL statements."""
+
+        with count_queries() as counter:
+            yield counter
+
+        if len(counter) > limit:
+            statements = "\n\n".join(counter.statements)
+            self.fail(f"{len(counter)} queries run, expected at most {limit}:"
+                      f"\n\n{statements}")
+
+
+class SQLiteMixin:
+    """TestCase mixin running each test against a fresh in-memory SQLite
+    database, the stand-in for Postgres, instead of the test database."""
+
+    def setUp(self):
+        app = db.get_app()
+        self.postgres_uri = app.config['SQLALCHEMY_DATABASE_URI']
+
+        db.session.remove()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.drop_all()
+        db.create_all()
+        reset_process_caches()
+
+        super().setUp()
+
+    def tearDown(self):
+        resp = super().tearDown()
+        db.session.remove()
+        db.get_app().config['SQLALCHEMY_DATABASE_URI'] = self.postgres_uri
+        return resp
@@ -0,0 +1,431 @@
+"""Precomputed home timelines for Warbler.
+
+Instead of gathering the messages of everyone a user follows on every visit
+to the homepage, each new message is pushed ("fanned out") into a bounded
+per-follower timeline when it is written. The homepage then reads a single
+indexed range of `timeline_entries`.
+
+Pushing is a poor fit for celebrities, though: one message from an author
+with a million followers would be a million inserts. Authors marked
+`celebrity` are therefore never pushed. Instead a reader's page merges their
+pushed entries with the recent messages of each celebrity they follow,
+fetched in one query and combined with a k-way heap merge. Each read records
+which path it took and how long the merge took in the request profile (see
+profiling.py).
+
+Users become celebrities when their follower count reaches
+CELEBRITY_FOLLOWERS (an app setting), and only stop being one once it drops
+below CELEBRITY_SLACK of that, so a count hovering around the threshold
+doesn't flip them back and forth. When one stops, a `push_author` job copies
+their recent messages into their followers' timelines, which never had
+them. `flask rebuild-timelines` resets every flag from the current setting.
+"""
+
+import heapq
+import time
+from collections import defaultdict
+
+from sqlalchemy import and_, func, literal, or_, select, true, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
+
+from models import db, Follows, Message, TimelineEntry, TimelineTrim, User
+from pagination import (PAGE_SIZE, decode_cursor, keyset_page_of,
+                        keyset_rows)
+from profiling import record_timing
+
+# how many entries each home timeline keeps
+TIMELINE_LENGTH = 800
+
+# celebrities go back to being pushed below this share of CELEBRITY_FOLLOWERS
+CELEBRITY_SLACK = 0.9
+
+# followers backfilled per push_author job
+PUSH_BATCH_SIZE = 100
+
+# a timeline is trimmed back to TIMELINE_LENGTH once this many messages
+# have been pushed into it since it was last trimmed, so the trimming cost
+# is amortized and no timeline holds more than TIMELINE_LENGTH + TRIM_EVERY
+TRIM_EVERY = 50
+
+TIMELINE_COLUMNS = ['user_id', 'message_id', 'author_id', 'timestamp']
+
+
+def celebrity_threshold():
+    return db.get_app().config['CELEBRITY_FOLLOWERS']
+
+
+def is_celebrity(user_id):
+    """Are `user_id`'s messages left out of fan-out ?"""
+
+    return bool(db.session
+                .query(User.celebrity)
+                .filter(User.id == user_id)
+                .scalar())
+
+
+def update_celebrity(user_id):
+    """Mark `user_id` a celebrity, or not, if their follower count has
+    crossed the threshold.
+
+    Returns True if they have just become one, False if they have just
+    stopped being one -- their followers then need a `push_author` job --
+    and None if nothing changed.
+    """
+
+    threshold = celebrity_threshold()
+    users = User.__table__
+
+    flipped = db.session.execute(
+        users
+        .update()
+        .where(users.c.id == user_id)
+        .where(or_(and_(~users.c.celebrity,
+                        users.c.followers_count >= threshold),
+                   and_(users.c.celebrity,
+                        users.c.followers_count < threshold * CELEBRITY_SLACK)))
+        .values(celebrity=~users.c.celebrity))
+
+    if not flipped.rowcount:
+        return None
+
+    return is_celebrity(user_id)
+
+
+def home_timeline(user_id, before=None, per_page=PAGE_SIZE):
+    """Return a page of `user_id`'s home timeline, newest first."""
+
+    started = time.perf_counter()
+
+    # authors who deleted their account drop out straight away, before
+    # their entries are purged
+    query = (Message
+             .query
+             .join(User, User.id == Message.user_id)
+             .options(contains_eager(Message.user))
+             .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+             .filter(TimelineEntry.user_id == user_id,
+                     User.deleted_at.is_(None)))
+
+    pushed = keyset_rows(query, TimelineEntry.timestamp,
+                         TimelineEntry.message_id, before, per_page + 1)
+
+    pulled = celebrity_messages(user_id, before, per_page + 1)
+    if not pulled:
+        record_timing('timeline', time.perf_counter() - started, path='push')
+        return keyset_page_of(pushed, per_page)
+
+    merge_started = time.perf_counter()
+    rows = merge_newest([pushed] + pulled, per_page + 1)
+    merged = time.perf_counter()
+
+    # only the celebrities' messages that made the page are loaded in full;
+    # any deleted since the first query drop out
+    shown = [row.id for row in rows if not isinstance(row, Message)]
+    if shown:
+        loaded = {message.id: message for message in
+                  Message
+                  .query
+                  .join(User, User.id == Message.user_id)
+                  .options(contains_eager(Message.user))
+                  .filter(Message.id.in_(shown))}
+        rows = [row if isinstance(row, Message) else loaded[row.id]
+                for row in rows
+                if isinstance(row, Message) or row.id in loaded]
+
+    record_timing('timeline', time.perf_counter() - started, path='hybrid',
+                  celebrities=len(pulled),
+                  merge_ms=round((merged - merge_started) * 1000, 2))
+    return keyset_page_of(rows, per_page)
+
+
+def celebrity_messages(user_id, before=None, limit=PAGE_SIZE):
+    """The (id, timestamp) keys of the newest `limit` messages before the
+    `before` cursor of each celebrity `user_id` follows, as one newest-first
+    list per celebrity.
+
+    One query: on Postgres, a LATERAL top-N scan of each celebrity's index
+    range; elsewhere, their messages numbered with row_number().
+    """
+
+    celebrities = (Follows.__table__
+                   .join(User.__table__,
+                         User.id == Follows.user_being_followed_id))
+    followed = and_(Follows.user_following_id == user_id,
+                    User.celebrity,
+                    User.deleted_at.is_(None))
+
+    key = decode_cursor(before)
+    newest_first = [Message.timestamp.desc(), Message.id.desc()]
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        recent = (select([Message.id, Message.user_id, Message.timestamp])
+                  .where(Message.user_id == User.id))
+        if key:
+            recent = recent.where(tuple_(Message.timestamp, Message.id) <
+                                  tuple_(*key))
+
+        recent = recent.order_by(*newest_first).limit(limit).lateral()
+
+        query = (select([recent.c.id, recent.c.user_id, recent.c.timestamp])
+                 .select_from(celebrities.join(recent, true()))
+                 .where(followed))
+    else:
+        position = (func
+                    .row_number()
+                    .over(partition_by=Message.user_id, order_by=newest_first)
+                    .label('position'))
+
+        recent = (select([Message.id, Message.user_id, Message.timestamp,
+                          position])
+                  .where(Message.user_id.in_(select([User.id])
+                                             .select_from(celebrities)
+                                             .where(followed))))
+        if key:
+            recent = recent.where(tuple_(Message.timestamp, Message.id) <
+                                  tuple_(*key))
+
+        recent = recent.alias()
+        query = (select([recent.c.id, recent.c.user_id, recent.c.timestamp])
+                 .where(recent.c.position <= limit))
+
+    rows = db.session.execute(query)
+
+    by_author = defaultdict(list)
+    for row in rows:
+        by_author[row.user_id].append(row)
+
+    return [sorted(author_rows, key=_newest_first, reverse=True)
+            for author_rows in by_author.values()]
+
+
+def merge_newest(streams, limit):
+    """Merge newest-first lists of messages (or message keys) into the newest
+    `limit`, dropping duplicates: a message pushed before its author became
+    a celebrity is both in the timeline and among their recent messages."""
+
+    merged = []
+    for row in heapq.merge(*streams, key=_newest_first, reverse=True):
+        if merged and merged[-1].id == row.id:
+            continue
+        merged.append(row)
+        if len(merged) == limit:
+            break
+
+    return merged
+
+
+def _newest_first(row):
+    return (row.timestamp, row.id)
+
+
+def fan_out_message(message):
+    """Push `message` into the timeline of every follower of its author.
+
+    The message must already be flushed so it has an id. Followers who
+    already have it (from a backfill, or an earlier run) are skipped, and
+    celebrities' messages aren't pushed at all.
+    """
+
+    if is_celebrity(message.user_id):
+        return
+
+    already_there = (db.session
+                     .query(TimelineEntry.message_id)
+                     .filter(TimelineEntry.user_id == Follows.user_following_id,
+                             TimelineEntry.message_id == message.id)
+                     .exists())
+
+    followers = (db.session
+                 .query(Follows.user_following_id,
+                        literal(message.id),
+                        literal(message.user_id),
+                        literal(message.timestamp))
+                 .filter(Follows.user_being_followed_id == message.user_id,
+                         ~already_there))
+
+    _insert_entries(followers)
+
+    # count the push against each follower's timeline -- the rows that
+    # exist, then new ones for the rest -- and trim the timelines that are due
+    follower_ids = (db.session
+                    .query(Follows.user_following_id)
+                    .filter(Follows.user_being_followed_id == message.user_id))
+    counted = (TimelineTrim
+               .query
+               .filter(TimelineTrim.user_id.in_(follower_ids.subquery())))
+
+    counted.update({TimelineTrim.pushed: TimelineTrim.pushed + 1},
+                   synchronize_session=False)
+
+    uncounted = (db.session
+                 .query(Follows.user_following_id, literal(1))
+                 .filter(Follows.user_being_followed_id == message.user_id,
+                         ~db.session
+                         .query(TimelineTrim.user_id)
+                         .filter(TimelineTrim.user_id == Follows.user_following_id)
+                         .exists()))
+    try:
+        with db.session.begin_nested():
+            db.session.execute(TimelineTrim
+                               .__table__
+                               .insert()
+                               .from_select(['user_id', 'pushed'],
+                                            uncounted.statement))
+    except IntegrityError:
+        # a concurrent fan-out added some of them first; counting this push
+        # twice only trims these timelines a little early
+        counted.update({TimelineTrim.pushed: TimelineTrim.pushed + 1},
+                       synchronize_session=False)
+
+    due = [user_id for (user_id,) in
+           counted
+           .filter(TimelineTrim.pushed >= TRIM_EVERY)
+           .with_entities(TimelineTrim.user_id)]
+    if due:
+        trim_timelines(due)
+
+
+def backfill_follow(follower_id, followed_id):
+    """Copy the recent messages of `followed_id` into `follower_id`'s timeline.
+
+    Nothing to do for a celebrity: their messages are merged in on read.
+    """
+
+    if is_celebrity(followed_id):
+        return
+
+    already_there = (db.session
+                     .query(TimelineEntry.message_id)
+                     .filter(TimelineEntry.user_id == follower_id,
+                             TimelineEntry.message_id == Message.id)
+                     .exists())
+
+    recent = (db.session
+              .query(literal(follower_id),
+                     Message.id,
+                     Message.user_id,
+                     Message.timestamp)
+              .filter(Message.user_id == followed_id, ~already_there)
+              .order_by(Message.timestamp.desc())
+              .limit(TIMELINE_LENGTH))
+
+    _insert_entries(recent)
+    trim_timelines([follower_id])
+
+
+def push_author(author_id, after=0, batch_size=PUSH_BATCH_SIZE):
+    """Backfill the recent messages of `author_id`, no longer a celebrity,
+    into the timelines of the next `batch_size` of their followers with ids
+    above `after`.
+
+    Returns the last follower id done, or None once there are no more.
+    """
+
+    follower_ids = [follower_id for (follower_id,) in
+                    db.session
+                    .query(Follows.user_following_id)
+                    .filter(Follows.user_being_followed_id == author_id,
+                            Follows.user_following_id > after)
+                    .order_by(Follows.user_following_id)
+                    .limit(batch_size)]
+
+    for follower_id in follower_ids:
+        backfill_follow(follower_id, author_id)
+
+    return follower_ids[-1] if len(follower_ids) == batch_size else None
+
+
+def prune_follow(follower_id, followed_id):
+    """Remove the messages of `followed_id` from `follower_id`'s timeline."""
+
+    (TimelineEntry
+     .query
+     .filter(TimelineEntry.user_id == follower_id,
+             TimelineEntry.author_id == followed_id)
+     .delete(synchronize_session=False))
+
+
+def trim_timelines(user_ids):
+    """Cut the timelines of `user_ids` back to TIMELINE_LENGTH entries.
+
+    `user_ids` may be a list or a query returning user ids.
+    """
+
+    (TimelineTrim
+     .query
+     .filter(TimelineTrim.user_id.in_(user_ids))
+     .update({TimelineTrim.pushed: 0}, synchronize_session=False))
+
+    position = (func
+                .row_number()
+                .over(partition_by=TimelineEntry.user_id,
+                      order_by=[TimelineEntry.timestamp.desc(),
+                                TimelineEntry.message_id.desc()])
+                .label('position'))
+
+    ranked = (db.session
+              .query(TimelineEntry.user_id, TimelineEntry.message_id, position)
+              .filter(TimelineEntry.user_id.in_(user_ids))
+              .subquery())
+
+    overflow = (db.session
+                .query(ranked.c.user_id, ranked.c.message_id)
+                .filter(ranked.c.position > TIMELINE_LENGTH))
+
+    (TimelineEntry
+     .query
+     .filter(tuple_(TimelineEntry.user_id, TimelineEntry.message_id).in_(overflow))
+     .delete(synchronize_session=False))
+
+
+def rebuild_timelines(user_ids=None, batch_size=500):
+    """Regenerate timelines from the messages and follows tables.
+
+    Rebuilds every user's timeline if `user_ids` isn't given, first
+    resetting who is a celebrity from the current CELEBRITY_FOLLOWERS, and
+    leaves out celebrities' messages. Commits after every `batch_size` users
+    and returns the number of timelines rebuilt.
+    """
+
+    if user_ids is None:
+        User.query.update({User.celebrity:
+                           User.followers_count >= celebrity_threshold()},
+                          synchronize_session=False)
+        user_ids = [user_id for (user_id,) in
+                    db.session.query(User.id).order_by(User.id)]
+
+    for count, user_id in enumerate(user_ids, start=1):
+        (TimelineEntry
+         .query
+         .filter(TimelineEntry.user_id == user_id)
+         .delete(synchronize_session=False))
+
+        recent = (db.session
+                  .query(literal(user_id),
+                         Message.id,
+                         Message.user_id,
+                         Message.timestamp)
+                  .join(Follows, Follows.user_being_followed_id == Message.user_id)
+                  .join(User, User.id == Message.user_id)
+                  .filter(Follows.user_following_id == user_id,
+                          ~User.celebrity)
+                  .order_by(Message.timestamp.desc(), Message.id.desc())
+                  .limit(TIMELINE_LENGTH))
+
+        _insert_entries(recent)
+
+        if count % batch_size == 0:
+            db.session.commit()
+
+    db.session.commit()
+    return len(user_ids)
+
+
+def _insert_entries(rows):
+    """INSERT ... SELECT the (user, message, author, timestamp) `rows` query."""
+
+    db.session.execute(TimelineEntry
+                       .__table__
+                       .insert()
+                       .from_select(TIMELINE_COLUMNS, rows.statement))
@@ -0,0 +1,338 @@
+"""Trending warbles and hashtags.
+
+Likes, per message, and the hashtags of new messages are counted in time
+buckets of BUCKET_SECONDS. The views call `record_like` and
+`record_hashtags` after committing; they count into per-process space-saving
+sketches, which keep at most SKETCH_SIZE keys however bursty the traffic.
+At most every FLUSH_SECONDS, on the next event or the next read of the
+rankings, the sketches' counts are added to `trending_counts` in one upsert,
+so a message liked thousands of times a second costs one row update per
+process per flush rather than one per like. Flushes go straight to the
+primary on their own connection, whatever the request was doing, and
+`init_trending` flushes whatever is left when the process exits.
+
+A key's score adds up its counts over the last WINDOW_BUCKETS buckets, each
+halved for every HALF_LIFE seconds of its age: recent activity counts most,
+and nothing older than the window counts at all. Scores are taken from the
+top BUCKET_TOP keys of each bucket -- the two newest, still filling, re-read
+every time, the others kept until they leave the window -- and the best are
+picked with a heap and cached for TRENDING_TTL seconds. Like the sketches,
+trimming each bucket only makes scores approximate far below the top.
+"""
+
+import atexit
+import heapq
+import logging
+import re
+import time
+from collections import defaultdict
+from threading import Lock
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import contains_eager
+
+from identity import TTLCache
+from models import db, Message, TrendingCount, User
+
+BUCKET_SECONDS = 300
+WINDOW_BUCKETS = 72
+HALF_LIFE = 3600
+
+SKETCH_SIZE = 1000
+FLUSH_SECONDS = 10
+
+BUCKET_TOP = 200
+TRENDING_TTL = 30
+TRENDING_SHOWN = 5
+
+MESSAGES = 'message'
+HASHTAGS = 'hashtag'
+
+# a '#' that doesn't start inside a word, then a word with a letter in it
+HASHTAG = re.compile(r'(?<![\w#&])#(\w*[^\W\d_]\w*)')
+MAX_HASHTAG_LENGTH = 100
+
+logger = logging.getLogger('warbler.trending')
+
+BUCKET_TOPS = text("""
+    SELECT bucket, key, count
+    FROM (
+        SELECT bucket, key, count,
+               row_number() OVER (PARTITION BY bucket
+                                  ORDER BY count DESC, key) AS rank
+        FROM trending_counts
+        WHERE kind = :kind AND bucket BETWEEN :first AND :last
+    ) AS ranked
+    WHERE rank <= :top
+""")
+
+
+def bucket_of(now):
+    return int(now // BUCKET_SECONDS)
+
+
+def extract_hashtags(text):
+    """The distinct hashtags in `text`, lowercased, in order of appearance."""
+
+    tags = []
+    for tag in HASHTAG.findall(text or ''):
+        tag = tag.lower()
+        if len(tag) <= MAX_HASHTAG_LENGTH and tag not in tags:
+            tags.append(tag)
+
+    return tags
+
+
+##############################################################################
+# Counting
+
+
+class SpaceSaving:
+    """The most frequent keys of a stream and their counts, in at most
+    `capacity` counters (Metwally et al.'s space-saving sketch).
+
+    A new key arriving when every counter is taken replaces the key with the
+    smallest count and carries on from that count, so a count is never too
+    low and never too high by more than the error recorded with it.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}
+        # (count, key) for every counter, plus stale entries of old counts
+        self.heap = []
+
+    def add(self, key, count=1):
+        counter = self.counters.get(key)
+        if counter is None:
+            smallest = self._evict() if len(self.counters) >= self.capacity else 0
+            counter = self.counters[key] = [smallest, smallest]
+
+        counter[0] += count
+        heapq.heappush(self.heap, (counter[0], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, key) for key, (count, _) in self.counters.items()]
+            heapq.heapify(self.heap)
+
+    def _evict(self):
+        # counts only grow, so an entry below its key's count is stale
+        while True:
+            count, key = heapq.heappop(self.heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                del self.counters[key]
+                return count
+
+    def items(self):
+        """(key, count, error) of every key counted."""
+
+        return [(key, count, error)
+                for key, (count, error) in self.counters.items()]
+
+    def __len__(self):
+        return len(self.counters)
+
+
+class TrendingRecorder:
+    """Counts this process has seen but not yet added to `trending_counts`."""
+
+    def __init__(self, sketch_size=SKETCH_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.sketch_size = sketch_size
+        self.flush_seconds = flush_seconds
+        self.sketches = {}
+        self.flushed_at = time.monotonic()
+        self.pruned_before = None
+        self.lock = Lock()
+
+    def add(self, kind, key, now=None):
+        bucket = bucket_of(time.time() if now is None else now)
+        with self.lock:
+            sketch = self.sketches.get((kind, bucket))
+            if sketch is None:
+                sketch = self.sketches[kind, bucket] = SpaceSaving(self.sketch_size)
+            sketch.add(str(key))
+
+    def flush(self, force=False):
+        """Add the pending counts to `trending_counts` and commit, if
+        FLUSH_SECONDS have passed since the last flush (or `force`).
+
+        Returns the number of rows written.
+        """
+
+        with self.lock:
+            if not force and time.monotonic() - self.flushed_at < self.flush_seconds:
+                return 0
+            sketches, self.sketches = self.sketches, {}
+            self.flushed_at = time.monotonic()
+
+        # only the part of each count the sketch can vouch for, so keys that
+        # took over a counter don't pile up counts that were never theirs;
+        # sorted so that concurrent flushes lock rows in the same order
+        rows = sorted((kind, bucket, key, count - error)
+                      for (kind, bucket), sketch in sketches.items()
+                      for key, count, error in sketch.items()
+                      if count > error)
+        if not rows:
+            return 0
+
+        # not through db.session, which may be on a replica or in the
+        # middle of the request's own work
+        try:
+            with db.engine.begin() as connection:
+                _add_counts(connection, rows)
+                self._prune(connection, max(bucket for _, bucket, _, _ in rows))
+        except SQLAlchemyError:
+            logger.exception("couldn't flush %s trending counts", len(rows))
+            return 0
+
+        return len(rows)
+
+    def _prune(self, connection, newest):
+        # once per bucket, drop the buckets that have left the window
+        before = newest - WINDOW_BUCKETS + 1
+        if self.pruned_before is None or before > self.pruned_before:
+            counts = TrendingCount.__table__
+            connection.execute(counts.delete().where(counts.c.bucket < before))
+            self.pruned_before = before
+
+    def clear(self):
+        with self.lock:
+            self.sketches = {}
+            self.pruned_before = None
+
+
+def _add_counts(connection, rows):
+    """Add the (kind, bucket, key, count) `rows` to `trending_counts`."""
+
+    table = TrendingCount.__table__
+
+    if connection.dialect.name == 'postgresql':
+        # one multi-row statement: executemany would be a round trip a row
+        counts = insert(table).values([
+            {'kind': kind, 'bucket': bucket, 'key': key, 'count': count}
+            for kind, bucket, key, count in rows])
+        connection.execute(counts.on_conflict_do_update(
+            index_elements=['kind', 'bucket', 'key'],
+            set_={'count': TrendingCount.count + counts.excluded['count']}))
+        return
+
+    # elsewhere a row at a time, adding to the row if there is one
+    for kind, bucket, key, count in rows:
+        added = connection.execute(
+            table
+            .update()
+            .where(table.c.kind == kind)
+            .where(table.c.bucket == bucket)
+            .where(table.c.key == key)
+            .values(count=table.c.count + count))
+        if not added.rowcount:
+            connection.execute(table.insert().values(
+                kind=kind, bucket=bucket, key=key, count=count))
+
+
+recorder = TrendingRecorder()
+
+
+def init_trending(app):
+    """Flush the counts `app`'s process hasn't written yet when it exits."""
+
+    def flush_at_exit():
+        with app.app_context():
+            recorder.flush(force=True)
+
+    atexit.register(flush_at_exit)
+
+
+def record_like(message_id, now=None):
+    """Count a committed like of `message_id`."""
+
+    recorder.add(MESSAGES, message_id, now)
+    recorder.flush()
+
+
+def record_hashtags(text, now=None):
+    """Count the hashtags of a committed message's `text`."""
+
+    for tag in extract_hashtags(text):
+        recorder.add(HASHTAGS, tag, now)
+    recorder.flush()
+
+
+##############################################################################
+# Reading
+
+
+# each bucket's top keys, and the rankings built from them
+bucket_tops = TTLCache(4 * WINDOW_BUCKETS, WINDOW_BUCKETS * BUCKET_SECONDS)
+rankings = TTLCache(64, TRENDING_TTL)
+
+
+def top_keys(kind, limit=TRENDING_SHOWN, now=None):
+    """The `limit` best scoring keys of `kind`, as (key, score) pairs."""
+
+    # a process that is read but sees no likes or messages still flushes
+    recorder.flush()
+
+    ranking = rankings.get((kind, limit))
+    if ranking is None:
+        ranking = _rank(kind, limit, time.time() if now is None else now)
+        rankings.set((kind, limit), ranking)
+
+    return ranking
+
+
+def _rank(kind, limit, now):
+    newest = bucket_of(now)
+    buckets = range(newest - WINDOW_BUCKETS + 1, newest + 1)
+
+    tops = {bucket: bucket_tops.get((kind, bucket)) for bucket in buckets[:-2]}
+    missing = [bucket for bucket, top in tops.items() if top is None]
+    first = min(missing + [buckets[-2]])
+
+    read = {bucket: [] for bucket in range(first, newest + 1)}
+    for bucket, key, count in db.session.execute(
+            BUCKET_TOPS, {'kind': kind, 'first': first, 'last': newest,
+                          'top': BUCKET_TOP}):
+        read[bucket].append((key, count))
+
+    for bucket, top in read.items():
+        if bucket in tops:
+            bucket_tops.set((kind, bucket), top)
+        tops[bucket] = top
+
+    scores = defaultdict(float)
+    for bucket, top in tops.items():
+        age = max(now - (bucket + 1) * BUCKET_SECONDS, 0)
+        weight = 0.5 ** (age / HALF_LIFE)
+        for key, count in top:
+            scores[key] += count * weight
+
+    return heapq.nsmallest(limit, scores.items(),
+                           key=lambda item: (-item[1], item[0]))
+
+
+def trending_messages(limit=TRENDING_SHOWN):
+    """The most liked messages of late, authors included, best first."""
+
+    # a few spare in case some have been deleted
+    ids = [int(key) for key, _ in top_keys(MESSAGES, 2 * limit)]
+    if not ids:
+        return []
+
+    messages = {message.id: message for message in
+                Message
+                .query
+                .join(User, User.id == Message.user_id)
+                .options(contains_eager(Message.user))
+                .filter(Message.id.in_(ids), User.deleted_at.is_(None))}
+
+    return [messages[message_id] for message_id in ids
+            if message_id in messages][:limit]
+
+
+def trending_hashtags(limit=TRENDING_SHOWN):
+    """The most used hashtags of late, best first."""
+
+    return [tag for tag, _ in top_keys(HASHTAGS, limit)]